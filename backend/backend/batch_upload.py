@@ -0,0 +1,248 @@
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .encryption import StreamEncryptor, SEGMENT_SIZE, FORMAT_VERSION_GCM_STREAM, KEY_SIZE
+from .metadata_utils import MetadataExtractor
+
+logger = logging.getLogger(__name__)
+
+# Defaults for settings.BATCH_UPLOAD
+DEFAULT_BATCH_SETTINGS = {
+    'WORKERS': min(4, os.cpu_count() or 1),
+    'MAX_FILES': 500,
+    'MAX_TOTAL_SIZE': 4 * 1024 * 1024 * 1024,  # plaintext bytes, ZIP members included
+}
+
+
+def batch_settings():
+    return {**DEFAULT_BATCH_SETTINGS, **getattr(settings, 'BATCH_UPLOAD', {})}
+
+
+def _process_file(source_path, destination_path, key):
+    """
+    Pool worker: check that the file is an image, probe its headers,
+    extract its metadata and encrypt it into ``destination_path``. Runs in a child process, so it
+    only touches files, never the database.
+    """
+    with open(source_path, 'rb') as f:
+        mime_type = MetadataExtractor.sniff_mime_type(f.read(16))
+        if not mime_type.startswith('image/'):
+            raise ValueError("Not a supported image file")
+        f.seek(0)
+        # Headers only; refuses decompression bombs before anything is decoded
+        probe = MetadataExtractor.probe_image(f)
+        encryptor = StreamEncryptor(f, key, size=os.path.getsize(source_path))
+        with open(destination_path, 'wb') as out:
+            shutil.copyfileobj(encryptor, out, SEGMENT_SIZE)
+
+    try:
+        metadata = MetadataExtractor.extract_metadata(source_path)
+        metadata_enabled = True
+    except Exception as e:
+        print(f"Metadata extraction failed: {str(e)}")
+        metadata, metadata_enabled = {}, False
+
+    return {
+        'mime_type': mime_type,
+        'content_hash': encryptor.content_hash,
+        'file_size': os.path.getsize(destination_path),
+        'metadata': metadata,
+        'metadata_enabled': metadata_enabled,
+        'probe': probe,
+    }
+
+
+class BatchUpload:
+    """
+    Upload of many images in one request, as separate files and/or a ZIP.
+    Sniffing, metadata extraction and encryption run on a bounded process
+    pool; the UserImage rows are then created with one bulk INSERT. Files
+    the user already has are deduplicated against the stored copy. Results
+    are reported per file, so one bad file doesn't fail the batch.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.config = batch_settings()
+        self.workdir = tempfile.mkdtemp(prefix='batch-upload-')
+        self.items = []     # (filename, plaintext path)
+        self.results = []   # one dict per file, in input order
+        self.total_size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    # === Collecting files ===
+
+    def _check_limits(self, size):
+        if len(self.items) >= self.config['MAX_FILES']:
+            raise ValueError(f"A batch can contain at most {self.config['MAX_FILES']} files")
+        if self.total_size + size > self.config['MAX_TOTAL_SIZE']:
+            raise ValueError(f"A batch can contain at most {self.config['MAX_TOTAL_SIZE']} bytes")
+        self.total_size += size
+
+    def add_file(self, uploaded_file):
+        self._check_limits(uploaded_file.size)
+        if hasattr(uploaded_file, 'temporary_file_path'):
+            # Already spooled to disk by Django
+            path = uploaded_file.temporary_file_path()
+        else:
+            path = os.path.join(self.workdir, f"{len(self.items)}{Path(uploaded_file.name).suffix[:10]}")
+            with open(path, 'wb') as f:
+                for chunk in uploaded_file.chunks():
+                    f.write(chunk)
+        self.items.append((os.path.basename(uploaded_file.name), path))
+
+    def add_archive(self, archive):
+        """Add the files of a ZIP archive, skipping directories and hidden files"""
+        try:
+            with zipfile.ZipFile(archive) as zf:
+                for info in zf.infolist():
+                    name = os.path.basename(info.filename)
+                    if info.is_dir() or not name or name.startswith('.') or info.filename.startswith('__MACOSX/'):
+                        continue
+                    # Declared sizes are checked up front and enforced while extracting
+                    self._check_limits(info.file_size)
+                    path = os.path.join(self.workdir, f"{len(self.items)}{Path(name).suffix[:10]}")
+                    with zf.open(info) as src, open(path, 'wb') as dst:
+                        copied = 0
+                        while chunk := src.read(SEGMENT_SIZE):
+                            copied += len(chunk)
+                            if copied > info.file_size:
+                                raise ValueError(f"ZIP member '{info.filename}' is larger than declared")
+                            dst.write(chunk)
+                    self.items.append((name, path))
+        except zipfile.BadZipFile:
+            raise ValueError("The archive is not a valid ZIP file")
+
+    # === Processing ===
+
+    @staticmethod
+    def _reserve_name(filename):
+        """Claim a free storage name for the encrypted file by creating it empty"""
+        while True:
+            name = default_storage.get_available_name(f"uploads/{Path(filename).stem or 'upload'}.enc")
+            path = default_storage.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                open(path, 'xb').close()
+                return name, path
+            except FileExistsError:
+                continue
+
+    def process(self):
+        """Encrypt every collected file and create the images; returns the per-file results"""
+        from .models import UserImage, ImageMetadataIndex
+        from .jobs import enqueue_many
+
+        work = []
+        for filename, source_path in self.items:
+            name, destination_path = self._reserve_name(filename)
+            work.append((filename, source_path, name, destination_path, os.urandom(KEY_SIZE)))
+
+        workers = max(1, min(self.config['WORKERS'], len(work)))
+        outcomes = []
+        if workers == 1:
+            for _, source_path, _, destination_path, key in work:
+                try:
+                    outcomes.append(_process_file(source_path, destination_path, key))
+                except Exception as e:
+                    outcomes.append(e)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_process_file, source_path, destination_path, key)
+                           for _, source_path, _, destination_path, key in work]
+                for future in futures:
+                    try:
+                        outcomes.append(future.result())
+                    except Exception as e:
+                        outcomes.append(e)
+
+        rows = []
+        for (filename, _, name, destination_path, key), outcome in zip(work, outcomes):
+            if isinstance(outcome, Exception):
+                logger.warning(f"Batch upload of '{filename}' failed: {outcome}")
+                default_storage.delete(name)
+                self.results.append({'filename': filename, 'status': 'error', 'error': str(outcome)})
+                continue
+            rows.append(UserImage(
+                user=self.user,
+                image=name,
+                image_name=Path(name).stem,
+                file_size=outcome['file_size'],
+                file_type=MetadataExtractor.file_type_for_mime(
+                    outcome['mime_type'], Path(filename).suffix.lstrip('.').lower()[:10] or 'unknown'),
+                mime_type=outcome['mime_type'],
+                content_hash=outcome['content_hash'],
+                metadata=outcome['metadata'],
+                metadata_enabled=outcome['metadata_enabled'],
+                encryption_key=key.hex(),
+                **outcome['probe'],
+                encryption_params={
+                    'algorithm': 'AES-GCM-STREAM',
+                    'version': FORMAT_VERSION_GCM_STREAM,
+                    'segment_size': SEGMENT_SIZE,
+                    'key_length': len(key) * 8,
+                },
+            ))
+            self.results.append({'filename': filename, 'status': 'created', 'image': rows[-1]})
+
+        duplicated = []
+        try:
+            with transaction.atomic():
+                # Files the user already has share the stored copy instead, and
+                # identical files within the batch share the first one's
+                groups = {}
+                for result in self.results:
+                    if result['status'] == 'created':
+                        groups.setdefault(result['image'].content_hash, []).append(result)
+                for content_hash, group in groups.items():
+                    existing = UserImage.find_duplicate(self.user, content_hash)
+                    if existing is None:
+                        first, group = group[0]['image'], group[1:]
+                    for result in group:
+                        image = result['image']
+                        duplicated.append(image.image.name)
+                        if existing is not None:
+                            rows.remove(image)
+                            result['image'] = existing.duplicate(image_name=Path(result['filename']).stem)
+                        else:
+                            image.image = first.image.name
+                            image.encryption_key = first.encryption_key
+                            image.encryption_params = first.encryption_params
+                        result['deduplicated'] = True
+
+                # bulk_create skips save(), so thumbnails are queued here
+                created = UserImage.objects.bulk_create(rows)
+                ImageMetadataIndex.sync_many(created)
+                jobs = enqueue_many('generate_derivatives', [{'image_id': image.pk} for image in created],
+                                    user=self.user)
+        except Exception:
+            for image in rows:
+                default_storage.delete(image.image.name)
+            for name in duplicated:
+                default_storage.delete(name)
+            raise
+
+        for name in duplicated:
+            default_storage.delete(name)
+        job_for = {job.payload['image_id']: job for job in jobs}
+        for result in self.results:
+            if result['status'] == 'created':
+                image = result['image']
+                job = job_for.get(image.pk) or getattr(image, 'upload_job', None)
+                if job is not None:
+                    result['job'] = job
+        return self.results
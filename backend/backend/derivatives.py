@@ -0,0 +1,267 @@
+import io
+import os
+import hashlib
+import logging
+import threading
+
+from PIL import Image, ImageOps, features
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Widths of the encrypted derivative pyramid generated for every upload
+DERIVATIVE_WIDTHS = (256, 512, 1024)
+DERIVATIVE_FORMAT = 'webp'
+DERIVATIVE_CONTENT_TYPE = 'image/webp'
+DERIVATIVE_QUALITY = 80
+
+
+class DerivativeGenerator:
+    """
+    Builds the downscaled WebP pyramid for an image and stores each level
+    as an ImageDerivative, encrypted with the parent image's key.
+    """
+
+    @staticmethod
+    def render(source, widths=DERIVATIVE_WIDTHS):
+        """
+        Render WebP derivatives from ``source`` (a path or file object).
+        Returns a list of (width, pixel_width, pixel_height, data), one per
+        width; widths at or beyond the original collapse into a single
+        original-size level.
+        """
+        with Image.open(source) as img:
+            # Let the JPEG decoder downscale by 1/2..1/8 while decoding
+            largest = max(widths)
+            img.draft('RGB', (largest, largest))
+            img = ImageOps.exif_transpose(img)
+            has_alpha = img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+            img = img.convert('RGBA' if has_alpha else 'RGB')
+
+            levels = []
+            current = img
+            for width in sorted(widths, reverse=True):
+                if current.width > width:
+                    # Each level is downscaled from the one above it
+                    height = max(1, round(current.height * width / current.width))
+                    current = current.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+                levels.append((width, current))
+
+            rendered = []
+            for width, level in reversed(levels):
+                if rendered and rendered[-1][1] == level.width:
+                    # Original is narrower than this width, one level is enough
+                    continue
+                buffer = io.BytesIO()
+                level.save(buffer, DERIVATIVE_FORMAT.upper(), quality=DERIVATIVE_QUALITY, method=4)
+                rendered.append((width, level.width, level.height, buffer.getvalue()))
+            return rendered
+
+    @staticmethod
+    def generate(user_image, source=None):
+        """
+        (Re)generate the derivatives of ``user_image``. ``source`` is the
+        plaintext original (path or file object); when omitted the stored
+        original is decrypted. Returns the new ImageDerivative rows.
+        """
+        from .models import ImageDerivative
+        from .encryption import StreamEncryptor
+
+        if not user_image.encryption_key:
+            logger.info(f"Image {user_image.pk} is not encrypted, skipping derivatives")
+            return []
+        if source is None:
+            source = io.BytesIO(user_image.get_decrypted_bytes())
+
+        key = bytes.fromhex(user_image.encryption_key)
+        derivatives = []
+        for width, pixel_width, pixel_height, data in DerivativeGenerator.render(source):
+            derivative = ImageDerivative(
+                user_image=user_image,
+                width=width,
+                pixel_width=pixel_width,
+                pixel_height=pixel_height,
+                format=DERIVATIVE_FORMAT,
+                content_hash=hashlib.sha256(data).hexdigest(),
+                file_size=len(data),
+            )
+            name = f"{user_image.pk}_{width}.enc"
+            encryptor = StreamEncryptor(io.BytesIO(data), key, size=len(data))
+            derivative.file.save(name, File(encryptor, name=name), save=False)
+            derivatives.append(derivative)
+
+        with transaction.atomic():
+            old = list(user_image.derivatives.all())
+            for derivative in old:
+                derivative.delete()  # file removed by the post_delete signal
+            ImageDerivative.objects.bulk_create(derivatives)
+        return derivatives
+
+
+# === On-the-fly renders ===
+
+RENDER_MIN_WIDTH = 16
+RENDER_MAX_WIDTH = 4096
+RENDER_DEFAULT_QUALITY = 80
+RENDER_FORMATS = {
+    'webp': 'image/webp',
+    'avif': 'image/avif',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+}
+
+
+class ImageRenderer:
+    """
+    Resized, re-encoded renders of an image for arbitrary display widths.
+    The original is decoded at reduced resolution whenever the requested
+    width allows it, so a 600px preview never needs a full-size decode.
+    """
+
+    @staticmethod
+    def parse_params(query):
+        """
+        Validate ``w``, ``fmt`` and ``q`` query parameters.
+        Returns (width, fmt, quality) or raises ValueError.
+        """
+        try:
+            width = int(query.get('w', 1024))
+            quality = int(query.get('q', RENDER_DEFAULT_QUALITY))
+        except (TypeError, ValueError):
+            raise ValueError("w and q must be integers")
+        fmt = query.get('fmt', 'webp').lower()
+        if fmt == 'jpg':
+            fmt = 'jpeg'
+        if fmt not in RENDER_FORMATS:
+            raise ValueError(f"Unsupported format '{fmt}'; use one of {', '.join(RENDER_FORMATS)}")
+        if fmt == 'avif' and not features.check('avif'):
+            raise ValueError("AVIF encoding is not available on this server")
+        if not 1 <= quality <= 100:
+            raise ValueError("q must be between 1 and 100")
+        width = min(max(width, RENDER_MIN_WIDTH), RENDER_MAX_WIDTH)
+        return width, fmt, quality
+
+    @staticmethod
+    def render(user_image, width, fmt, quality):
+        """Return the encoded bytes of ``user_image`` scaled down to at most ``width`` pixels wide"""
+        import cv2
+
+        img = user_image.get_decrypted_image(min_width=width)
+        if img.shape[1] > width:
+            height = max(1, round(img.shape[0] * width / img.shape[1]))
+            img = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+
+        if fmt == 'avif':
+            buffer = io.BytesIO()
+            Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB)).save(buffer, 'AVIF', quality=quality)
+            return buffer.getvalue()
+
+        params = {
+            'webp': [cv2.IMWRITE_WEBP_QUALITY, quality],
+            'jpeg': [cv2.IMWRITE_JPEG_QUALITY, quality, cv2.IMWRITE_JPEG_OPTIMIZE, 1],
+            'png': [cv2.IMWRITE_PNG_COMPRESSION, 6],
+        }[fmt]
+        success, encoded = cv2.imencode(f'.{fmt}', img, params)
+        if not success:
+            raise ValueError(f"Failed to encode {fmt}")
+        return encoded.tobytes()
+
+
+class RenderCache:
+    """
+    Disk cache of renders with a total byte budget and LRU eviction (by
+    mtime, refreshed on every hit). Each entry is stored in the AES-GCM
+    container under its image's own key, so renders of a deleted image
+    cannot be read back.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None  # bytes on disk, counted on first use
+        self._lock = threading.Lock()
+        media_root = os.path.realpath(settings.MEDIA_ROOT)
+        if os.path.commonpath([media_root, os.path.realpath(directory)]) == media_root:
+            raise ValueError("The render cache directory must be outside MEDIA_ROOT")
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+    def _path(self, user_image, *params):
+        name = ':'.join(str(p) for p in (user_image.pk, user_image.content_hash, *params))
+        return os.path.join(self.directory, hashlib.sha256(name.encode()).hexdigest())
+
+    def get(self, user_image, *params):
+        from .encryption import decrypt_file_buffer
+        path = self._path(user_image, *params)
+        try:
+            data = decrypt_file_buffer(path, bytes.fromhex(user_image.encryption_key))
+            os.utime(path)  # mark as recently used
+            return data
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Dropping unreadable render {path}: {e}")
+            self._discard(path)
+            return None
+
+    def put(self, user_image, data, *params):
+        from .encryption import encrypt_stream
+        path = self._path(user_image, *params)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                written = encrypt_stream(io.BytesIO(data), f, bytes.fromhex(user_image.encryption_key))
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write render {path}: {e}")
+            self._discard(temp_path)
+            return
+        with self._lock:
+            if self._size is None:
+                self._size = self._disk_usage()
+            else:
+                self._size += written
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _disk_usage(self):
+        with os.scandir(self.directory) as entries:
+            return sum(e.stat().st_size for e in entries if e.is_file() and not e.name.endswith('.tmp'))
+
+    def _evict(self):
+        """Remove least recently used renders until usage is under 90% of the budget (lock held)"""
+        with os.scandir(self.directory) as entries:
+            files = sorted(
+                (e.stat().st_mtime, e.stat().st_size, e.path)
+                for e in entries if e.is_file() and not e.name.endswith('.tmp')
+            )
+        total = sum(size for _, size, _ in files)
+        target = self.max_bytes * 0.9
+        for _, size, path in files:
+            if total <= target:
+                break
+            self._discard(path)
+            total -= size
+        self._size = total
+
+    @staticmethod
+    def _discard(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+_render_cache = None
+_render_cache_lock = threading.Lock()
+
+def get_render_cache():
+    """Process-wide RenderCache configured from settings.RENDER_CACHE"""
+    global _render_cache
+    if _render_cache is None:
+        with _render_cache_lock:
+            if _render_cache is None:
+                config = settings.RENDER_CACHE
+                _render_cache = RenderCache(config['DIR'], config['MAX_BYTES'])
+    return _render_cache
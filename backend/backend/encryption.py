@@ -1,7 +1,13 @@
+import hashlib
+import io
 import os
+import struct
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.backends import default_backend
 
 
@@ -9,6 +15,21 @@ from cryptography.hazmat.backends import default_backend
 KEY_SIZE = 32  # 256-bit
 BLOCK_SIZE = 16  # AES block size
 
+# === Container Config ===
+# Encrypted originals are stored as a small header followed by fixed-size
+# AES-GCM segments. Files written before the container existed are a bare
+# IV + AES-CBC ciphertext and are recognised by the missing magic.
+MAGIC = b'AGPH'
+FORMAT_VERSION_CBC = 1  # legacy, headerless
+FORMAT_VERSION_GCM_STREAM = 2
+SEGMENT_SIZE = 1024 * 1024  # plaintext bytes per segment
+NONCE_PREFIX_SIZE = 7
+TAG_SIZE = 16
+HEADER_FORMAT = '>4sBI7s'  # magic, version, segment size, nonce prefix
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+DECRYPT_WORKERS = os.cpu_count() or 1
+HASH_BLOCK_SIZE = 1024 * 1024  # plaintext bytes per content-hash block
+
 # === Helper Functions ===
 def pad(data):
     pad_len = BLOCK_SIZE - (len(data) % BLOCK_SIZE)
@@ -34,6 +55,458 @@ def decrypt_aes_cbc(encrypted_data, key):
     padded_plaintext = decryptor.update(ciphertext) + decryptor.finalize()
     return unpad(padded_plaintext)
 
+# === Streaming AES-GCM Container ===
+def _pack_header(segment_size, nonce_prefix):
+    return struct.pack(HEADER_FORMAT, MAGIC, FORMAT_VERSION_GCM_STREAM, segment_size, nonce_prefix)
+
+def _segment_nonce(nonce_prefix, index, last):
+    # STREAM construction: prefix || counter || last-segment flag, so segments
+    # cannot be reordered, dropped or truncated without failing authentication
+    return nonce_prefix + struct.pack('>IB', index, 1 if last else 0)
+
+def _read_full(source, size):
+    """Read exactly ``size`` bytes unless the source is exhausted first"""
+    chunk = source.read(size)
+    if not chunk or len(chunk) == size:
+        return chunk or b''
+    parts = [chunk]
+    remaining = size - len(chunk)
+    while remaining:
+        chunk = source.read(remaining)
+        if not chunk:
+            break
+        parts.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(parts)
+
+def encrypted_size(plaintext_size, segment_size=SEGMENT_SIZE):
+    """Size of the container produced for ``plaintext_size`` bytes of input"""
+    segments = max(1, -(-plaintext_size // segment_size))
+    return HEADER_SIZE + plaintext_size + segments * TAG_SIZE
+
+def read_header(header):
+    """
+    Parse the first HEADER_SIZE bytes of an encrypted file.
+    Returns (version, segment_size, nonce_prefix); legacy CBC files
+    return (FORMAT_VERSION_CBC, None, None).
+    """
+    if len(header) == HEADER_SIZE and header[:len(MAGIC)] == MAGIC:
+        magic, version, segment_size, nonce_prefix = struct.unpack(HEADER_FORMAT, header)
+        if version != FORMAT_VERSION_GCM_STREAM:
+            raise ValueError(f"Unsupported encrypted file version: {version}")
+        return version, segment_size, nonce_prefix
+    return FORMAT_VERSION_CBC, None, None
+
+def new_header(segment_size=SEGMENT_SIZE):
+    """Header for a new container, with a fresh random nonce prefix"""
+    return _pack_header(segment_size, os.urandom(NONCE_PREFIX_SIZE))
+
+def seal_segment(aesgcm, header, index, chunk, last):
+    """
+    Encrypt plaintext segment ``index`` of the container described by
+    ``header``. Every segment but the last must be exactly segment_size bytes.
+    """
+    nonce_prefix = read_header(header)[2]
+    return aesgcm.encrypt(_segment_nonce(nonce_prefix, index, last), chunk, header)
+
+class ContentHasher:
+    """
+    Block-based content hash of a plaintext: SHA-256 over the SHA-256 digests
+    of consecutive HASH_BLOCK_SIZE blocks. Data can be fed in pieces of any
+    size, and the state (block digests + partial block) can be saved and
+    restored, so the hash can be built across separate upload requests.
+    """
+    def __init__(self, block_digests=None, partial=b''):
+        self.block_digests = list(block_digests or [])
+        self._partial = bytearray(partial)
+
+    def update(self, data):
+        self._partial += data
+        while len(self._partial) >= HASH_BLOCK_SIZE:
+            self.block_digests.append(hashlib.sha256(self._partial[:HASH_BLOCK_SIZE]).digest())
+            del self._partial[:HASH_BLOCK_SIZE]
+
+    @property
+    def partial(self):
+        return bytes(self._partial)
+
+    def hexdigest(self):
+        digests = self.block_digests
+        if self._partial or not digests:
+            digests = digests + [hashlib.sha256(self._partial).digest()]
+        return hashlib.sha256(b''.join(digests)).hexdigest()
+
+    @classmethod
+    def hash_bytes(cls, data):
+        hasher = cls()
+        view = memoryview(data)
+        for offset in range(0, len(view), HASH_BLOCK_SIZE):
+            hasher.update(view[offset:offset + HASH_BLOCK_SIZE])
+        return hasher.hexdigest()
+
+def iter_encrypt_stream(source, key, segment_size=SEGMENT_SIZE, hasher=None):
+    """
+    Encrypt a readable file object into the segmented container.
+    Yields the header and then one sealed segment at a time, so at most
+    two plaintext segments are held in memory. The plaintext is fed to
+    ``hasher`` (a ContentHasher) when one is given.
+    """
+    aesgcm = AESGCM(key)
+    header = new_header(segment_size)
+    yield header
+
+    index = 0
+    chunk = _read_full(source, segment_size)
+    while True:
+        # Look one segment ahead so the final segment can be flagged
+        following = _read_full(source, segment_size) if len(chunk) == segment_size else b''
+        last = not following
+        if hasher is not None:
+            hasher.update(chunk)
+        yield seal_segment(aesgcm, header, index, chunk, last)
+        if last:
+            break
+        chunk = following
+        index += 1
+
+class StreamEncryptor:
+    """
+    File-like wrapper that reads plaintext from ``source`` and returns the
+    encrypted container from read(). Can be handed to Django storage via
+    django.core.files.File so the ciphertext is written as it is produced.
+    ``content_hash`` is available once everything has been read.
+    """
+    def __init__(self, source, key, size=None, segment_size=SEGMENT_SIZE):
+        self.hasher = ContentHasher()
+        self._segments = iter_encrypt_stream(source, key, segment_size, self.hasher)
+        self._buffer = bytearray()
+        self.size = encrypted_size(size, segment_size) if size is not None else None
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            segment = next(self._segments, None)
+            if segment is None:
+                break
+            self._buffer += segment
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def close(self):
+        self._segments.close()
+
+    @property
+    def content_hash(self):
+        return self.hasher.hexdigest()
+
+def encrypt_stream(source, destination, key, segment_size=SEGMENT_SIZE):
+    """Encrypt ``source`` into ``destination``; returns the bytes written"""
+    written = 0
+    for block in iter_encrypt_stream(source, key, segment_size):
+        destination.write(block)
+        written += len(block)
+    return written
+
+_decrypt_pool = None
+
+def _get_decrypt_pool():
+    global _decrypt_pool
+    if _decrypt_pool is None:
+        _decrypt_pool = ThreadPoolExecutor(max_workers=DECRYPT_WORKERS, thread_name_prefix='decrypt')
+    return _decrypt_pool
+
+def _iter_sealed_segments(source, segment_size):
+    """Yield (index, sealed_segment, last) for each segment in the file"""
+    sealed_size = segment_size + TAG_SIZE
+    index = 0
+    sealed = _read_full(source, sealed_size)
+    if len(sealed) < TAG_SIZE:
+        raise ValueError("Encrypted file is truncated")
+    while True:
+        following = _read_full(source, sealed_size) if len(sealed) == sealed_size else b''
+        last = not following
+        yield index, sealed, last
+        if last:
+            break
+        if len(following) < TAG_SIZE:
+            raise ValueError("Encrypted file is truncated")
+        sealed = following
+        index += 1
+
+def _iter_decrypt_cbc(source, key, iv):
+    decryptor = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend()).decryptor()
+    pending = b''
+    while True:
+        chunk = source.read(SEGMENT_SIZE)
+        if not chunk:
+            break
+        plain = decryptor.update(chunk)
+        # Hold back the final block until the end so padding can be stripped
+        if pending:
+            yield pending
+        pending = plain
+    pending += decryptor.finalize()
+    if pending:
+        yield unpad(pending)
+
+def iter_decrypt_stream(source, key, workers=None):
+    """
+    Decrypt an encrypted file object and yield plaintext chunks in order.
+    Multi-segment containers are decrypted on a thread pool with a bounded
+    number of segments in flight; legacy AES-CBC files are streamed too.
+    """
+    header = _read_full(source, HEADER_SIZE)
+    version, segment_size, nonce_prefix = read_header(header)
+    if version == FORMAT_VERSION_CBC:
+        # The 16 bytes already read are the CBC IV
+        yield from _iter_decrypt_cbc(source, key, header)
+        return
+
+    aesgcm = AESGCM(key)
+
+    def open_segment(index, sealed, last):
+        return aesgcm.decrypt(_segment_nonce(nonce_prefix, index, last), sealed, header)
+
+    yield from _decrypt_in_order(open_segment, _iter_sealed_segments(source, segment_size), workers)
+
+def _decrypt_in_order(open_segment, segments, workers=None):
+    """Run open_segment over (index, sealed, last) tuples, yielding results in order"""
+    first = next(segments, None)
+    if first is None:
+        return
+    second = next(segments, None)
+    if second is None:
+        # Single segment, not worth a round trip through the pool
+        yield open_segment(*first)
+        return
+
+    pool = _get_decrypt_pool()
+    window = 2 * (workers or DECRYPT_WORKERS)
+    in_flight = deque([pool.submit(open_segment, *first), pool.submit(open_segment, *second)])
+    for segment in segments:
+        in_flight.append(pool.submit(open_segment, *segment))
+        if len(in_flight) >= window:
+            yield in_flight.popleft().result()
+    while in_flight:
+        yield in_flight.popleft().result()
+
+class SegmentIndex:
+    """
+    Maps plaintext byte offsets of an AES-GCM container to the sealed
+    segments that hold them. Segments have a fixed size, so the index is
+    derived from the header and the file size without reading the body.
+    """
+    def __init__(self, header, file_size):
+        version, segment_size, nonce_prefix = read_header(header)
+        if version != FORMAT_VERSION_GCM_STREAM:
+            raise ValueError("Legacy AES-CBC files are not seekable")
+        self.header = header
+        self.segment_size = segment_size
+        self.nonce_prefix = nonce_prefix
+        self.sealed_size = segment_size + TAG_SIZE
+
+        body_size = file_size - HEADER_SIZE
+        self.segment_count = max(1, -(-body_size // self.sealed_size))
+        self.plaintext_size = body_size - self.segment_count * TAG_SIZE
+        if self.plaintext_size < 0:
+            raise ValueError("Encrypted file is truncated")
+
+    @classmethod
+    def from_file(cls, fileobj):
+        """Build the index for an open container; returns None for legacy AES-CBC files"""
+        fileobj.seek(0)
+        header = _read_full(fileobj, HEADER_SIZE)
+        if read_header(header)[0] != FORMAT_VERSION_GCM_STREAM:
+            return None
+        file_size = fileobj.seek(0, os.SEEK_END)
+        return cls(header, file_size)
+
+    def segment_offset(self, index):
+        return HEADER_SIZE + index * self.sealed_size
+
+    def segments_for_range(self, start, end):
+        """Segment numbers covering the inclusive plaintext range start..end"""
+        return range(start // self.segment_size, end // self.segment_size + 1)
+
+def iter_decrypt_range(fileobj, key, start, end, index=None, workers=None):
+    """
+    Decrypt only the segments covering the inclusive plaintext range
+    start..end of a seekable container and yield the requested bytes.
+    """
+    index = index or SegmentIndex.from_file(fileobj)
+    if index is None:
+        raise ValueError("Legacy AES-CBC files are not seekable")
+    if start < 0 or end >= index.plaintext_size or start > end:
+        raise ValueError(f"Range {start}-{end} is outside the plaintext size {index.plaintext_size}")
+
+    aesgcm = AESGCM(key)
+    last_index = index.segment_count - 1
+
+    def read_sealed():
+        for number in index.segments_for_range(start, end):
+            fileobj.seek(index.segment_offset(number))
+            yield number, _read_full(fileobj, index.sealed_size), number == last_index
+
+    def open_segment(number, sealed, last):
+        plain = aesgcm.decrypt(_segment_nonce(index.nonce_prefix, number, last), sealed, index.header)
+        # Trim the first and last segments to the requested window
+        segment_start = number * index.segment_size
+        lo = max(start - segment_start, 0)
+        hi = min(end - segment_start + 1, len(plain))
+        return plain[lo:hi] if lo or hi < len(plain) else plain
+
+    yield from _decrypt_in_order(open_segment, read_sealed(), workers)
+
+class DecryptedReader(io.RawIOBase):
+    """
+    Seekable read-only file object over the plaintext of an AES-GCM
+    container. Segments are decrypted on demand and the last one is kept,
+    so a parser that only reads headers decrypts only the first segment.
+    Wrap it in io.BufferedReader for read(n) calls that return n bytes.
+    """
+    def __init__(self, fileobj, key, index=None):
+        self._file = fileobj
+        self._index = index or SegmentIndex.from_file(fileobj)
+        if self._index is None:
+            raise ValueError("Legacy AES-CBC files are not seekable")
+        self._aesgcm = AESGCM(key)
+        self._position = 0
+        self._segment = (None, b'')
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: self._index.plaintext_size}[whence]
+        if base + offset < 0:
+            raise ValueError("Negative seek position")
+        self._position = base + offset
+        return self._position
+
+    def _open_segment(self, number):
+        if self._segment[0] != number:
+            index = self._index
+            self._file.seek(index.segment_offset(number))
+            sealed = _read_full(self._file, index.sealed_size)
+            last = number == index.segment_count - 1
+            nonce = _segment_nonce(index.nonce_prefix, number, last)
+            self._segment = (number, self._aesgcm.decrypt(nonce, sealed, index.header))
+        return self._segment[1]
+
+    def readinto(self, buffer):
+        if self._position >= self._index.plaintext_size:
+            return 0
+        number, offset = divmod(self._position, self._index.segment_size)
+        plain = self._open_segment(number)
+        count = min(len(buffer), len(plain) - offset)
+        buffer[:count] = plain[offset:offset + count]
+        self._position += count
+        return count
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+def decrypt_stream(source, destination, key, workers=None):
+    """Decrypt ``source`` into ``destination``; returns the bytes written"""
+    written = 0
+    for chunk in iter_decrypt_stream(source, key, workers):
+        destination.write(chunk)
+        written += len(chunk)
+    return written
+
+def decrypt_file(path, key):
+    """Decrypt an encrypted image file of either format and return its bytes"""
+    with open(path, 'rb') as f:
+        return b''.join(iter_decrypt_stream(f, key))
+
+def decrypt_file_buffer(path, key, workers=None):
+    """
+    Decrypt an encrypted image file of either format into a single
+    preallocated buffer and return a memoryview of the plaintext.
+    Segments of the AES-GCM container are decrypted on the decrypt pool,
+    each with update_into straight into its own slice of the buffer, while
+    this thread reads the next ones; at most ``workers`` + 1 ciphertext
+    segments are held at a time, so peak memory is about the plaintext
+    size plus that many segments. The view can be handed to np.frombuffer.
+    """
+    with open(path, 'rb') as f:
+        index = SegmentIndex.from_file(f)
+        if index is None:
+            return _decrypt_cbc_into(f, key)
+
+        # update_into may require up to a block of slack past the output
+        out = bytearray(index.plaintext_size + BLOCK_SIZE - 1)
+        view = memoryview(out)
+        f.seek(HEADER_SIZE)
+        if index.segment_count == 1:
+            # Single segment, not worth a round trip through the pool
+            sealed = bytearray(index.sealed_size)
+            _open_segment_into(key, index, 0, sealed, f.readinto(sealed), view)
+            return view[:index.plaintext_size]
+
+        pool = _get_decrypt_pool()
+        window = (workers or DECRYPT_WORKERS) + 1
+        free = []
+        in_flight = deque()
+        for number in range(index.segment_count):
+            if len(in_flight) >= window:
+                free.append(in_flight.popleft().result())
+            sealed = free.pop() if free else bytearray(index.sealed_size)
+            size = f.readinto(sealed)
+            in_flight.append(pool.submit(_open_segment_into, key, index, number, sealed, size,
+                                         view[number * index.segment_size:]))
+        while in_flight:
+            in_flight.popleft().result()
+        return view[:index.plaintext_size]
+
+def _open_segment_into(key, index, number, sealed, size, output):
+    """
+    Decrypt segment ``number`` from the first ``size`` bytes of ``sealed``
+    into the start of ``output``. Returns ``sealed`` for reuse.
+    """
+    if size < TAG_SIZE:
+        raise ValueError("Encrypted file is truncated")
+    body = size - TAG_SIZE
+    nonce = _segment_nonce(index.nonce_prefix, number, number == index.segment_count - 1)
+    tag = bytes(sealed[body:size])
+    decryptor = Cipher(algorithms.AES(key), modes.GCM(nonce, tag), backend=default_backend()).decryptor()
+    decryptor.authenticate_additional_data(index.header)
+    decryptor.update_into(memoryview(sealed)[:body], output)
+    decryptor.finalize()  # raises InvalidTag on tampering
+    return sealed
+
+def _decrypt_cbc_into(f, key):
+    f.seek(0)
+    iv = _read_full(f, BLOCK_SIZE)
+    ciphertext_size = f.seek(0, os.SEEK_END) - BLOCK_SIZE
+    if ciphertext_size <= 0 or ciphertext_size % BLOCK_SIZE:
+        raise ValueError("Encrypted file is truncated")
+    f.seek(BLOCK_SIZE)
+
+    out = bytearray(ciphertext_size + BLOCK_SIZE - 1)
+    view = memoryview(out)
+    chunk = bytearray(SEGMENT_SIZE)
+    decryptor = Cipher(algorithms.AES(key), modes.CBC(iv), backend=default_backend()).decryptor()
+    offset = 0
+    while True:
+        size = f.readinto(chunk)
+        if not size:
+            break
+        offset += decryptor.update_into(memoryview(chunk)[:size], view[offset:])
+    decryptor.finalize()
+    # Unpad by slicing the view rather than copying
+    return view[:offset - out[offset - 1]]
+
 # === Main Test Function ===
 def run_test(image_path: str):
     key = os.urandom(KEY_SIZE)
@@ -78,6 +551,19 @@ def run_test(image_path: str):
     print(f"⏱️ Decryption time: {dec_time_ms:.4f} ms")
     print(f"📝 Decrypted image saved as: {decrypted_path}")
 
+    # === Streaming container ===
+    print("\n🔐 Encrypting (segmented AES-GCM)...")
+    stream_path = input_path.with_name("encrypted_image.agph")
+    t5 = time.time()
+    with open(input_path, "rb") as src, open(stream_path, "wb") as dst:
+        encrypt_stream(src, dst, key)
+    t6 = time.time()
+    streamed = decrypt_file(stream_path, key)
+    t7 = time.time()
+    print(f"✔️ Stream decryption match: {streamed == image_data}")
+    print(f"⏱️ Stream encryption time: {(t6 - t5):.4f} s")
+    print(f"⏱️ Stream decryption time: {(t7 - t6):.4f} s ({DECRYPT_WORKERS} workers)")
+
 # === Run ===
 if __name__ == "__main__":
     # Replace with your image path here
@@ -0,0 +1,236 @@
+import atexit
+import itertools
+import json
+import logging
+import os
+import queue
+import select
+import subprocess
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Defaults for settings.EXIFTOOL
+DEFAULT_EXIFTOOL_SETTINGS = {
+    'PATH': 'exiftool',
+    'WORKERS': 2,
+    'TIMEOUT': 30,          # seconds a single request may take before the worker is restarted
+    'MAX_REQUESTS': 1000,   # recycle a worker after this many requests
+}
+
+
+class ExifToolError(RuntimeError):
+    pass
+
+
+class ExifToolProcess:
+    """
+    One long-lived ``exiftool -stay_open True -@ -`` process. Arguments are
+    written to its stdin one per line and terminated with -execute<n>;
+    exiftool answers with {ready<n>} on stdout and, through -echo4, on
+    stderr, which frames each response.
+    """
+
+    def __init__(self, executable='exiftool', timeout=30, max_requests=1000):
+        self.executable = executable
+        self.timeout = timeout
+        self.max_requests = max_requests
+        self.lock = threading.Lock()
+        self._process = None
+        self._requests = 0
+        self._sequence = itertools.count(1)
+
+    def start(self):
+        try:
+            self._process = subprocess.Popen(
+                [self.executable, '-stay_open', 'True', '-@', '-', '-common_args', '-charset', 'filename=utf8'],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            )
+        except OSError as e:
+            raise ExifToolError(f"Could not start exiftool: {e}")
+        self._requests = 0
+
+    def is_alive(self):
+        return self._process is not None and self._process.poll() is None
+
+    def stop(self, graceful=True):
+        process, self._process = self._process, None
+        if process is None:
+            return
+        try:
+            if not graceful:
+                process.kill()
+            if process.poll() is None:
+                process.stdin.write(b'-stay_open\nFalse\n')
+                process.stdin.flush()
+                process.wait(timeout=2)
+        except (OSError, subprocess.TimeoutExpired):
+            process.kill()
+            process.wait()
+        finally:
+            for pipe in (process.stdin, process.stdout, process.stderr):
+                try:
+                    pipe.close()
+                except OSError:
+                    pass
+
+    def execute(self, *args):
+        """Run one exiftool command; returns (stdout, stderr) as text"""
+        with self.lock:
+            if not self.is_alive() or self._requests >= self.max_requests:
+                self.stop()
+                self.start()
+            self._requests += 1
+            sequence = next(self._sequence)
+            marker = f'{{ready{sequence}}}'.encode()
+            lines = [str(arg) for arg in args] + ['-echo4', marker.decode(), f'-execute{sequence}']
+            if any('\n' in line for line in lines):
+                raise ExifToolError("exiftool arguments cannot contain newlines")
+            try:
+                self._process.stdin.write(('\n'.join(lines) + '\n').encode('utf-8'))
+                self._process.stdin.flush()
+                stdout, stderr = self._read_until(marker)
+            except Exception:
+                # The stream is out of step now; start over with a fresh process
+                self.stop(graceful=False)
+                raise
+            return stdout.decode('utf-8', 'replace'), stderr.decode('utf-8', 'replace')
+
+    def _read_until(self, marker):
+        """Read stdout and stderr until both carry ``marker``, within the timeout"""
+        deadline = time.monotonic() + self.timeout
+        pipes = {self._process.stdout.fileno(): bytearray(), self._process.stderr.fileno(): bytearray()}
+        pending = set(pipes)
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ExifToolError(f"exiftool did not answer within {self.timeout}s")
+            readable, _, _ = select.select(list(pending), [], [], remaining)
+            for fd in readable:
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    raise ExifToolError("exiftool exited unexpectedly")
+                buffer = pipes[fd]
+                buffer += chunk
+                if buffer.rstrip().endswith(marker):
+                    pending.discard(fd)
+        stdout, stderr = (bytes(pipes[fd]).rstrip() for fd in (self._process.stdout.fileno(),
+                                                                 self._process.stderr.fileno()))
+        return stdout[:-len(marker)], stderr[:-len(marker)]
+
+
+class ExifToolPool:
+    """
+    Pool of ExifToolProcess workers, so metadata calls don't pay for a
+    Perl interpreter start each time. Workers are started on demand up to
+    ``size``, each used by one thread at a time, and restarted when they
+    die, hang or reach their request budget.
+    """
+
+    def __init__(self, executable='exiftool', size=2, timeout=30, max_requests=1000):
+        self.executable = executable
+        self.size = size
+        self.timeout = timeout
+        self.max_requests = max_requests
+        self._idle = queue.LifoQueue()
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._workers) < self.size:
+                worker = ExifToolProcess(self.executable, self.timeout, self.max_requests)
+                self._workers.append(worker)
+                return worker
+        return self._idle.get()
+
+    def execute(self, *args):
+        """Run one exiftool command on a pooled worker; returns (stdout, stderr)"""
+        if any('\n' in str(arg) for arg in args):
+            # The -@ protocol is one argument per line, so multi-line values
+            # (e.g. descriptions) go through a one-off process instead
+            return self._run_once(*args)
+        worker = self._acquire()
+        try:
+            return worker.execute(*args)
+        finally:
+            self._idle.put(worker)
+
+    def _run_once(self, *args):
+        try:
+            result = subprocess.run([self.executable, *map(str, args)], capture_output=True,
+                                    text=True, timeout=self.timeout)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise ExifToolError(f"exiftool failed: {e}")
+        return result.stdout, result.stderr
+
+    def execute_json(self, *args):
+        """Run a command with -json output and return the parsed list"""
+        stdout, stderr = self.execute('-json', *args)
+        if not stdout.strip():
+            raise ExifToolError(stderr.strip() or "exiftool returned no output")
+        return json.loads(stdout)
+
+    def get_metadata(self, path, *args):
+        """Tags of one file as a dict (``args`` are extra exiftool options)"""
+        data = self.execute_json(*args, path)
+        return data[0] if data else {}
+
+    def get_metadata_batch(self, paths, *args):
+        """
+        Tags of many files from a single request, in the order of ``paths``.
+        Files exiftool could not read get an empty dict.
+        """
+        if not paths:
+            return []
+        by_source = {}
+        for entry in self.execute_json(*args, *paths):
+            by_source[entry.get('SourceFile')] = entry
+        return [by_source.get(path, {}) for path in paths]
+
+    def ping(self):
+        """Health check: True if a worker answers -ver"""
+        try:
+            stdout, _ = self.execute('-ver')
+            return bool(stdout.strip())
+        except ExifToolError:
+            return False
+
+    def close(self):
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            with worker.lock:
+                worker.stop()
+        self._idle = queue.LifoQueue()
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def get_exiftool_pool():
+    """
+    Process-wide ExifToolPool configured from settings.EXIFTOOL. A forked
+    child gets its own pool rather than sharing the parent's pipes.
+    """
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                config = {**DEFAULT_EXIFTOOL_SETTINGS, **getattr(settings, 'EXIFTOOL', {})}
+                _pool = ExifToolPool(config['PATH'], config['WORKERS'], config['TIMEOUT'], config['MAX_REQUESTS'])
+                _pool_pid = os.getpid()
+    return _pool
+
+@atexit.register
+def _close_pool():
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.close()
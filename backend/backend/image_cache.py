@@ -0,0 +1,210 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Defaults for settings.DECRYPTED_IMAGE_CACHE
+DEFAULT_CACHE_SETTINGS = {
+    'MAX_BYTES': 256 * 1024 * 1024,       # total decrypted bytes held in memory
+    'MAX_ITEM_BYTES': 32 * 1024 * 1024,   # larger images are streamed, never cached
+    'TTL': 300,                           # seconds
+    'DISK_DIR': None,                     # shared on-disk tier, must be outside MEDIA_ROOT
+    'DISK_MAX_BYTES': 2 * 1024 * 1024 * 1024,
+}
+
+
+class DecryptedImageCache:
+    """
+    Byte-budgeted LRU cache of decrypted image bodies with a TTL.
+    Entries are keyed by image id + storage mtime, so replacing a file makes
+    its old entry unreachable. An optional disk tier shared between worker
+    processes keeps entries AES-GCM encrypted with a key derived from SECRET_KEY.
+    """
+
+    def __init__(self, max_bytes, ttl, max_item_bytes=None, disk_dir=None, disk_max_bytes=None, secret=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_item_bytes = min(max_item_bytes or max_bytes, max_bytes)
+        self._entries = OrderedDict()  # key -> (expires_at, content_type, data)
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'disk_hits': 0, 'evictions': 0, 'expired': 0}
+
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._disk_cipher = None
+        if disk_dir:
+            media_root = os.path.realpath(settings.MEDIA_ROOT)
+            real_dir = os.path.realpath(disk_dir)
+            if os.path.commonpath([media_root, real_dir]) == media_root:
+                raise ValueError("The decrypted image cache directory must be outside MEDIA_ROOT")
+            os.makedirs(disk_dir, mode=0o700, exist_ok=True)
+            from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+            secret = (secret or settings.SECRET_KEY).encode()
+            self._disk_cipher = AESGCM(hashlib.sha256(b'decrypted-image-cache:' + secret).digest())
+
+    @staticmethod
+    def key_for(user_image, variant='original'):
+        """Cache key for an image; changes whenever the stored file is replaced"""
+        mtime = os.stat(user_image.image.path).st_mtime_ns
+        return f"{user_image.pk}:{mtime}:{variant}"
+
+    def get(self, key):
+        """Return (content_type, data) or None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return entry[1], entry[2]
+                self._remove(key)
+                self._stats['expired'] += 1
+
+        entry = self._disk_get(key)
+        with self._lock:
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._stats['disk_hits'] += 1
+            self._insert(key, *entry)
+        return entry
+
+    def set(self, key, content_type, data):
+        if len(data) > self.max_item_bytes:
+            return False
+        data = bytes(data)
+        with self._lock:
+            self._insert(key, content_type, data)
+        self._disk_set(key, content_type, data)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['disk_hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'hit_rate': round((lookups - self._stats['misses']) / lookups, 4) if lookups else None,
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'disk_tier': bool(self.disk_dir),
+            }
+
+    # --- In-memory tier (callers hold the lock) ---
+
+    def _insert(self, key, content_type, data):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, content_type, data)
+        self._size += len(data)
+        while self._size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._stats['evictions'] += 1
+
+    def _remove(self, key):
+        _, _, data = self._entries.pop(key)
+        self._size -= len(data)
+
+    # --- Disk tier ---
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, hashlib.sha256(key.encode()).hexdigest())
+
+    def _disk_get(self, key):
+        if not self._disk_cipher:
+            return None
+        path = self._disk_path(key)
+        try:
+            if os.stat(path).st_mtime + self.ttl < time.time():
+                os.remove(path)
+                return None
+            with open(path, 'rb') as f:
+                blob = f.read()
+            plain = self._disk_cipher.decrypt(blob[:12], blob[12:], key.encode())
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Dropping unreadable cache file {path}: {e}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        content_type, _, data = plain.partition(b'\n')
+        return content_type.decode(), data
+
+    def _disk_set(self, key, content_type, data):
+        if not self._disk_cipher:
+            return
+        path = self._disk_path(key)
+        nonce = os.urandom(12)
+        blob = nonce + self._disk_cipher.encrypt(nonce, content_type.encode() + b'\n' + data, key.encode())
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(blob)
+            os.replace(temp_path, path)
+            self._disk_prune()
+        except OSError as e:
+            logger.warning(f"Could not write cache file {path}: {e}")
+
+    def _disk_prune(self):
+        """Drop expired files, then the least recently written ones over the budget"""
+        files = []
+        total = 0
+        cutoff = time.time() - self.ttl
+        with os.scandir(self.disk_dir) as entries:
+            for entry in entries:
+                if not entry.is_file() or entry.name.endswith('.tmp'):
+                    continue
+                stat = entry.stat()
+                if stat.st_mtime < cutoff:
+                    os.remove(entry.path)
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        if self.disk_max_bytes is None or total <= self.disk_max_bytes:
+            return
+        for _, size, path in sorted(files):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            if total <= self.disk_max_bytes:
+                break
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_image_cache():
+    """Process-wide cache configured from settings.DECRYPTED_IMAGE_CACHE"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = {**DEFAULT_CACHE_SETTINGS, **getattr(settings, 'DECRYPTED_IMAGE_CACHE', {})}
+                _cache = DecryptedImageCache(
+                    max_bytes=config['MAX_BYTES'],
+                    ttl=config['TTL'],
+                    max_item_bytes=config['MAX_ITEM_BYTES'],
+                    disk_dir=config['DISK_DIR'],
+                    disk_max_bytes=config['DISK_MAX_BYTES'],
+                )
+    return _cache
@@ -0,0 +1,126 @@
+"""
+Filters of the image library, shared by ImageListView and selections made
+with the same query parameters elsewhere (bulk metadata edits).
+"""
+
+from django.db.models import F, Q
+from django.http import QueryDict
+from rest_framework.exceptions import ValidationError
+
+from .metadata_index import normalize_text, normalize_owner, parse_date, split_keywords
+
+
+def query_params(filters):
+    """QueryDict of a JSON filter object, each value a string or a list of strings"""
+    params = QueryDict(mutable=True)
+    for name, value in (filters or {}).items():
+        values = value if isinstance(value, list) else [value]
+        params.setlist(name, [str(v) for v in values if v is not None])
+    return params
+
+
+def _number(params, param, convert):
+    value = params.get(param)
+    if not value:
+        return None
+    try:
+        return convert(value)
+    except ValueError:
+        raise ValidationError({param: 'Expected a number.'})
+
+
+def filter_images(queryset, params, user):
+    """Apply the ImageListView filters in ``params`` (a QueryDict) to a queryset of ``user``'s images"""
+    # Search filter
+    search_query = params.get('search', '')
+    if search_query:
+        queryset = queryset.filter(image_name__icontains=search_query)
+
+    # File type filter
+    file_types = params.getlist('file_type')
+    if file_types:
+        queryset = queryset.filter(file_type__in=file_types)
+
+    # Size filter (in MB)
+    size_min = _number(params, 'size_min', float)
+    size_max = _number(params, 'size_max', float)
+    if size_min is not None:
+        queryset = queryset.filter(file_size__gte=size_min*1024*1024)  # Convert MB to bytes
+    if size_max is not None:
+        queryset = queryset.filter(file_size__lte=size_max*1024*1024)  # Convert MB to bytes
+
+    # Dimension filters (pixels / megapixels), from the stored header probe
+    for param, lookup, convert in (
+        ('width_min', 'width__gte', int), ('width_max', 'width__lte', int),
+        ('height_min', 'height__gte', int), ('height_max', 'height__lte', int),
+        ('megapixels_min', 'megapixels__gte', float), ('megapixels_max', 'megapixels__lte', float),
+    ):
+        value = _number(params, param, convert)
+        if value is not None:
+            queryset = queryset.filter(**{lookup: value})
+
+    # Real format filter (JPEG, PNG, WEBP, ...); ?format= is taken by DRF
+    formats = params.getlist('image_format')
+    if formats:
+        queryset = queryset.filter(format__in=[f.upper() for f in formats])
+
+    orientation = params.get('orientation')
+    if orientation == 'landscape':
+        queryset = queryset.filter(width__gt=F('height'))
+    elif orientation == 'portrait':
+        queryset = queryset.filter(width__lt=F('height'))
+    elif orientation == 'square':
+        queryset = queryset.filter(width=F('height'))
+
+    return filter_metadata(queryset, params, user)
+
+
+def filter_metadata(queryset, params, user):
+    """
+    Filters on the metadata index (ImageMetadataIndex / ImageKeyword).
+    Text matches are case-insensitive prefixes, keywords must all match,
+    taken_after/taken_before take a date or exif date-time and bbox is
+    min_lon,min_lat,max_lon,max_lat (min_lon > max_lon crosses 180).
+    Keyword, date and GPS filters repeat the user on the index rows so
+    their (user, ...) indexes are used.
+    """
+    for param, column, normalize in (
+        ('camera_make', 'camera_make', normalize_text), ('camera_model', 'camera_model', normalize_text),
+        ('lens', 'lens', normalize_text), ('creator', 'creator', normalize_text),
+        ('copyright', 'copyright_owner', normalize_owner),
+    ):
+        value = normalize(params.get(param, ''))
+        if value:
+            queryset = queryset.filter(**{f'metadata_index__{column}__startswith': value})
+
+    for keyword in split_keywords(params.getlist('keyword')):
+        queryset = queryset.filter(keywords__user=user, keywords__keyword=keyword)
+
+    for param, lookup in (('taken_after', 'gte'), ('taken_before', 'lte')):
+        value = params.get(param)
+        if value:
+            taken = parse_date(value)
+            if taken is None:
+                raise ValidationError({param: 'Expected a date like 2024-05-01 or 2024:05:01 10:00:00.'})
+            if lookup == 'lte' and len(value.strip()) <= 10:
+                # A bare date includes the whole day
+                taken = taken.replace(hour=23, minute=59, second=59)
+            queryset = queryset.filter(**{'metadata_index__user': user, f'metadata_index__date_taken__{lookup}': taken})
+
+    bbox = params.get('bbox')
+    if bbox:
+        try:
+            min_lon, min_lat, max_lon, max_lat = (float(part) for part in bbox.split(','))
+        except ValueError:
+            raise ValidationError({'bbox': 'Expected min_lon,min_lat,max_lon,max_lat.'})
+        if not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180 and -90 <= min_lat <= max_lat <= 90):
+            raise ValidationError({'bbox': 'Coordinates out of range.'})
+        queryset = queryset.filter(metadata_index__user=user, metadata_index__latitude__gte=min_lat,
+                                   metadata_index__latitude__lte=max_lat)
+        if min_lon <= max_lon:
+            queryset = queryset.filter(metadata_index__longitude__gte=min_lon,
+                                       metadata_index__longitude__lte=max_lon)
+        else:
+            queryset = queryset.filter(Q(metadata_index__longitude__gte=min_lon) |
+                                       Q(metadata_index__longitude__lte=max_lon))
+    return queryset
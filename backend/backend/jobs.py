@@ -0,0 +1,263 @@
+import logging
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Images per UPDATE of a bulk metadata edit
+BULK_METADATA_CHUNK = 500
+# Retry backoff: RETRY_BASE_DELAY * 2 ** (attempt - 1) seconds
+RETRY_BASE_DELAY = 5
+# A running job whose worker has not finished it within this long is picked up again
+STALE_AFTER = timedelta(minutes=30)
+
+_handlers = {}
+
+
+def job_handler(kind):
+    """Register ``func(job)`` as the handler for jobs of ``kind``"""
+    def register(func):
+        _handlers[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, payload=None, user=None, lane=None, priority=0, max_attempts=3, user_id=None):
+    """
+    Queue a job. It becomes visible to workers once the surrounding
+    transaction commits. With settings.JOBS_RUN_INLINE the job is run
+    right away instead, which is handy without a worker.
+    """
+    from .models import Job
+
+    job = Job.objects.create(
+        kind=kind,
+        payload=payload or {},
+        user_id=user.pk if user is not None else user_id,
+        lane=lane or Job.LANE_INTERACTIVE,
+        priority=priority,
+        max_attempts=max_attempts,
+    )
+    if getattr(settings, 'JOBS_RUN_INLINE', False):
+        transaction.on_commit(lambda: run_inline(job.pk))
+    return job
+
+
+def enqueue_many(kind, payloads, user=None, lane=None, priority=0, max_attempts=3):
+    """Queue one job per payload with a single INSERT; see enqueue()"""
+    from .models import Job
+
+    jobs = Job.objects.bulk_create([
+        Job(
+            kind=kind,
+            payload=payload,
+            user=user,
+            lane=lane or Job.LANE_INTERACTIVE,
+            priority=priority,
+            max_attempts=max_attempts,
+        )
+        for payload in payloads
+    ])
+    if getattr(settings, 'JOBS_RUN_INLINE', False):
+        for job in jobs:
+            transaction.on_commit(lambda pk=job.pk: run_inline(pk))
+    return jobs
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_next(worker, lanes):
+    """
+    Claim the next runnable job from ``lanes`` (tried in order) and mark it
+    running. Concurrent workers skip rows locked by each other
+    (SELECT ... FOR UPDATE SKIP LOCKED). Returns None when there is nothing to do.
+    """
+    from .models import Job
+
+    now = timezone.now()
+    stale = Q(status='running', locked_at__lt=now - STALE_AFTER)
+    # A worker stopped during the last attempt: fail the job rather than run it again
+    abandoned = (Job.objects.filter(stale, lane__in=lanes, attempts__gte=F('max_attempts'))
+                 .update(status='failed', finished_at=now, locked_by='', locked_at=None,
+                         error='Worker stopped during the last attempt'))
+    if abandoned:
+        logger.error(f"Failed {abandoned} stale job(s) that had used all their attempts")
+    runnable = (Q(status='queued', run_after__lte=now) |
+                (stale & Q(attempts__lt=F('max_attempts'))))
+    for lane in lanes:
+        with transaction.atomic():
+            job = (Job.objects.select_for_update(skip_locked=True)
+                   .filter(runnable, lane=lane)
+                   .order_by('-priority', 'run_after', 'id')
+                   .first())
+            if job is None:
+                continue
+            job.status = 'running'
+            job.attempts += 1
+            job.locked_by = worker
+            job.locked_at = now
+            job.started_at = job.started_at or now
+            job.save(update_fields=['status', 'attempts', 'locked_by', 'locked_at', 'started_at'])
+            return job
+    return None
+
+
+def run_job(job):
+    """Run a claimed job, then record success, schedule a retry, or mark it failed"""
+    handler = _handlers.get(job.kind)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for job kind '{job.kind}'")
+        result = handler(job)
+    except Exception as e:
+        job.error = traceback.format_exc()
+        if job.attempts < job.max_attempts and handler is not None:
+            job.status = 'queued'
+            job.run_after = timezone.now() + timedelta(seconds=RETRY_BASE_DELAY * 2 ** (job.attempts - 1))
+            logger.warning(f"Job {job.id} ({job.kind}) failed on attempt {job.attempts}, retrying: {e}")
+        else:
+            job.status = 'failed'
+            job.finished_at = timezone.now()
+            logger.error(f"Job {job.id} ({job.kind}) failed: {e}")
+        job.locked_by = ''
+        job.locked_at = None
+        job.save(update_fields=['status', 'error', 'run_after', 'finished_at', 'locked_by', 'locked_at'])
+        return job
+
+    job.status = 'succeeded'
+    job.progress = 1.0
+    job.result = result or {}
+    job.finished_at = timezone.now()
+    job.locked_by = ''
+    job.locked_at = None
+    job.save(update_fields=['status', 'progress', 'result', 'finished_at', 'locked_by', 'locked_at'])
+    return job
+
+
+def run_inline(job_id):
+    from .models import Job
+
+    with transaction.atomic():
+        job = Job.objects.select_for_update().get(pk=job_id)
+        if job.status != 'queued':
+            return job
+        job.status = 'running'
+        job.attempts += 1
+        job.locked_by = worker_id()
+        job.locked_at = job.started_at = timezone.now()
+        job.save(update_fields=['status', 'attempts', 'locked_by', 'locked_at', 'started_at'])
+    return run_job(job)
+
+
+# === Handlers ===
+
+@job_handler('process_upload')
+def process_upload(job):
+    """Metadata extraction and derivatives for a freshly encrypted upload"""
+    from .models import UserImage
+    from .derivatives import DerivativeGenerator
+
+    try:
+        user_image = UserImage.objects.get(pk=job.payload['image_id'])
+    except UserImage.DoesNotExist:
+        return {'skipped': 'image deleted'}
+
+    user_image.extract_metadata()
+    job.set_progress(0.5)
+    derivatives = DerivativeGenerator.generate(user_image)
+    return {
+        'metadata_enabled': user_image.metadata_enabled,
+        'derivatives': [d.pixel_width for d in derivatives],
+    }
+
+
+@job_handler('generate_derivatives')
+def generate_derivatives(job):
+    from .models import UserImage
+    from .derivatives import DerivativeGenerator
+
+    try:
+        user_image = UserImage.objects.get(pk=job.payload['image_id'])
+    except UserImage.DoesNotExist:
+        return {'skipped': 'image deleted'}
+    derivatives = DerivativeGenerator.generate(user_image)
+    return {'derivatives': [d.pixel_width for d in derivatives]}
+
+
+@job_handler('bulk_update_metadata')
+def bulk_update_metadata(job):
+    """
+    Apply the same metadata edits to a selection of the user's images (ids
+    or ImageListView filters) in chunked UPDATEs inside one transaction, so
+    a failure leaves every image as it was. Protected copies of the edited
+    images that embed metadata can be re-embedded afterwards.
+    """
+    from .models import UserImage, ImageAccess
+    from .image_filters import filter_images, query_params
+
+    payload = job.payload
+    images = UserImage.objects.filter(user=job.user)
+    if 'ids' in payload:
+        images = images.filter(id__in=payload['ids'])
+    else:
+        images = filter_images(images, query_params(payload.get('filter')), job.user)
+    assignments = [tuple(assignment) for assignment in payload['assignments']]
+
+    updated = 0
+    with transaction.atomic():
+        image_ids = list(images.order_by('id').values_list('id', flat=True).distinct())
+        for start in range(0, len(image_ids), BULK_METADATA_CHUNK):
+            chunk = image_ids[start:start + BULK_METADATA_CHUNK]
+            updated += len(UserImage.update_metadata_many(chunk, job.user, assignments))
+            job.set_progress(0.95 * (start + len(chunk)) / len(image_ids))
+
+    reembed = []
+    if payload.get('reembed') and image_ids:
+        access_ids = (ImageAccess.objects
+                      .filter(user_image_id__in=image_ids, protection_features__metadata=True)
+                      .exclude(protected_image='').exclude(protected_image__isnull=True)
+                      .values_list('id', flat=True))
+        reembed = enqueue_many('reembed_metadata', [{'access_id': pk} for pk in access_ids], user=job.user)
+    return {'selected': len(image_ids), 'updated': updated, 'reembed_jobs': [j.id for j in reembed]}
+
+
+@job_handler('reembed_metadata')
+def reembed_metadata(job):
+    """Rewrite the metadata of a protected copy (ImageAccess.protected_image) from its image's current metadata"""
+    from io import BytesIO
+    from PIL import Image
+    from django.core.files.base import ContentFile
+    from .models import ImageAccess
+    from .utils import ProtectionChain
+
+    try:
+        access = ImageAccess.objects.select_related('user_image').get(pk=job.payload['access_id'])
+    except ImageAccess.DoesNotExist:
+        return {'skipped': 'access rule deleted'}
+    if not access.protected_image or not access.protection_features.get('metadata'):
+        return {'skipped': 'no protected copy with metadata'}
+
+    user_image = access.user_image
+    with access.protected_image.open('rb') as f:
+        protected = Image.open(BytesIO(f.read()))
+        protected.load()
+    # Re-encoding drops the old tags, so unset fields don't linger
+    result = ProtectionChain._apply_metadata(protected, user_image.metadata)
+    if result is None:
+        raise RuntimeError('Metadata embedding failed')
+
+    old_name = access.protected_image.name
+    access.protected_image.save(f'protected_{user_image.image_name}.png', ContentFile(result), save=False)
+    ImageAccess.objects.filter(pk=access.pk).update(protected_image=access.protected_image.name)
+    if old_name != access.protected_image.name:
+        access.protected_image.storage.delete(old_name)
+    return {'protected_image': access.protected_image.name}
@@ -0,0 +1,105 @@
+import importlib.util
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from backend.models import UserImage
+
+# Array keys the chaotic cipher used to persist per channel
+LEGACY_ARRAY_KEYS = ('perms', 'xor_streams', 'encryption_perms', 'encryption_xor_streams')
+
+CIPHER_PATH = Path(__file__).resolve().parents[2] / 'utils' / 'encryption.py'
+
+
+def load_cipher():
+    """backend/utils/encryption.py, loaded by path since backend/utils.py shadows the package"""
+    spec = importlib.util.spec_from_file_location('backend_chaotic_cipher', CIPHER_PATH)
+    cipher = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(cipher)
+    return cipher
+
+
+class Command(BaseCommand):
+    help = 'Replaces stored chaotic permutation/XOR arrays in encryption_params with seed parameters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report the rows that would be compacted without writing')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        cipher = load_cipher()
+
+        legacy = Q()
+        for array_key in LEGACY_ARRAY_KEYS:
+            legacy |= Q(encryption_params__has_key=array_key)
+        rows = (UserImage.objects.filter(legacy)
+                .only('id', 'encryption_key', 'encryption_params')
+                .order_by('id'))
+
+        compacted = skipped = 0
+        batch = []
+        for image in rows.iterator(chunk_size=batch_size):
+            if not image.encryption_key:
+                # Without the key the arrays are the only way to decrypt
+                skipped += 1
+                self.stdout.write(self.style.WARNING(
+                    f'Image {image.id}: no encryption key stored, keeping arrays.'))
+                continue
+
+            params = self.compact(cipher, image.encryption_params)
+            if not self.regenerates(cipher, image.encryption_key, image.encryption_params, params):
+                # Dropping the arrays would make the image undecryptable
+                skipped += 1
+                self.stdout.write(self.style.WARNING(
+                    f'Image {image.id}: stored streams differ from the ones the key regenerates, keeping arrays.'))
+                continue
+
+            image.encryption_params = params
+            batch.append(image)
+            compacted += 1
+            if len(batch) >= batch_size:
+                self.flush(batch, dry_run)
+                batch = []
+        self.flush(batch, dry_run)
+
+        verb = 'Would compact' if dry_run else 'Compacted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {compacted} image(s); skipped {skipped}.'))
+
+    @staticmethod
+    def compact(cipher, params):
+        perms = params.get('perms') or params.get('encryption_perms') or []
+        compact = {k: v for k, v in params.items() if k not in LEGACY_ARRAY_KEYS}
+        compact.setdefault('algorithm', 'chaotic')
+        compact.setdefault('version', cipher.CHAOTIC_PARAMS_VERSION)
+        compact.setdefault('seed_derivation', 'key-char-sum')
+        compact.setdefault('mu', cipher.DEFAULT_MU)
+        compact.setdefault('channels', len(perms) or 3)
+        return compact
+
+    @staticmethod
+    def regenerates(cipher, key, params, compact):
+        """Whether decrypt_color_image would regenerate exactly the stored arrays from ``compact``"""
+        perms = params.get('perms') or params.get('encryption_perms') or []
+        xor_streams = params.get('xor_streams') or params.get('encryption_xor_streams') or []
+        if (not perms or len(perms) != len(xor_streams) or compact['channels'] != len(perms)
+                or compact['seed_derivation'] != 'key-char-sum' or compact.get('mode') == 'tiled'):
+            return False
+        # Same per-channel keys as encrypt_color_image
+        channel_keys = [key + str(idx) for idx in range(len(perms))]
+        streams = cipher.generate_key_streams((len(perms[0]), 1), channel_keys, compact['mu'])
+        return all(
+            len(perm) == len(stored_perm) and len(xor_stream) == len(stored_xor)
+            and np.array_equal(perm, np.asarray(stored_perm))
+            and np.array_equal(xor_stream, np.asarray(stored_xor, dtype=np.uint8))
+            for (perm, xor_stream), stored_perm, stored_xor in zip(streams, perms, xor_streams)
+        )
+
+    @staticmethod
+    def flush(batch, dry_run):
+        if batch and not dry_run:
+            UserImage.objects.bulk_update(batch, ['encryption_params'])
@@ -0,0 +1,46 @@
+import json
+
+from django.core.management.base import BaseCommand
+from backend.models import UserImage
+from backend.metadata_utils import SCHEMA_INDEX
+
+
+class Command(BaseCommand):
+    help = 'Rewrites metadata stored with the full schema per field as values only'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report the rows that would be compacted without writing')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+
+        rows = (UserImage.objects.exclude(metadata={}).exclude(metadata__has_key='schema')
+                .only('id', 'metadata')
+                .order_by('id'))
+
+        compacted = before = after = 0
+        batch = []
+        for image in rows.iterator(chunk_size=batch_size):
+            before += len(json.dumps(image.metadata))
+            image.metadata = SCHEMA_INDEX.compact_metadata(image.metadata)
+            after += len(json.dumps(image.metadata))
+            batch.append(image)
+            compacted += 1
+            if len(batch) >= batch_size:
+                self.flush(batch, dry_run)
+                batch = []
+        self.flush(batch, dry_run)
+
+        verb = 'Would compact' if dry_run else 'Compacted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {compacted} image(s); {before} -> {after} bytes of JSON.'))
+
+    @staticmethod
+    def flush(batch, dry_run):
+        # The searchable projection is the same for both forms, so
+        # ImageMetadataIndex needs no resync
+        if batch and not dry_run:
+            UserImage.objects.bulk_update(batch, ['metadata'])
@@ -0,0 +1,65 @@
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand
+from backend.models import UserImage, ImageMetadataIndex
+from backend.metadata_utils import MetadataExtractor
+
+
+class Command(BaseCommand):
+    help = 'Extracts metadata for existing images, many files per exiftool request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--force', action='store_true',
+                            help='Re-extract images that already have metadata')
+        parser.add_argument('--ids', nargs='+', type=int, help='Only these image ids')
+
+    def handle(self, *args, **options):
+        images = UserImage.objects.all()
+        if options['ids']:
+            images = images.filter(id__in=options['ids'])
+        if not options['force']:
+            images = images.filter(metadata_enabled=False)
+
+        extracted = failed = 0
+        batch = []
+        for image in images.order_by('id').iterator(chunk_size=options['batch_size']):
+            batch.append(image)
+            if len(batch) >= options['batch_size']:
+                done, errors = self._extract(batch)
+                extracted, failed, batch = extracted + done, failed + errors, []
+        if batch:
+            done, errors = self._extract(batch)
+            extracted, failed = extracted + done, failed + errors
+
+        self.stdout.write(self.style.SUCCESS(f'Extracted metadata for {extracted} image(s); {failed} failed.'))
+
+    def _extract(self, images):
+        # The plaintext only lives in a private temporary directory for the batch
+        with tempfile.TemporaryDirectory() as temp_dir:
+            paths, ready = [], []
+            for image in images:
+                suffix = f".{image.file_type}" if image.file_type not in ('', 'unknown') else ''
+                path = os.path.join(temp_dir, f"{image.id}{suffix}")
+                try:
+                    with open(path, 'wb') as f:
+                        f.write(image.get_decrypted_bytes())
+                except Exception as e:
+                    self.stdout.write(self.style.ERROR(f'Image {image.id}: {e}'))
+                    continue
+                paths.append(path)
+                ready.append(image)
+
+            try:
+                results = MetadataExtractor.extract_metadata_batch(paths) if paths else []
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'exiftool failed: {e}'))
+                return 0, len(images)
+
+        for image, metadata in zip(ready, results):
+            image.metadata = metadata
+            image.metadata_enabled = True
+        UserImage.objects.bulk_update(ready, ['metadata', 'metadata_enabled'])
+        ImageMetadataIndex.sync_many(ready)
+        return len(ready), len(images) - len(ready)
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from backend.models import UserImage, Job
+from backend.derivatives import DerivativeGenerator
+from backend.jobs import enqueue
+
+
+class Command(BaseCommand):
+    help = 'Generates the encrypted WebP derivatives (thumbnails) for existing images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate derivatives for images that already have them')
+        parser.add_argument('--ids', nargs='+', type=int, help='Only these image ids')
+        parser.add_argument('--enqueue', action='store_true',
+                            help='Queue backfill-lane jobs for `runjobs` instead of generating inline')
+
+    def handle(self, *args, **options):
+        images = UserImage.objects.exclude(encryption_key__isnull=True).exclude(encryption_key='')
+        if options['ids']:
+            images = images.filter(id__in=options['ids'])
+        if not options['force']:
+            images = images.filter(derivatives__isnull=True)
+
+        if options['enqueue']:
+            queued = 0
+            for image in images.distinct().order_by('id').only('id', 'user_id').iterator():
+                enqueue('generate_derivatives', {'image_id': image.id}, user_id=image.user_id,
+                        lane=Job.LANE_BACKFILL)
+                queued += 1
+            self.stdout.write(self.style.SUCCESS(f'Queued {queued} derivative job(s).'))
+            return
+
+        generated = failed = 0
+        for image in images.distinct().order_by('id').iterator():
+            try:
+                derivatives = DerivativeGenerator.generate(image)
+                generated += 1
+                widths = ', '.join(str(d.pixel_width) for d in derivatives)
+                self.stdout.write(f'Image {image.id}: {widths}')
+            except Exception as e:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f'Image {image.id}: {e}'))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated derivatives for {generated} image(s); {failed} failed.'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from backend.models import UserImage, ImageMetadataIndex
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the searchable metadata index (camera, lens, date taken, keywords, owner, GPS)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--ids', nargs='+', type=int, help='Only these image ids')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        images = UserImage.objects.only('id', 'user_id', 'metadata')
+        if options['ids']:
+            images = images.filter(id__in=options['ids'])
+
+        indexed = 0
+        batch = []
+        for image in images.order_by('id').iterator(chunk_size=batch_size):
+            batch.append(image)
+            if len(batch) >= batch_size:
+                ImageMetadataIndex.sync_many(batch)
+                indexed += len(batch)
+                batch = []
+        if batch:
+            ImageMetadataIndex.sync_many(batch)
+            indexed += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} image(s).'))
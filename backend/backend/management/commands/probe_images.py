@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from backend.models import UserImage
+from backend.metadata_utils import MetadataExtractor
+
+
+class Command(BaseCommand):
+    help = 'Fills in width, height, megapixels, format and color mode from the image headers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--force', action='store_true',
+                            help='Probe images that already have dimensions too')
+        parser.add_argument('--ids', nargs='+', type=int, help='Only these image ids')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        images = UserImage.objects.all()
+        if options['ids']:
+            images = images.filter(id__in=options['ids'])
+        if not options['force']:
+            images = images.filter(width__isnull=True)
+
+        probed = failed = 0
+        batch = []
+        for image in images.order_by('id').iterator(chunk_size=batch_size):
+            try:
+                # Only the segments holding the headers are decrypted
+                with image.open_decrypted() as f:
+                    probe = MetadataExtractor.probe_image(f, max_pixels=float('inf'))
+            except Exception as e:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f'Image {image.id}: {e}'))
+                continue
+            for field, value in probe.items():
+                setattr(image, field, value)
+            batch.append(image)
+            probed += 1
+            if len(batch) >= batch_size:
+                UserImage.objects.bulk_update(batch, UserImage.PROBE_FIELDS)
+                batch = []
+        if batch:
+            UserImage.objects.bulk_update(batch, UserImage.PROBE_FIELDS)
+
+        self.stdout.write(self.style.SUCCESS(f'Probed {probed} image(s); {failed} failed.'))
@@ -0,0 +1,35 @@
+import os
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from backend.models import UploadSession
+from backend.resumable import ResumableUpload
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired resumable uploads and staging files no upload refers to'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be deleted without deleting')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        expired = UploadSession.objects.filter(status='uploading', expires_at__lte=timezone.now())
+        count = expired.count()
+        if not dry_run:
+            for session in expired.iterator():
+                session.delete()  # staging files removed by the post_delete signal
+
+        # Leftovers of finalized uploads or crashed requests
+        directory = ResumableUpload.staging_dir()
+        live = {str(pk) for pk in UploadSession.objects.filter(status='uploading').values_list('pk', flat=True)}
+        orphans = [name for name in os.listdir(directory) if name.split('.', 1)[0] not in live]
+        if not dry_run:
+            for name in orphans:
+                ResumableUpload._remove(os.path.join(directory, name))
+
+        verb = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {count} expired upload(s) and {len(orphans)} orphaned staging file(s).'))
@@ -0,0 +1,55 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from backend import jobs
+from backend.models import Job
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs (upload post-processing, backfills)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lanes', default=f'{Job.LANE_INTERACTIVE},{Job.LANE_BACKFILL}',
+                            help='Comma-separated lanes to take jobs from, in priority order')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once no runnable jobs are left instead of polling')
+        parser.add_argument('--sleep', type=float, default=1.0,
+                            help='Seconds to wait between polls when the queue is empty')
+        parser.add_argument('--max-jobs', type=int, default=0,
+                            help='Exit after this many jobs (0 = no limit)')
+
+    def handle(self, *args, **options):
+        lanes = [lane.strip() for lane in options['lanes'].split(',') if lane.strip()]
+        worker = jobs.worker_id()
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        self.stdout.write(f'Worker {worker} taking jobs from: {", ".join(lanes)}')
+        processed = 0
+        while not self.stopping:
+            close_old_connections()
+            job = jobs.claim_next(worker, lanes)
+            if job is None:
+                if options['burst']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+
+            started = time.time()
+            job = jobs.run_job(job)
+            processed += 1
+            style = self.style.SUCCESS if job.status == 'succeeded' else self.style.WARNING
+            self.stdout.write(style(
+                f'Job {job.id} {job.kind} [{job.lane}] {job.status} '
+                f'(attempt {job.attempts}, {time.time() - started:.2f}s)'))
+            if options['max_jobs'] and processed >= options['max_jobs']:
+                break
+
+        self.stdout.write(f'Worker {worker} stopped after {processed} job(s).')
+
+    def stop(self, signum, frame):
+        # Finish the current job, then exit
+        self.stopping = True
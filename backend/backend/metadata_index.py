@@ -0,0 +1,133 @@
+"""
+Projection of the stored metadata of a UserImage onto the searchable
+columns of ImageMetadataIndex and its ImageKeyword rows. Text is stored
+lowercased so the list filters can use plain (prefix) index lookups.
+"""
+
+import re
+from datetime import datetime, timezone
+
+# Searchable column -> (category, field) sources, first non-empty wins
+TEXT_SOURCES = {
+    'camera_make': [('EXIF', 'Make')],
+    'camera_model': [('EXIF', 'Model')],
+    'lens': [('EXIF', 'LensModel'), ('EXIF', 'LensInfo')],
+    'creator': [('EXIF', 'Artist'), ('IPTC', 'By-line'), ('XMP', 'Creator')],
+    'copyright_owner': [('XMP', 'Owner'), ('EXIF', 'Copyright'), ('IPTC', 'CopyrightNotice'), ('XMP', 'Rights')],
+}
+DATE_SOURCES = [('EXIF', 'DateTimeOriginal'), ('EXIF', 'CreateDate'), ('XMP', 'DateCreated'),
+                ('IPTC', 'DateCreated'), ('XMP', 'CreateDate')]
+KEYWORD_SOURCES = [('IPTC', 'Keywords'), ('XMP', 'Subject')]
+
+MAX_TEXT_LENGTH = 255
+MAX_KEYWORD_LENGTH = 100
+
+DATE_PATTERN = re.compile(r'(\d{4})[:-](\d{2})[:-](\d{2})(?:[ T](\d{2}):(\d{2})(?::(\d{2}))?)?')
+COORDINATE_PATTERN = re.compile(r'(-?\d+(?:\.\d+)?)(?:\s*deg\s*(\d+(?:\.\d+)?)\'?(?:\s*(\d+(?:\.\d+)?)")?)?\s*([NSEW])?',
+                                re.IGNORECASE)
+# Notice boilerplate stripped to get at the owner's name
+COPYRIGHT_NOISE = re.compile(r'©|\(c\)|copyright|all rights reserved|\b\d{4}(?:\s*-\s*\d{4})?\b|[.,;]', re.IGNORECASE)
+
+
+def field_value(metadata, category, name):
+    """Value of a schema field in stored (compact) or organized metadata, whichever section it is in"""
+    if 'schema' in metadata:
+        return (metadata.get(category) or {}).get(name)
+    for section in (metadata.get(category) or {}).values():
+        if isinstance(section, dict) and name in section:
+            field = section[name]
+            return field.get('value') if isinstance(field, dict) else field
+    return None
+
+
+def normalize_text(value):
+    if isinstance(value, list):
+        value = ', '.join(str(v) for v in value)
+    return ' '.join(str(value).split()).lower()[:MAX_TEXT_LENGTH]
+
+
+def normalize_owner(value):
+    """'© 2024 Jane Doe. All rights reserved.' -> 'jane doe'"""
+    return re.sub(r'^\W+|\W+$', '', normalize_text(COPYRIGHT_NOISE.sub(' ', normalize_text(value))))
+
+
+def parse_date(value):
+    """
+    exiftool date ('2024:05:01 10:00:00', '2024:05:01') as a datetime. Camera
+    clocks have no zone, so the wall time is stored as UTC.
+    """
+    match = DATE_PATTERN.search(str(value or ''))
+    if not match:
+        return None
+    try:
+        return datetime(*(int(part or 0) for part in match.groups()), tzinfo=timezone.utc)
+    except ValueError:
+        # 0000:00:00 and friends
+        return None
+
+
+def parse_coordinate(value, ref=None):
+    """
+    Decimal degrees from exiftool's '40 deg 26\\' 46.00" N' format or a
+    plain number; South and West (from the value or ``ref``) are negative.
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        degrees, hemisphere = float(value), None
+    else:
+        match = COORDINATE_PATTERN.search(str(value))
+        if not match:
+            return None
+        degrees = float(match.group(1)) + float(match.group(2) or 0) / 60 + float(match.group(3) or 0) / 3600
+        hemisphere = match.group(4)
+    hemisphere = (hemisphere or str(ref or '')[:1]).upper()
+    if hemisphere in ('S', 'W'):
+        degrees = -abs(degrees)
+    return degrees
+
+
+def split_keywords(value):
+    """Keywords from a list or a comma/semicolon separated string, normalized and deduplicated"""
+    items = value if isinstance(value, list) else re.split(r'[,;]', str(value or ''))
+    keywords = []
+    for item in items:
+        keyword = ' '.join(str(item).split()).lower()[:MAX_KEYWORD_LENGTH]
+        if keyword and keyword not in keywords:
+            keywords.append(keyword)
+    return keywords
+
+
+def project_metadata(metadata):
+    """Searchable columns and keywords of organized metadata"""
+    metadata = metadata or {}
+    columns = {}
+    for column, sources in TEXT_SOURCES.items():
+        value = next((v for v in (field_value(metadata, *source) for source in sources) if v not in (None, '')), None)
+        if value is None:
+            columns[column] = ''
+        else:
+            columns[column] = normalize_owner(value) if column == 'copyright_owner' else normalize_text(value)
+
+    columns['date_taken'] = next(
+        (d for d in (parse_date(field_value(metadata, *source)) for source in DATE_SOURCES) if d), None)
+
+    latitude = parse_coordinate(field_value(metadata, 'EXIF', 'GPSLatitude'),
+                                field_value(metadata, 'EXIF', 'GPSLatitudeRef'))
+    longitude = parse_coordinate(field_value(metadata, 'EXIF', 'GPSLongitude'),
+                                 field_value(metadata, 'EXIF', 'GPSLongitudeRef'))
+    if latitude is None or longitude is None:
+        # Composite "lat N, lon W"
+        position = str(field_value(metadata, 'EXIF', 'GPSPosition') or '')
+        if ',' in position:
+            latitude, longitude = (parse_coordinate(part) for part in position.split(',', 1))
+    if latitude is None or longitude is None or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        latitude = longitude = None
+    columns['latitude'], columns['longitude'] = latitude, longitude
+
+    keywords = []
+    for source in KEYWORD_SOURCES:
+        for keyword in split_keywords(field_value(metadata, *source)):
+            if keyword not in keywords:
+                keywords.append(keyword)
+    return columns, keywords
@@ -1,11 +1,22 @@
-import subprocess
+import hashlib
 import json
+import logging
 import os
+import tempfile
+import warnings
 from pathlib import Path
 from io import BytesIO
 from PIL import Image
 from fnmatch import fnmatch
 
+from .exiftool_pool import get_exiftool_pool
+from .native_metadata import NativeMetadata, UnsupportedMetadata
+
+# Options for reading metadata: -a and -G for duplicate tags with their groups, -XMP:all for XMP
+EXIFTOOL_READ_ARGS = ('-a', '-G', '-XMP:all')
+
+logger = logging.getLogger(__name__)
+
 # Define your target schema for categorizing metadata
 TARGET_SCHEMA = {
     "EXIF": {
@@ -119,7 +130,307 @@ TARGET_SCHEMA = {
         }
 }
 
+# Optional schema properties copied into every organized field
+FIELD_PROPERTIES = ("readonly", "placeholder", "step", "min", "max")
+
+
+class SchemaIndex:
+    """
+    A metadata schema compiled once into reverse lookups, so organizing is a
+    single pass over the raw exiftool keys and embedding a dict lookup per
+    tag:
+
+    - ``lookup``: raw key -> [(priority, category, section, field)], the
+      priority being the position of the key among the field's candidates
+    - ``templates``: organized dict of every field, with the value unset
+    - ``write_targets``: (category, field) -> exiftool (group, tag)
+    - ``document``: the schema as served to clients, field properties
+      without values, identified by ``version`` (a hash of the schema)
+
+    Images store values only (see ``compact``): ``{'schema': version,
+    category: {field: value}, 'custom': {tag: value}}`` with unset fields
+    left out; ``expand`` merges them back into the organized form.
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.lookup = {}
+        self.templates = []
+        self.xmp_fields = []    # (name, category, section), for the "[XMP]" key scan
+        self.filename_fields = []
+        self.write_targets = {}
+        self.fields = set()     # (category, field)
+        self.version = hashlib.sha256(json.dumps(schema, sort_keys=True).encode()).hexdigest()[:12]
+        self.document = {category: {section: {} for section in sections} for category, sections in schema.items()}
+
+        for category, sections in schema.items():
+            for section, fields in sections.items():
+                for field in fields:
+                    name = field["name"]
+                    if category == "XMP":
+                        xmp_path = field.get("xmp_path", name)
+                        candidates = [
+                            xmp_path,
+                            f"XMP:{xmp_path}",
+                            f"XMP-{xmp_path.split(':')[0]}:{xmp_path.split(':')[1] if ':' in xmp_path else xmp_path}",
+                            f"XMP-dc:{name}" if "dc:" in xmp_path else None,
+                            f"XMP-xmp:{name}" if "xmp:" in xmp_path else None,
+                            f"XMP-xmpRights:{name}" if "xmpRights:" in xmp_path else None,
+                            f"XMP-photoshop:{name}" if "photoshop:" in xmp_path else None,
+                        ]
+                        self.xmp_fields.append((name, category, section))
+                        # embed_metadata used the first field of that name
+                        if (category, name) not in self.write_targets:
+                            if ':' in xmp_path:
+                                namespace, prop = xmp_path.split(':', 1)
+                                self.write_targets[(category, name)] = (f'XMP-{namespace}', prop)
+                            else:
+                                self.write_targets[(category, name)] = ('XMP', name)
+                    else:
+                        candidates = [name, f"{category}:{name}", f"{category.lower()}:{name}"]
+
+                    for priority, key in enumerate(k for k in candidates if k):
+                        entries = self.lookup.setdefault(key, [])
+                        if not any(e[1:] == (category, section, name) for e in entries):
+                            entries.append((priority, category, section, name))
+
+                    template = {"value": None, "type": field.get("type"), "label": field.get("label")}
+                    for prop in FIELD_PROPERTIES:
+                        if prop in field:
+                            template[prop] = field[prop]
+                    self.templates.append((category, section, name, template))
+                    self.fields.add((category, name))
+                    self.document[category][section][name] = {k: v for k, v in template.items() if k != "value"}
+                    if name == "FileName":
+                        self.filename_fields.append((category, section, name))
+
+    def values(self, raw_metadata, filename):
+        """(category, section, field) -> value of raw exiftool output, in one pass over its keys"""
+        found = {}  # (category, section, field) -> (priority, value)
+        xmp_scan = {}
+        for key, value in raw_metadata.items():
+            for priority, category, section, name in self.lookup.get(key, ()):
+                slot = (category, section, name)
+                if slot not in found or priority < found[slot][0]:
+                    found[slot] = (priority, value)
+            if "[XMP]" in key:
+                # Group-name style keys win over the candidates, first key first
+                for name, category, section in self.xmp_fields:
+                    if name in key:
+                        xmp_scan.setdefault((category, section, name), value)
+
+        values = {slot: value for slot, (_, value) in found.items()}
+        values.update(xmp_scan)
+        for slot in self.filename_fields:
+            values[slot] = filename
+        return values
+
+    def organize(self, raw_metadata, filename):
+        """Organize raw exiftool output by the schema, every field with its properties"""
+        values = self.values(raw_metadata, filename)
+        organized = {category: {section: {} for section in sections} for category, sections in self.schema.items()}
+        for category, section, name, template in self.templates:
+            field = template.copy()
+            field["value"] = values.get((category, section, name))
+            organized[category][section][name] = field
+        return organized
+
+    def compact(self, raw_metadata, filename):
+        """Values-only form of organize, as stored on UserImage.metadata"""
+        metadata = {'schema': self.version}
+        for (category, section, name), value in self.values(raw_metadata, filename).items():
+            if value is not None:
+                metadata.setdefault(category, {})[name] = value
+        return metadata
+
+    @staticmethod
+    def is_compact(metadata):
+        return isinstance(metadata, dict) and 'schema' in metadata
+
+    def compact_metadata(self, metadata):
+        """Values-only form of stored metadata, converting the organized form"""
+        if self.is_compact(metadata):
+            return metadata
+        compact = {'schema': self.version}
+        for category, sections in (metadata or {}).items():
+            if category == 'custom' and isinstance(sections, dict):
+                fields = sections.items()
+            elif category in self.schema and isinstance(sections, dict):
+                fields = [item for section in sections.values() if isinstance(section, dict) for item in section.items()]
+            else:
+                compact[category] = sections
+                continue
+            values = {}
+            for name, field in fields:
+                value = field.get("value") if isinstance(field, dict) else field
+                if value is not None:
+                    values[name] = value
+            if values:
+                compact[category] = values
+        return compact
+
+    def expand(self, metadata):
+        """Organized form of stored metadata: every schema field with its properties and value"""
+        if not self.is_compact(metadata):
+            return metadata or {}
+        organized = {}
+        for category, section, name, template in self.templates:
+            field = template.copy()
+            field["value"] = (metadata.get(category) or {}).get(name)
+            organized.setdefault(category, {}).setdefault(section, {})[name] = field
+        for category, values in metadata.items():
+            if category == 'custom':
+                organized['custom'] = {name: {'value': value, 'type': 'string', 'label': name}
+                                       for name, value in values.items()}
+            elif category != 'schema' and category not in self.schema:
+                organized[category] = values
+        return organized
+
+    def has_field(self, category, name):
+        return (category, name) in self.fields
+
+    def set_value(self, metadata, category, name, value):
+        """
+        Set a field of compact metadata; None unsets it. Returns False for
+        fields the schema doesn't have (custom fields are free-form).
+        """
+        if category != 'custom' and not self.has_field(category, name):
+            return False
+        values = metadata.setdefault(category, {})
+        if value is None:
+            values.pop(name, None)
+        else:
+            values[name] = value
+        return True
+
+    def write_target(self, category, name):
+        """exiftool (group, tag) that a field of the organized metadata is written as"""
+        target = self.write_targets.get((category, name))
+        if target is not None:
+            return target
+        return ('XMP', name) if category == 'XMP' else (category, name)
+
+
+SCHEMA_INDEX = SchemaIndex(TARGET_SCHEMA)
+
+# Leading magic bytes of the image formats we accept, mapped to MIME types
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'II*\x00', 'image/tiff'),
+    (b'MM\x00*', 'image/tiff'),
+    (b'BM', 'image/bmp'),
+]
+
+# UserImage.file_type values used by the gallery filters
+MIME_FILE_TYPES = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/gif': 'gif',
+    'image/tiff': 'tiff',
+    'image/bmp': 'bmp',
+    'image/webp': 'webp',
+    'image/avif': 'avif',
+    'image/heic': 'heic',
+}
+
+# Largest image accepted, in pixels (settings.IMAGE_MAX_PIXELS). Anything
+# bigger is rejected from its header, before a pixel buffer is allocated.
+DEFAULT_MAX_PIXELS = 250_000_000
+
+# EXIF orientations that rotate the image by 90 degrees
+ROTATED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+class ImageTooLarge(InvalidImage):
+    pass
+
+
+def max_image_pixels():
+    from django.conf import settings
+    if not settings.configured:
+        return DEFAULT_MAX_PIXELS
+    return getattr(settings, 'IMAGE_MAX_PIXELS', DEFAULT_MAX_PIXELS)
+
+# PIL warns above MAX_IMAGE_PIXELS and refuses twice that; keep its check in
+# line with ours so every image that passes the probe can also be decoded
+Image.MAX_IMAGE_PIXELS = max_image_pixels()
+
+
 class MetadataExtractor:
+    @staticmethod
+    def probe_image(source, max_pixels=None):
+        """
+        Read the dimensions, color mode and format of an image from its
+        headers only; PIL opens lazily and nothing is decoded. Width and
+        height are as displayed (EXIF orientation applied). Raises
+        ImageTooLarge above ``max_pixels`` and InvalidImage if the data is
+        not a readable image. ``source`` is a path or seekable file object.
+        """
+        max_pixels = max_pixels or max_image_pixels()
+        position = source.tell() if hasattr(source, 'tell') else None
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+                with Image.open(source) as img:
+                    width, height = img.size
+                    image_format, color_mode = img.format, img.mode
+                    try:
+                        orientation = img.getexif().get(0x0112, 1)
+                    except Exception:
+                        orientation = 1
+        except Image.DecompressionBombError as e:
+            raise ImageTooLarge(str(e))
+        except Exception as e:
+            raise InvalidImage(f"Not a readable image: {e}")
+        finally:
+            if position is not None:
+                source.seek(position)
+
+        if width * height > max_pixels:
+            raise ImageTooLarge(
+                f"Image is {width}x{height} ({width * height / 1e6:.1f} MP); "
+                f"the limit is {max_pixels / 1e6:.1f} MP")
+        if orientation in ROTATED_ORIENTATIONS:
+            width, height = height, width
+        return {
+            'width': width,
+            'height': height,
+            'megapixels': round(width * height / 1e6, 2),
+            'format': image_format or '',
+            'color_mode': color_mode or '',
+        }
+
+    @staticmethod
+    def sniff_mime_type(data, default='application/octet-stream'):
+        """
+        Guess the MIME type of an image from its first bytes.
+        """
+        head = bytes(data[:16])
+        for signature, mime_type in IMAGE_SIGNATURES:
+            if head.startswith(signature):
+                return mime_type
+        if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+            return 'image/webp'
+        if head[4:8] == b'ftyp' and head[8:12] in (b'avif', b'avis'):
+            return 'image/avif'
+        if head[4:8] == b'ftyp' and head[8:12] in (b'heic', b'heix', b'mif1'):
+            return 'image/heic'
+        return default
+
+    @staticmethod
+    def file_type_for_mime(mime_type, default='unknown'):
+        """
+        Short file type stored on UserImage (e.g. 'jpg') for a MIME type.
+        """
+        return MIME_FILE_TYPES.get(mime_type, default)
+
     @staticmethod
     def run_exiftool(image_path):
         """
@@ -127,110 +438,114 @@ class MetadataExtractor:
         Added -a and -G flags to get all possible metadata including XMP.
         """
         try:
-            result = subprocess.run(
-                ['exiftool', '-j', '-a', '-G', '-XMP:all', image_path],
-                capture_output=True, text=True, check=True
-            )
-            data = json.loads(result.stdout)
-            return data[0] if data else {}
+            return get_exiftool_pool().get_metadata(image_path, *EXIFTOOL_READ_ARGS)
         except Exception as e:
             print(f"Error running exiftool: {e}")
             return {}
 
+    @staticmethod
+    def read_metadata(image_path):
+        """
+        Raw metadata of an image file: read in-process for the common
+        formats, with exiftool for everything else.
+        """
+        try:
+            with open(image_path, 'rb') as f:
+                return NativeMetadata.read(f.read())
+        except UnsupportedMetadata:
+            return MetadataExtractor.run_exiftool(image_path)
+
     @staticmethod
     def extract_metadata(image_path):
         """
-        Extract metadata from an image and organize it based on TARGET_SCHEMA.
-        Includes file name and full path information.
+        Extract metadata from an image as the values of the TARGET_SCHEMA
+        fields it has (SchemaIndex.compact), file name included.
         """
         # Ensure we have the full path and filename
         full_path = os.path.abspath(image_path)
         filename = os.path.basename(image_path)
 
-        raw_metadata = MetadataExtractor.run_exiftool(image_path)
-        organized = {}
+        raw_metadata = MetadataExtractor.read_metadata(image_path)
 
         # Debug: Print full metadata to identify XMP fields
         print("DEBUG: Raw metadata keys:")
         print(json.dumps(list(raw_metadata.keys()), indent=2))
 
-        # Loop through each category and its sections defined in TARGET_SCHEMA
-        for category, sections in TARGET_SCHEMA.items():
-            organized[category] = {}
-            for section, fields in sections.items():
-                organized[category][section] = {}
-                for field in fields:
-                    field_name = field["name"]
-                    value = None
+        return SCHEMA_INDEX.compact(raw_metadata, filename)
 
-                    # For XMP data, look for the right keys with more detailed matching
-                    if category == "XMP":
-                        # Look for XMP data with various possible keys
-                        xmp_path = field.get("xmp_path", field_name)
-
-                        # Try these variations of XMP keys
-                        possible_keys = [
-                            xmp_path,
-                            f"XMP:{xmp_path}",
-                            f"XMP-{xmp_path.split(':')[0]}:{xmp_path.split(':')[1] if ':' in xmp_path else xmp_path}",
-                            f"XMP-dc:{field_name}" if "dc:" in xmp_path else None,
-                            f"XMP-xmp:{field_name}" if "xmp:" in xmp_path else None,
-                            f"XMP-xmpRights:{field_name}" if "xmpRights:" in xmp_path else None,
-                            f"XMP-photoshop:{field_name}" if "photoshop:" in xmp_path else None
-                        ]
-
-                        # Filter out None values
-                        possible_keys = [k for k in possible_keys if k]
+    @staticmethod
+    def extract_metadata_bytes(data, filename, suffix=''):
+        """
+        extract_metadata for an image in memory. Only formats the native
+        reader doesn't handle are written to a temporary file for exiftool.
+        """
+        try:
+            raw_metadata = NativeMetadata.read(data)
+        except UnsupportedMetadata:
+            fd, temp_path = tempfile.mkstemp(suffix=suffix)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                raw_metadata = MetadataExtractor.run_exiftool(temp_path)
+            finally:
+                os.remove(temp_path)
+        return SCHEMA_INDEX.compact(raw_metadata, filename)
 
-                        # Try each possible key
-                        for key in possible_keys:
-                            if key in raw_metadata:
-                                value = raw_metadata[key]
-                                break
+    @staticmethod
+    def extract_metadata_batch(image_paths):
+        """
+        extract_metadata for many files, for backfills. Files the native
+        reader can't handle share a single exiftool request. Returns the
+        organized metadata in the order of the paths; raises ExifToolError
+        if exiftool is needed and can't be run.
+        """
+        raw = {}
+        for path in image_paths:
+            try:
+                with open(path, 'rb') as f:
+                    raw[path] = NativeMetadata.read(f.read())
+            except UnsupportedMetadata:
+                pass
+        remaining = [path for path in image_paths if path not in raw]
+        if remaining:
+            raw.update(zip(remaining, get_exiftool_pool().get_metadata_batch(remaining, *EXIFTOOL_READ_ARGS)))
+        return [SCHEMA_INDEX.compact(raw[path], os.path.basename(path)) for path in image_paths]
 
-                        # Try with group name format ExifTool might use
-                        for key in raw_metadata:
-                            if "[XMP]" in key and field_name in key:
-                                value = raw_metadata[key]
-                                break
-                    else:
-                        # Handle EXIF and IPTC similar to before
-                        possible_keys = [
-                            field_name,
-                            f"{category}:{field_name}",
-                            f"{category.lower()}:{field_name}"
-                        ]
-                        for key in possible_keys:
-                            if key in raw_metadata:
-                                value = raw_metadata[key]
-                                break
-
-                    # Special handling for filename
-                    if field_name == "FileName":
-                        value = filename
-
-                    # Create a metadata object that includes schema properties
-                    metadata_obj = {
-                        "value": value,
-                        "type": field.get("type"),
-                        "label": field.get("label")
-                    }
-
-                    # Add optional properties if they exist in the schema
-                    if "readonly" in field:
-                        metadata_obj["readonly"] = field["readonly"]
-                    if "placeholder" in field:
-                        metadata_obj["placeholder"] = field["placeholder"]
-                    if "step" in field:
-                        metadata_obj["step"] = field["step"]
-                    if "min" in field:
-                        metadata_obj["min"] = field["min"]
-                    if "max" in field:
-                        metadata_obj["max"] = field["max"]
-
-                    organized[category][section][field_name] = metadata_obj
+    @staticmethod
+    def organize_by_schema(raw_metadata, filename):
+        """Organize raw exiftool output based on TARGET_SCHEMA"""
+        return SCHEMA_INDEX.organize(raw_metadata, filename)
 
-        return organized
+    @staticmethod
+    def metadata_assignments(metadata):
+        """
+        Flatten stored (compact) or organized metadata into (group, tag,
+        value) assignments, the ``-group:tag=value`` arguments of exiftool.
+        """
+        assignments = []
+        if SCHEMA_INDEX.is_compact(metadata):
+            for main_cat in ('EXIF', 'IPTC', 'XMP'):
+                for tag, value in (metadata.get(main_cat) or {}).items():
+                    if value is not None and tag != "FileName":
+                        group, target = SCHEMA_INDEX.write_target(main_cat, tag)
+                        assignments.append((group, target, value))
+            return assignments
+        for main_cat, subcats in metadata.items():
+            if main_cat in ['EXIF', 'IPTC', 'XMP']:
+                for subcat, tags in subcats.items():
+                    for tag, value_obj in tags.items():
+                        # Extract the actual value from the value object
+                        value = value_obj.get("value") if isinstance(value_obj, dict) else value_obj
+                        if value is None:
+                            continue
+
+                        # Skip filename handling as we're using the path filename
+                        if tag == "FileName":
+                            continue
+
+                        group, target = SCHEMA_INDEX.write_target(main_cat, tag)
+                        assignments.append((group, target, value))
+        return assignments
 
     @staticmethod
     def embed_metadata(image_path, metadata):
@@ -239,60 +554,44 @@ class MetadataExtractor:
         Updated to better handle XMP data.
         """
         try:
-            command = ['exiftool', '-overwrite_original']
-
             # Get filename from the image path
             current_filename = os.path.basename(image_path)
             print(current_filename)
 
-            # Flatten organized metadata into exiftool arguments
-            for main_cat, subcats in metadata.items():
-                if main_cat in ['EXIF', 'IPTC', 'XMP']:
-                    for subcat, tags in subcats.items():
-                        for tag, value_obj in tags.items():
-                            # Extract the actual value from the value object
-                            value = value_obj.get("value") if isinstance(value_obj, dict) else value_obj
-                            if value is None:
-                                continue
-
-                            # Skip filename handling as we're using the path filename
-                            if tag == "FileName":
-                                continue
-
-                            # Handle XMP data with special consideration for namespaces
-                            if main_cat == 'XMP':
-                                # Find the original XMP path from schema
-                                xmp_path = None
-                                for section in TARGET_SCHEMA['XMP'].values():
-                                    for field in section:
-                                        if field['name'] == tag:
-                                            xmp_path = field.get('xmp_path', tag)
-                                            break
-                                    if xmp_path:
-                                        break
-
-                                if xmp_path and ':' in xmp_path:
-                                    namespace, prop = xmp_path.split(':', 1)
-                                    command.append(f'-XMP-{namespace}:{prop}={value}')
-                                else:
-                                    command.append(f'-XMP:{tag}={value}')
-                            else:
-                                command.append(f'-{main_cat}:{tag}={value}')
+            assignments = MetadataExtractor.metadata_assignments(metadata)
 
-            # Add the image path to the command
+            # Common fields in JPEG and PNG are written in-process
+            try:
+                with open(image_path, 'rb') as f:
+                    data = NativeMetadata.write(f.read(), assignments)
+                temp_path = f"{image_path}.tmp"
+                with open(temp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(temp_path, image_path)
+                return {
+                    "success": True,
+                    "filename": current_filename,
+                    "full_path": image_path
+                }
+            except UnsupportedMetadata as e:
+                logger.debug(f"Embedding with exiftool ({e})")
+
+            command = ['-overwrite_original']
+            command += [f'-{group}:{tag}={value}' for group, tag, value in assignments]
             command.append(image_path)
 
             # Debug: Print the command
             print(f"DEBUG: ExifTool command: {' '.join(command)}")
 
-            # Execute the exiftool command
-            result = subprocess.run(command, capture_output=True, text=True)
+            # Execute the exiftool command on a pooled worker. There is no
+            # exit status with -stay_open, so failures are read from the output
+            stdout, stderr = get_exiftool_pool().execute(*command)
 
-            if result.returncode != 0:
-                print(f"Metadata embedding failed: {result.stderr}")
+            if any(line.startswith('Error') for line in stderr.splitlines()) or "weren't updated" in stdout:
+                print(f"Metadata embedding failed: {stderr}")
                 return {
                     "success": False,
-                    "error": result.stderr,
+                    "error": stderr,
                     "full_path": image_path
                 }
 
@@ -310,6 +609,31 @@ class MetadataExtractor:
                 "full_path": image_path
             }
 
+    @staticmethod
+    def embed_metadata_bytes(data, metadata, suffix='.png'):
+        """
+        embed_metadata for an image in memory; returns the new bytes. Only
+        when exiftool is needed does the image go through a temporary file.
+        Raises ValueError if embedding fails.
+        """
+        assignments = MetadataExtractor.metadata_assignments(metadata)
+        try:
+            return NativeMetadata.write(data, assignments)
+        except UnsupportedMetadata:
+            pass
+
+        fd, temp_path = tempfile.mkstemp(suffix=suffix)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            result = MetadataExtractor.embed_metadata(temp_path, metadata)
+            if not result['success']:
+                raise ValueError(result.get('error') or "Metadata embedding failed")
+            with open(temp_path, 'rb') as f:
+                return f.read()
+        finally:
+            os.remove(temp_path)
+
     @staticmethod
     def organize_metadata(raw_metadata):
         """
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0028_userprofile_notify_on_access_request_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userimage',
+            name='mime_type',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
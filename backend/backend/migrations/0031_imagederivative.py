@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0030_userimage_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageDerivative',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('width', models.PositiveIntegerField()),
+                ('pixel_width', models.PositiveIntegerField()),
+                ('pixel_height', models.PositiveIntegerField()),
+                ('format', models.CharField(default='webp', max_length=10)),
+                ('file', models.FileField(upload_to='derivatives/')),
+                ('file_size', models.IntegerField(default=0)),
+                ('content_hash', models.CharField(blank=True, max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user_image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='derivatives', to='backend.userimage')),
+            ],
+            options={
+                'ordering': ['width'],
+                'unique_together': {('user_image', 'width', 'format')},
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0033_uploadsession'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='imagederivative',
+            name='file',
+            field=models.FileField(db_index=True, upload_to='derivatives/'),
+        ),
+        migrations.AddIndex(
+            model_name='userimage',
+            index=models.Index(fields=['user', 'content_hash'], name='userimage_user_hash_idx'),
+        ),
+    ]
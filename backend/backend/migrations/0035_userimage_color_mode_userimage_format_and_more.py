@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0034_alter_imagederivative_file_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userimage',
+            name='color_mode',
+            field=models.CharField(blank=True, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='userimage',
+            name='format',
+            field=models.CharField(blank=True, db_index=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='userimage',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userimage',
+            name='megapixels',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userimage',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, db_index=True, null=True),
+        ),
+    ]
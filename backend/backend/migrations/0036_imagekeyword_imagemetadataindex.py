@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0035_userimage_color_mode_userimage_format_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageKeyword',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('keyword', models.CharField(max_length=100)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('user_image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='keywords', to='backend.userimage')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'keyword'], name='imagekeyword_user_kw_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user_image', 'keyword'), name='imagekeyword_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ImageMetadataIndex',
+            fields=[
+                ('user_image', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='metadata_index', serialize=False, to='backend.userimage')),
+                ('camera_make', models.CharField(blank=True, db_index=True, max_length=255)),
+                ('camera_model', models.CharField(blank=True, db_index=True, max_length=255)),
+                ('lens', models.CharField(blank=True, db_index=True, max_length=255)),
+                ('creator', models.CharField(blank=True, db_index=True, max_length=255)),
+                ('copyright_owner', models.CharField(blank=True, db_index=True, max_length=255)),
+                ('date_taken', models.DateTimeField(blank=True, null=True)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'date_taken'], name='metaindex_user_taken_idx'), models.Index(fields=['user', 'latitude', 'longitude'], name='metaindex_user_gps_idx')],
+            },
+        ),
+    ]
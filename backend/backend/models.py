@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from pathlib import Path
 from django.db.models.signals import post_save
@@ -6,6 +6,7 @@ from django.dispatch import receiver
 from django.utils import timezone
 from datetime import timedelta
 import secrets
+import uuid
 
 from PIL import Image
 from io import BytesIO
@@ -19,6 +20,14 @@ class UserImage(models.Model):
     image_name = models.CharField(max_length=255, blank=True)  # Remove default
     file_size = models.IntegerField(default=0)  # in bytes
     file_type = models.CharField(max_length=10, default='unknown')
+    mime_type = models.CharField(max_length=100, blank=True)  # of the original upload, sniffed
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)  # ContentHasher of the original
+    # Read from the headers at upload (MetadataExtractor.probe_image), as displayed
+    width = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    height = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    megapixels = models.FloatField(null=True, blank=True, db_index=True)
+    format = models.CharField(max_length=20, blank=True, db_index=True)  # PIL format, e.g. 'JPEG'
+    color_mode = models.CharField(max_length=10, blank=True)  # PIL mode, e.g. 'RGB'
     created_at = models.DateTimeField(auto_now_add=True)
 
     # Protection status fields
@@ -33,94 +42,239 @@ class UserImage(models.Model):
     encryption_key = models.CharField(max_length=255, blank=True, null=True)
     encryption_params = models.JSONField(default=dict, blank=True)  # To store permutation and XOR streams
 
+    class Meta:
+        indexes = [
+            # Per-user content-addressed lookups (deduplication)
+            models.Index(fields=['user', 'content_hash'], name='userimage_user_hash_idx'),
+        ]
+
+    PROBE_FIELDS = ('width', 'height', 'megapixels', 'format', 'color_mode')
+
     def __str__(self):
         return f"{self.user.username}'s image - {self.image_name}"
 
+    @classmethod
+    def find_duplicate(cls, user, content_hash):
+        """
+        The user's oldest encrypted image with this content hash, locked
+        with SELECT ... FOR UPDATE so it can't be deleted while its file is
+        being shared. Call inside a transaction.
+        """
+        if not content_hash:
+            return None
+        return (cls.objects.select_for_update()
+                .filter(user=user, content_hash=content_hash)
+                .exclude(encryption_key__isnull=True).exclude(encryption_key='')
+                .order_by('id')
+                .first())
+
+    def duplicate(self, image_name=None):
+        """
+        Create another image of the same user that shares this one's
+        encrypted file, key, metadata and derivatives, so a re-upload needs
+        no processing. If this image hasn't been processed yet (its
+        process_upload job is pending, or it has no metadata or derivatives)
+        the copy gets its own job, set as ``upload_job``. The file is only
+        deleted once no image refers to it (see release_user_image_file).
+        Protection settings are not copied.
+        """
+        derivatives = list(self.derivatives.all())
+        processing = Job.objects.filter(kind='process_upload', payload__image_id=self.pk,
+                                        status__in=['queued', 'running']).exists()
+        copy = UserImage(
+            user_id=self.user_id,
+            image=self.image.name,
+            image_name=image_name or self.image_name,
+            file_size=self.file_size,
+            file_type=self.file_type,
+            mime_type=self.mime_type,
+            content_hash=self.content_hash,
+            metadata=self.metadata,
+            metadata_enabled=self.metadata_enabled,
+            encryption_key=self.encryption_key,
+            encryption_params=self.encryption_params,
+            **{field: getattr(self, field) for field in self.PROBE_FIELDS},
+        )
+        # bulk_create skips save(), which would queue processing for a new upload
+        copy = UserImage.objects.bulk_create([copy])[0]
+        ImageMetadataIndex.sync_many([copy])
+        ImageDerivative.objects.bulk_create([
+            ImageDerivative(
+                user_image=copy,
+                width=derivative.width,
+                pixel_width=derivative.pixel_width,
+                pixel_height=derivative.pixel_height,
+                format=derivative.format,
+                file=derivative.file.name,
+                file_size=derivative.file_size,
+                content_hash=derivative.content_hash,
+            )
+            for derivative in derivatives
+        ])
+        if processing or not self.metadata or not derivatives:
+            from .jobs import enqueue
+            copy.upload_job = enqueue('process_upload', {'image_id': copy.pk}, user_id=copy.user_id)
+        return copy
+
     def save(self, *args, **kwargs):
         new_upload = not self.id  # Check if it's a new upload
 
-        # For new uploads with an image
-        if new_upload and self.image:
-            # First save to get an ID and save the original image file
+        if new_upload and self.image and self.encryption_key:
+            # Already encrypted on the way in (resumable uploads), just queue post-processing
             super().save(*args, **kwargs)
-
-            # Now we can access the image path
-            image_path = self.image.path
-            print('IMAGE NAME',self.image.name)
-
-            # Extract metadata as before
-            try:
-                self.metadata = MetadataExtractor.extract_metadata(image_path)
-                self.metadata_enabled = True
-            except Exception as e:
-                print(f"Metadata extraction failed: {str(e)}")
-                self.metadata = {}
-                self.metadata_enabled = False
-
-            # Generate encryption key with improved randomness
-            import hashlib
+            from .jobs import enqueue
+            self.upload_job = enqueue('process_upload', {'image_id': self.id}, user=self.user)
+        # For new uploads with an image
+        elif new_upload and self.image:
             import secrets
-            import time
-            import os
-            import random
-
-            salt = secrets.token_hex(8)
-            current_time = str(time.time())
-            random_num = str(random.randint(100000, 999999999))
-            process_id = str(os.getpid())
-
-            # Generate a secure key for AES encryption
-            encryption_key = hashlib.sha256(
-                f"{self.user.id}:{self.id}:{salt}:{current_time}:{random_num}:{process_id}".encode()
-            ).digest()[:32]  # Use binary digest for AES, only need 32 bytes
-
-            # Store hex string of key in database
-            self.encryption_key = encryption_key.hex()
-
-            # Encrypt the image using AES
-            from .encryption import encrypt_aes_cbc
-
-            # Read the original file
-            with open(image_path, 'rb') as f:
-                original_data = f.read()
-
-            # Encrypt the data
-            encrypted_data = encrypt_aes_cbc(original_data, encryption_key)
-
-            # Save the encrypted file
-            import tempfile
-            from django.core.files.base import ContentFile
+            from django.core.files import File
+            from django.db import transaction
             from pathlib import Path
+            from .encryption import StreamEncryptor, SEGMENT_SIZE, FORMAT_VERSION_GCM_STREAM
 
-            file_name = f"{Path(self.image.name).stem}.enc"
-            print('FILE NAME',file_name)
-
-            # Replace the original file with the encrypted version
-            self.image.save(file_name, ContentFile(encrypted_data), save=False)
-
-            os.remove(image_path)
+            # Generate a random key for AES encryption and store its hex string
+            encryption_key = secrets.token_bytes(32)
+            self.encryption_key = encryption_key.hex()
 
-            # Update other fields
-            self.image_name = Path(file_name).stem
-            self.file_type = 'png'  # Custom file type for encrypted files
+            # Encrypt the incoming upload straight into its final storage name,
+            # one segment at a time; the plaintext never reaches MEDIA_ROOT
+            source = self.image.file
+            upload_name = self.image.name
+            source.seek(0)
+            # Record the real format so the original bytes can be served as-is
+            self.mime_type = MetadataExtractor.sniff_mime_type(source.read(16))
+            self.file_type = MetadataExtractor.file_type_for_mime(
+                self.mime_type, Path(upload_name).suffix.lstrip('.').lower()[:10] or 'unknown')
+            source.seek(0)
+            # Dimensions and format from the headers; also refuses decompression bombs
+            for field, value in MetadataExtractor.probe_image(source).items():
+                setattr(self, field, value)
+
+            file_name = f"{Path(upload_name).stem}.enc"
+            encryptor = StreamEncryptor(source, encryption_key, size=source.size)
+            self.image.save(file_name, File(encryptor, name=file_name), save=False)
+            self.content_hash = encryptor.content_hash
+
+            self.image_name = Path(self.image.name).stem
             self.file_size = self.image.size
 
             # No need to store permutation params for AES
             self.encryption_params = {
-                'algorithm': 'AES-CBC',
+                'algorithm': 'AES-GCM-STREAM',
+                'version': FORMAT_VERSION_GCM_STREAM,
+                'segment_size': SEGMENT_SIZE,
                 'key_length': len(encryption_key) * 8  # in bits
             }
 
-            # Save the changes with update_fields
-            super().save(update_fields=[
-                'metadata', 'metadata_enabled', 'encryption_key', 'encryption_params',
-                'image', 'image_name', 'file_type', 'file_size'
-            ])
+            # One INSERT, together with the job that runs metadata extraction
+            # and thumbnails off the request path
+            from .jobs import enqueue
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                    self.upload_job = enqueue('process_upload', {'image_id': self.id}, user=self.user)
+            except Exception:
+                self.image.storage.delete(self.image.name)
+                raise
         else:
             # For updates or records without images, just save normally
             super().save(*args, **kwargs)
-    def get_decrypted_image(self):
-        """Return the decrypted image as a numpy array"""
+    def extract_metadata(self):
+        """
+        Extract metadata from the decrypted original and store it. Common
+        formats are read in memory; for the rest the plaintext is written to
+        a private temporary file outside MEDIA_ROOT for exiftool, for the
+        duration of the extraction only.
+        """
+        import os
+        suffix = f".{self.file_type}" if self.file_type not in ('', 'unknown') else ''
+        try:
+            self.metadata = MetadataExtractor.extract_metadata_bytes(
+                self.get_decrypted_bytes(), os.path.basename(self.image.name), suffix=suffix)
+            self.metadata_enabled = True
+        except Exception as e:
+            print(f"Metadata extraction failed: {str(e)}")
+            self.metadata = {}
+            self.metadata_enabled = False
+        super().save(update_fields=['metadata', 'metadata_enabled'])
+
+    @classmethod
+    def update_metadata(cls, image_id, user, assignments):
+        """
+        Apply (category, field, value) edits to an image's stored metadata,
+        None unsetting a field, and return the new metadata (None if the
+        image isn't the user's). See update_metadata_many.
+        """
+        return cls.update_metadata_many([image_id], user, assignments).get(image_id)
+
+    @classmethod
+    def update_metadata_many(cls, image_ids, user, assignments):
+        """
+        Apply the same (category, field, value) edits to the stored metadata
+        of the user's images among ``image_ids``; returns {id: metadata}. On
+        PostgreSQL this is one UPDATE of jsonb_set expressions, so concurrent
+        edits of other fields don't overwrite each other and only the touched
+        categories are rebuilt.
+        """
+        import json
+        from django.db import connection
+        from .metadata_utils import SCHEMA_INDEX
+
+        assignments = [a for a in assignments if a[0] == 'custom' or SCHEMA_INDEX.has_field(a[0], a[1])]
+        image_ids = list(image_ids)
+        updated = {}
+        if connection.vendor == 'postgresql' and image_ids:
+            changes = {}  # category -> (fields to set, fields to remove)
+            for category, name, value in assignments:
+                sets, removes = changes.setdefault(category, ({}, []))
+                if value is None:
+                    sets.pop(name, None)
+                    removes.append(name)
+                else:
+                    sets[name] = value
+                    if name in removes:
+                        removes.remove(name)
+
+            expression, params = 'metadata', []
+            for category, (sets, removes) in changes.items():
+                # Each category is rebuilt from the stored one, so the chain
+                # only reads the column, never an earlier step's output
+                expression = (f"jsonb_set({expression}, %s, "
+                              f"(COALESCE(metadata -> %s, '{{}}'::jsonb) || %s::jsonb) - %s::text[])")
+                params += [[category], category, json.dumps(sets), removes]
+
+            field = cls._meta.get_field('metadata')
+            with transaction.atomic(), connection.cursor() as cursor:
+                # Rows still in the organized form (no 'schema' key) fall through to be converted
+                cursor.execute(
+                    f"UPDATE {cls._meta.db_table} SET metadata = {expression} "
+                    f"WHERE id = ANY(%s) AND user_id = %s AND metadata ? 'schema' RETURNING id, metadata",
+                    params + [image_ids, user.id])
+                for image_id, metadata in cursor.fetchall():
+                    updated[image_id] = field.from_db_value(metadata, None, connection)
+                ImageMetadataIndex.sync_many([cls(pk=image_id, user_id=user.id, metadata=metadata)
+                                              for image_id, metadata in updated.items()])
+            image_ids = [image_id for image_id in image_ids if image_id not in updated]
+            if not image_ids:
+                return updated
+
+        with transaction.atomic():
+            images = list(cls.objects.select_for_update().filter(id__in=image_ids, user=user).only('id', 'user_id', 'metadata'))
+            for image in images:
+                image.metadata = SCHEMA_INDEX.compact_metadata(image.metadata)
+                for category, name, value in assignments:
+                    SCHEMA_INDEX.set_value(image.metadata, category, name, value)
+                updated[image.pk] = image.metadata
+            cls.objects.bulk_update(images, ['metadata'])
+            ImageMetadataIndex.sync_many(images)
+        return updated
+
+    def get_decrypted_image(self, min_width=None):
+        """
+        Return the decrypted image as a numpy array. With ``min_width`` the
+        decoder may downscale by 1/2, 1/4 or 1/8 while decoding, as long as
+        the result stays at least that wide.
+        """
         try:
             if not self.encryption_key or not self.encryption_params:
                 # If not encrypted, just read the image directly
@@ -131,28 +285,13 @@ class UserImage(models.Model):
                     raise ValueError(f"Failed to read image at {self.image.path}")
                 return img
 
-            # Read the encrypted image file
-            with open(self.image.path, 'rb') as f:
-                encrypted_data = f.read()
-
-            # Convert hex encryption key to bytes
-            encryption_key = bytes.fromhex(self.encryption_key)
-
-            # Decrypt the data using AES
-            from .encryption import decrypt_aes_cbc
-            decrypted_data = decrypt_aes_cbc(encrypted_data, encryption_key)
+            decrypted_data = self.get_decrypted_bytes()
 
-            # Convert decrypted bytes to numpy array for OpenCV
+            # Decode straight from the decrypted buffer, without intermediate copies
             import cv2
             import numpy as np
-
-            # Create in-memory file-like object
-            import io
-            buffer = io.BytesIO(decrypted_data)
-
-            # Decode image from memory buffer
-            image_array = np.asarray(bytearray(buffer.read()), dtype=np.uint8)
-            img = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
+            flags = self._reduced_decode_flags(decrypted_data, min_width, self.width) if min_width else cv2.IMREAD_COLOR
+            img = cv2.imdecode(np.frombuffer(decrypted_data, dtype=np.uint8), flags)
 
             if img is None:
                 raise ValueError("Failed to decode decrypted image data")
@@ -165,6 +304,79 @@ class UserImage(models.Model):
             print(traceback.format_exc())
             raise
 
+    @staticmethod
+    def _reduced_decode_flags(data, min_width, width=None):
+        """
+        Largest cv2.IMREAD_REDUCED_COLOR_* factor that keeps the image at
+        least min_width wide. ``width`` is the stored display width, if known.
+        """
+        import cv2
+        if not width:
+            try:
+                # The header is enough for the size and orientation
+                width = MetadataExtractor.probe_image(BytesIO(data[:256 * 1024]))['width']
+            except Exception:
+                return cv2.IMREAD_COLOR
+        for factor, flags in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                              (2, cv2.IMREAD_REDUCED_COLOR_2)):
+            if width // factor >= min_width:
+                return flags
+        return cv2.IMREAD_COLOR
+
+    def get_derivative(self, width):
+        """Smallest derivative at least ``width`` wide, else the largest; None if there are none"""
+        derivatives = sorted(self.derivatives.all(), key=lambda d: d.width)
+        for derivative in derivatives:
+            if derivative.pixel_width >= width:
+                return derivative
+        return derivatives[-1] if derivatives else None
+
+    def get_decrypted_bytes(self):
+        """Return the original file bytes as a memoryview over one decrypted buffer"""
+        if not self.encryption_key or not self.encryption_params:
+            with open(self.image.path, 'rb') as f:
+                return memoryview(f.read())
+
+        # Convert hex encryption key to bytes
+        encryption_key = bytes.fromhex(self.encryption_key)
+        # The header tells AES-GCM containers from legacy AES-CBC
+        from .encryption import decrypt_file_buffer
+        return decrypt_file_buffer(self.image.path, encryption_key)
+
+    def open_decrypted(self):
+        """
+        Seekable file object over the original upload. AES-GCM containers
+        are decrypted segment by segment as they are read, so reading just
+        the headers costs one segment; other formats are decrypted in full.
+        """
+        import io
+        from .encryption import DecryptedReader, SegmentIndex
+        if self.encryption_key and self.encryption_params:
+            f = open(self.image.path, 'rb')
+            index = SegmentIndex.from_file(f)
+            if index is not None:
+                return io.BufferedReader(DecryptedReader(f, bytes.fromhex(self.encryption_key), index))
+            f.close()
+        return io.BytesIO(self.get_decrypted_bytes())
+
+    def get_segment_index(self):
+        """
+        Return the SegmentIndex of the encrypted file, or None when the image
+        is not stored in the seekable AES-GCM container (unencrypted or legacy AES-CBC).
+        """
+        if not self.encryption_key or not self.encryption_params:
+            return None
+        from .encryption import SegmentIndex
+        with open(self.image.path, 'rb') as f:
+            return SegmentIndex.from_file(f)
+
+    def iter_decrypted_range(self, start, end, index=None):
+        """Yield the decrypted bytes start..end (inclusive) of the original upload"""
+        from .encryption import iter_decrypt_range
+        encryption_key = bytes.fromhex(self.encryption_key)
+        with open(self.image.path, 'rb') as f:
+            yield from iter_decrypt_range(f, encryption_key, start, end, index)
+
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     avatar = models.ImageField(upload_to='avatars/', null=True, blank=True)
@@ -415,3 +627,229 @@ class AIProtectionSettings(models.Model):
 
     def __str__(self):
         return f"AI Protection for {self.user_image.image_name}"
+
+class ImageDerivative(models.Model):
+    """Downscaled copy of a UserImage, encrypted with the parent's key (see derivatives.py)"""
+    user_image = models.ForeignKey(UserImage, on_delete=models.CASCADE, related_name='derivatives')
+    width = models.PositiveIntegerField()  # nominal pyramid width
+    pixel_width = models.PositiveIntegerField()
+    pixel_height = models.PositiveIntegerField()
+    format = models.CharField(max_length=10, default='webp')
+    file = models.FileField(upload_to='derivatives/', db_index=True)  # shared by deduplicated images
+    file_size = models.IntegerField(default=0)  # plaintext bytes
+    content_hash = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('user_image', 'width', 'format')
+        ordering = ['width']
+
+    def __str__(self):
+        return f"{self.user_image.image_name} @ {self.width}px ({self.format})"
+
+    def get_decrypted_bytes(self):
+        from .encryption import decrypt_file_buffer
+        return decrypt_file_buffer(self.file.path, bytes.fromhex(self.user_image.encryption_key))
+
+@receiver(post_delete, sender=ImageDerivative)
+def delete_derivative_file(sender, instance, **kwargs):
+    # Derivatives of deduplicated images share files
+    if instance.file and not ImageDerivative.objects.filter(file=instance.file.name).exists():
+        name, storage = instance.file.name, instance.file.storage
+        transaction.on_commit(lambda: storage.delete(name))
+
+@receiver(post_delete, sender=UserImage)
+def release_user_image_file(sender, instance, **kwargs):
+    """Delete the stored original once no other image shares it (see UserImage.duplicate)"""
+    if instance.image and not UserImage.objects.filter(user_id=instance.user_id, image=instance.image.name).exists():
+        name, storage = instance.image.name, instance.image.storage
+        transaction.on_commit(lambda: storage.delete(name))
+
+class ImageMetadataIndex(models.Model):
+    """
+    Searchable projection of UserImage.metadata (see metadata_index.py), so
+    the library can be filtered by camera, lens, date taken, owner and GPS
+    with index lookups instead of scanning JSON. Text is lowercased. Kept in
+    sync by sync_user_image_metadata_index and, for bulk writes, sync_many.
+    """
+    user_image = models.OneToOneField(UserImage, on_delete=models.CASCADE, primary_key=True,
+                                      related_name='metadata_index')
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    camera_make = models.CharField(max_length=255, blank=True, db_index=True)
+    camera_model = models.CharField(max_length=255, blank=True, db_index=True)
+    lens = models.CharField(max_length=255, blank=True, db_index=True)
+    creator = models.CharField(max_length=255, blank=True, db_index=True)
+    copyright_owner = models.CharField(max_length=255, blank=True, db_index=True)
+    date_taken = models.DateTimeField(null=True, blank=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'date_taken'], name='metaindex_user_taken_idx'),
+            models.Index(fields=['user', 'latitude', 'longitude'], name='metaindex_user_gps_idx'),
+        ]
+
+    COLUMNS = ('camera_make', 'camera_model', 'lens', 'creator', 'copyright_owner',
+               'date_taken', 'latitude', 'longitude')
+
+    @classmethod
+    def sync_many(cls, images):
+        """
+        Rebuild the index rows and keywords of these images from their
+        metadata in a few statements; images without searchable metadata
+        get no row.
+        """
+        from .metadata_index import project_metadata
+
+        images = [image for image in images if image.pk]
+        if not images:
+            return
+        rows, keywords, empty = [], [], []
+        for image in images:
+            columns, words = project_metadata(image.metadata)
+            if any(value not in (None, '') for value in columns.values()):
+                rows.append(cls(user_image_id=image.pk, user_id=image.user_id, **columns))
+            else:
+                empty.append(image.pk)
+            keywords += [ImageKeyword(user_image_id=image.pk, user_id=image.user_id, keyword=word) for word in words]
+
+        with transaction.atomic():
+            if empty:
+                cls.objects.filter(user_image_id__in=empty).delete()
+            if rows:
+                cls.objects.bulk_create(rows, update_conflicts=True, unique_fields=['user_image'],
+                                        update_fields=list(cls.COLUMNS))
+            ImageKeyword.objects.filter(user_image_id__in=[image.pk for image in images]).delete()
+            ImageKeyword.objects.bulk_create(keywords)
+
+
+class ImageKeyword(models.Model):
+    """One keyword (IPTC Keywords / XMP Subject) of an image, lowercased, for exact-match search"""
+    user_image = models.ForeignKey(UserImage, on_delete=models.CASCADE, related_name='keywords')
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    keyword = models.CharField(max_length=100)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_image', 'keyword'], name='imagekeyword_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'keyword'], name='imagekeyword_user_kw_idx'),
+        ]
+
+@receiver(post_save, sender=UserImage)
+def sync_user_image_metadata_index(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Keep ImageMetadataIndex in step with saves that write metadata. Only
+    inserts and saves naming 'metadata' in update_fields are synced, so
+    plain save() calls don't pay for a resync; paths that rewrite metadata
+    otherwise call ImageMetadataIndex.sync_many themselves.
+    """
+    if created or (update_fields is not None and 'metadata' in update_fields):
+        ImageMetadataIndex.sync_many([instance])
+
+class Job(models.Model):
+    """Unit of background work, claimed by `manage.py runjobs` workers (see jobs.py)"""
+    LANE_INTERACTIVE = 'interactive'
+    LANE_BACKFILL = 'backfill'
+    LANE_CHOICES = [
+        (LANE_INTERACTIVE, 'Interactive'),
+        (LANE_BACKFILL, 'Backfill'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='jobs')
+    lane = models.CharField(max_length=20, choices=LANE_CHOICES, default=LANE_INTERACTIVE)
+    priority = models.IntegerField(default=0)  # higher runs first within a lane
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    progress = models.FloatField(default=0.0)  # 0..1
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=255, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'lane', '-priority', 'run_after'], name='job_claim_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.id} ({self.status})"
+
+    def set_progress(self, progress):
+        """
+        Record progress (0..1) from inside a running handler. Inside a
+        transaction the write would only show on commit, so on PostgreSQL
+        it goes through a connection of its own.
+        """
+        from django.db import DEFAULT_DB_ALIAS, connection, connections
+
+        self.progress = max(0.0, min(1.0, progress))
+        if not (connection.in_atomic_block and connection.vendor == 'postgresql'):
+            Job.objects.filter(pk=self.pk).update(progress=self.progress)
+            return
+        side = connections.create_connection(DEFAULT_DB_ALIAS)
+        try:
+            with side.cursor() as cursor:
+                cursor.execute(f"UPDATE {Job._meta.db_table} SET progress = %s WHERE id = %s",
+                               [self.progress, self.pk])
+        finally:
+            side.close()
+
+class UploadSession(models.Model):
+    """
+    In-progress resumable upload (see resumable.py). Received bytes are
+    encrypted into a staging container outside MEDIA_ROOT as they arrive;
+    only the encrypted tail of the current segment is kept between chunks.
+    """
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('finalized', 'Finalized'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    total_size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)  # plaintext bytes received
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    encryption_key = models.CharField(max_length=64)  # becomes the image's key
+    header = models.CharField(max_length=64)  # hex container header (segment size, nonce prefix)
+    segments_sealed = models.PositiveIntegerField(default=0)
+    block_digests = models.TextField(blank=True)  # hex ContentHasher block digests so far
+    mime_type = models.CharField(max_length=100, blank=True)  # sniffed from the first segment
+    content_hash = models.CharField(max_length=64, blank=True)  # set once all bytes are in
+    user_image = models.ForeignKey(UserImage, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Upload {self.id} ({self.offset}/{self.total_size})"
+
+    @property
+    def is_complete(self):
+        return self.offset == self.total_size
+
+    def is_expired(self):
+        return self.status == 'uploading' and timezone.now() >= self.expires_at
+
+@receiver(post_delete, sender=UploadSession)
+def delete_upload_staging_files(sender, instance, **kwargs):
+    from .resumable import ResumableUpload
+    ResumableUpload(instance).discard()
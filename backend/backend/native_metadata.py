@@ -0,0 +1,731 @@
+"""
+In-process reading and writing of the TARGET_SCHEMA metadata fields, so the
+common cases don't go through exiftool and a file on disk. Values are read
+into the same shape exiftool's JSON output has (``EXIF:Make``,
+``IPTC:By-line``, ``XMP-dc:Title``, bare file properties), and writes take
+the same (group, tag, value) assignments the exiftool command is built
+from. Anything outside these tables or formats raises UnsupportedMetadata
+and is left to exiftool.
+"""
+
+import re
+import struct
+import zlib
+import xml.etree.ElementTree as ET
+from fractions import Fraction
+from io import BytesIO
+
+from PIL import Image, IptcImagePlugin, TiffTags
+from PIL.TiffImagePlugin import IFDRational
+
+EXIF_IFD = 0x8769
+GPS_IFD = 0x8825
+MAKER_NOTE = 0x927C
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+EXIF_HEADER = b'Exif\x00\x00'
+XMP_JPEG_HEADER = b'http://ns.adobe.com/xap/1.0/\x00'
+XMP_EXTENSION_HEADER = b'http://ns.adobe.com/xmp/extension/\x00'
+XMP_PNG_KEYWORD = b'XML:com.adobe.xmp'
+PHOTOSHOP_HEADER = b'Photoshop 3.0\x00'
+IPTC_RESOURCE = 0x0404
+IPTC_UTF8 = b'\x1b%G'
+
+# Formats read natively; anything else goes to exiftool
+READ_FORMATS = ('JPEG', 'PNG', 'TIFF', 'WEBP')
+
+FLASH = {
+    0x00: 'No Flash', 0x01: 'Fired', 0x05: 'Fired, Return not detected', 0x07: 'Fired, Return detected',
+    0x08: 'On, Did not fire', 0x09: 'On, Fired', 0x0D: 'On, Return not detected', 0x0F: 'On, Return detected',
+    0x10: 'Off, Did not fire', 0x14: 'Off, Did not fire, Return not detected', 0x18: 'Auto, Did not fire',
+    0x19: 'Auto, Fired', 0x1D: 'Auto, Fired, Return not detected', 0x1F: 'Auto, Fired, Return detected',
+    0x20: 'No flash function', 0x41: 'Fired, Red-eye reduction', 0x49: 'On, Red-eye reduction',
+    0x58: 'Auto, Did not fire, Red-eye reduction', 0x59: 'Auto, Fired, Red-eye reduction',
+}
+WHITE_BALANCE = {0: 'Auto', 1: 'Manual'}
+EXPOSURE_PROGRAM = {
+    0: 'Not Defined', 1: 'Manual', 2: 'Program AE', 3: 'Aperture-priority AE', 4: 'Shutter speed priority AE',
+    5: 'Creative (Slow speed)', 6: 'Action (High speed)', 7: 'Portrait', 8: 'Landscape',
+}
+METERING_MODE = {
+    0: 'Unknown', 1: 'Average', 2: 'Center-weighted average', 3: 'Spot', 4: 'Multi-spot',
+    5: 'Multi-segment', 6: 'Partial', 255: 'Other',
+}
+
+# TARGET_SCHEMA EXIF field -> (IFD, tag, kind); IFD None is IFD0
+EXIF_TAGS = {
+    'OriginalRawFileName': (None, 0xC68B, 'text'),
+    'Software': (None, 0x0131, 'text'),
+    'Make': (None, 0x010F, 'text'),
+    'Model': (None, 0x0110, 'text'),
+    'ModifyDate': (None, 0x0132, 'text'),
+    'Artist': (None, 0x013B, 'text'),
+    'Copyright': (None, 0x8298, 'text'),
+    'DateTimeOriginal': (EXIF_IFD, 0x9003, 'text'),
+    'CreateDate': (EXIF_IFD, 0x9004, 'text'),
+    'FNumber': (EXIF_IFD, 0x829D, 'fnumber'),
+    'ExposureTime': (EXIF_IFD, 0x829A, 'exposure'),
+    'ISO': (EXIF_IFD, 0x8827, 'int'),
+    'FocalLength': (EXIF_IFD, 0x920A, 'focal'),
+    'LensInfo': (EXIF_IFD, 0xA432, 'lens'),
+    'LensMake': (EXIF_IFD, 0xA433, 'text'),
+    'LensModel': (EXIF_IFD, 0xA434, 'text'),
+    'Flash': (EXIF_IFD, 0x9209, FLASH),
+    'WhiteBalance': (EXIF_IFD, 0xA403, WHITE_BALANCE),
+    'ExposureProgram': (EXIF_IFD, 0x8822, EXPOSURE_PROGRAM),
+    'MeteringMode': (EXIF_IFD, 0x9207, METERING_MODE),
+    'ExposureCompensation': (EXIF_IFD, 0x9204, 'bias'),
+    'GPSLatitudeRef': (GPS_IFD, 0x01, {'N': 'North', 'S': 'South'}),
+    'GPSLatitude': (GPS_IFD, 0x02, 'coordinate'),
+    'GPSLongitudeRef': (GPS_IFD, 0x03, {'E': 'East', 'W': 'West'}),
+    'GPSLongitude': (GPS_IFD, 0x04, 'coordinate'),
+    'GPSAltitude': (GPS_IFD, 0x06, 'altitude'),
+}
+GPS_ALTITUDE_REF = 0x05
+
+# Schema fields that describe the file rather than a stored tag (or, for
+# Rights, aren't EXIF tags at all); exiftool doesn't store them either
+EXIF_NOT_STORED = {'FileType', 'MIMEType', 'ImageWidth', 'ImageHeight', 'ImageSize', 'Megapixels',
+                   'GPSPosition', 'Rights'}
+
+# TARGET_SCHEMA IPTC field -> (record 2 dataset, kind)
+IPTC_DATASETS = {
+    'EditStatus': (7, 'text'),
+    'Urgency': (10, 'int'),
+    'SubjectReference': (12, 'text'),
+    'Category': (15, 'text'),
+    'Keywords': (25, 'text'),
+    'ReleaseDate': (30, 'date'),
+    'ExpirationDate': (37, 'date'),
+    'SpecialInstructions': (40, 'text'),
+    'DateCreated': (55, 'date'),
+    'By-line': (80, 'text'),
+    'By-lineTitle': (85, 'text'),
+    'City': (90, 'text'),
+    'Sub-location': (92, 'text'),
+    'Province-State': (95, 'text'),
+    'Country-PrimaryLocationCode': (100, 'text'),
+    'Country-PrimaryLocationName': (101, 'text'),
+    'Headline': (105, 'text'),
+    'Credit': (110, 'text'),
+    'Source': (115, 'text'),
+    'CopyrightNotice': (116, 'text'),
+    'Contact': (118, 'text'),
+    'Caption-Abstract': (120, 'text'),
+}
+
+XMP_NAMESPACES = {
+    'x': 'adobe:ns:meta/',
+    'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
+    'dc': 'http://purl.org/dc/elements/1.1/',
+    'xmp': 'http://ns.adobe.com/xap/1.0/',
+    'xmpRights': 'http://ns.adobe.com/xap/1.0/rights/',
+    'photoshop': 'http://ns.adobe.com/photoshop/1.0/',
+}
+XMP_PREFIXES = {uri: prefix for prefix, uri in XMP_NAMESPACES.items() if prefix not in ('x', 'rdf')}
+RDF = '{%s}' % XMP_NAMESPACES['rdf']
+XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+
+# XMP properties stored as arrays; all others are simple text
+XMP_ARRAYS = {
+    ('dc', 'title'): 'Alt',
+    ('dc', 'description'): 'Alt',
+    ('dc', 'rights'): 'Alt',
+    ('xmpRights', 'UsageTerms'): 'Alt',
+    ('dc', 'creator'): 'Seq',
+    ('dc', 'subject'): 'Bag',
+    ('xmpRights', 'Owner'): 'Bag',
+}
+XMP_NUMBERS = {('xmp', 'Rating')}
+
+for _prefix, _uri in XMP_NAMESPACES.items():
+    ET.register_namespace(_prefix, _uri)
+
+
+class UnsupportedMetadata(Exception):
+    """The file or a tag is outside what the native path handles; use exiftool"""
+    pass
+
+
+# === Value conversion (exiftool's print format <-> stored values) ===
+
+def _fraction(value):
+    if isinstance(value, IFDRational):
+        if value.denominator == 0:
+            raise ValueError("Undefined rational")
+        return Fraction(value.numerator, value.denominator)
+    return Fraction(str(value).strip())
+
+def _rational(value):
+    return IFDRational(_fraction(value).limit_denominator(1000000))
+
+def _number_in(text):
+    match = re.search(r'-?\d+(?:\.\d+)?', str(text))
+    if not match:
+        raise ValueError(f"No number in {text!r}")
+    return match.group()
+
+def _trim(number):
+    return int(number) if float(number).is_integer() else number
+
+def _dms(decimal, places):
+    """Degrees, minutes and seconds of decimal degrees, the seconds rounded to ``places`` and carried"""
+    scale = 10 ** places
+    units = round(abs(decimal) * 3600 * scale)
+    degrees, units = divmod(units, 3600 * scale)
+    minutes, units = divmod(units, 60 * scale)
+    return degrees, minutes, Fraction(units, scale)
+
+def _print_coordinate(value):
+    decimal = float(sum(_fraction(part) / 60 ** i for i, part in enumerate(value)))
+    degrees, minutes, seconds = _dms(decimal, 2)
+    return f'{degrees} deg {minutes}\' {float(seconds):.2f}"'
+
+def _parse_coordinate(value):
+    parts = re.findall(r'\d+(?:\.\d+)?', str(value))[:3]
+    if not parts:
+        raise ValueError(f"Not a coordinate: {value!r}")
+    if len(parts) == 1:
+        # Decimal degrees
+        degrees, minutes, seconds = _dms(float(parts[0]), 4)
+        return (IFDRational(degrees), IFDRational(minutes), _rational(seconds))
+    # Degrees and minutes (and seconds) are stored as written
+    parts += ['0'] * (3 - len(parts))
+    return tuple(_rational(part) for part in parts)
+
+def _print_lens(value):
+    low, high, f_low, f_high = (float(_fraction(v)) if _fraction(v) else None for v in value)
+    focal = f"{low:g}mm" if low == high else f"{low:g}-{high:g}mm"
+    aperture = f"f/{f_low:g}" if f_low == f_high or f_high is None else f"f/{f_low:g}-{f_high:g}"
+    return f"{focal} {aperture}"
+
+def _parse_lens(value):
+    match = re.match(r'\s*([\d.]+)(?:-([\d.]+))?\s*mm\s*f/([\d.]+)(?:-([\d.]+))?', str(value))
+    if not match:
+        raise ValueError(f"Not a lens specification: {value!r}")
+    low, high, f_low, f_high = match.groups()
+    return tuple(_rational(v) for v in (low, high or low, f_low, f_high or f_low))
+
+def _print_exposure(value):
+    seconds = float(_fraction(value))
+    if 0 < seconds < 0.25001:
+        return f"1/{int(0.5 + 1 / seconds)}"
+    return _trim(round(seconds, 1))
+
+def _print_bias(value):
+    bias = _fraction(value).limit_denominator(6)
+    if bias == 0:
+        return "0"
+    sign = '+' if bias > 0 else '-'
+    bias = abs(bias)
+    return f"{sign}{bias.numerator}" if bias.denominator == 1 else f"{sign}{bias.numerator}/{bias.denominator}"
+
+def _to_text(value):
+    if isinstance(value, str):
+        # PIL decodes ASCII tags as latin-1; exiftool writes UTF-8 into them
+        try:
+            value = value.encode('latin-1')
+        except UnicodeEncodeError:
+            pass
+    if isinstance(value, bytes):
+        try:
+            value = value.decode('utf-8')
+        except UnicodeDecodeError:
+            value = value.decode('latin-1')
+    return str(value).strip('\x00').strip()
+
+def _print_exif(kind, value):
+    if isinstance(kind, dict):
+        return kind.get(_to_text(value) if isinstance(value, (str, bytes)) else value, f"Unknown ({value})")
+    if kind == 'text':
+        return _to_text(value)
+    if kind == 'int':
+        return int(value[0] if isinstance(value, tuple) else value)
+    if kind == 'fnumber':
+        return _trim(round(float(_fraction(value)), 1))
+    if kind == 'exposure':
+        return _print_exposure(value)
+    if kind == 'focal':
+        return f"{float(_fraction(value)):.1f} mm"
+    if kind == 'lens':
+        return _print_lens(value)
+    if kind == 'bias':
+        return _print_bias(value)
+    if kind == 'coordinate':
+        return _print_coordinate(value)
+    if kind == 'altitude':
+        return f"{float(_fraction(value)):.1f} m"
+    raise ValueError(kind)
+
+def _parse_exif(kind, value):
+    if isinstance(kind, dict):
+        text = str(value).strip()
+        for stored, printed in kind.items():
+            if text.lower() in (printed.lower(), str(stored).lower()):
+                return stored
+        raise ValueError(f"Unknown value {value!r}")
+    if kind == 'text':
+        return str(value)
+    if kind == 'int':
+        return int(float(_number_in(value)))
+    if kind in ('fnumber', 'focal', 'altitude'):
+        return _rational(abs(float(_number_in(value))))
+    if kind == 'exposure':
+        text = str(value).strip()
+        return _rational(text if '/' in text else _number_in(text))
+    if kind == 'bias':
+        return _rational(str(value).strip().lstrip('+'))
+    if kind == 'lens':
+        return _parse_lens(value)
+    if kind == 'coordinate':
+        return _parse_coordinate(value)
+    raise ValueError(kind)
+
+
+# === Containers ===
+
+def _jpeg_segments(data):
+    """Split a JPEG into its (marker, payload) segments up to the scan; returns (segments, rest)"""
+    if data[:2] != b'\xff\xd8':
+        raise UnsupportedMetadata("Not a JPEG file")
+    segments, pos = [], 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            raise UnsupportedMetadata("Corrupt JPEG marker")
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        if marker in (0xDA, 0xD9):
+            return segments, data[pos:]
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        segments.append((marker, data[pos + 4:pos + 2 + length]))
+        pos += 2 + length
+    raise UnsupportedMetadata("Truncated JPEG")
+
+def _jpeg_segment(marker, payload):
+    if len(payload) > 65533:
+        raise UnsupportedMetadata("Metadata too large for a JPEG segment")
+    return b'\xff' + bytes([marker]) + struct.pack('>H', len(payload) + 2) + payload
+
+def _png_chunks(data):
+    if data[:8] != PNG_SIGNATURE:
+        raise UnsupportedMetadata("Not a PNG file")
+    chunks, pos = [], 8
+    while pos + 8 <= len(data):
+        length, chunk_type = struct.unpack('>I4s', data[pos:pos + 8])
+        chunks.append((chunk_type, data[pos + 8:pos + 8 + length]))
+        pos += 12 + length
+        if chunk_type == b'IEND':
+            break
+    return chunks
+
+def _png_chunk(chunk_type, body):
+    return struct.pack('>I', len(body)) + chunk_type + body + struct.pack('>I', zlib.crc32(chunk_type + body))
+
+def _png_xmp(body):
+    """XMP packet of an iTXt chunk, or None if it holds something else"""
+    keyword, _, rest = body.partition(b'\x00')
+    if keyword != XMP_PNG_KEYWORD or len(rest) < 2:
+        raise LookupError
+    compressed, text = rest[0], rest[2:]
+    _, _, text = text.partition(b'\x00')  # language tag
+    _, _, text = text.partition(b'\x00')  # translated keyword
+    return zlib.decompress(text) if compressed else text
+
+def _photoshop_resources(payload):
+    """(id, name, data) of the image resources in an APP13 segment"""
+    resources, pos = [], len(PHOTOSHOP_HEADER)
+    while pos + 12 <= len(payload) and payload[pos:pos + 4] == b'8BIM':
+        resource_id = struct.unpack('>H', payload[pos + 4:pos + 6])[0]
+        name_end = pos + 7 + payload[pos + 6]
+        name_end += (name_end - pos - 6) % 2
+        size = struct.unpack('>I', payload[name_end:name_end + 4])[0]
+        resources.append((resource_id, payload[pos + 6:name_end], payload[name_end + 4:name_end + 4 + size]))
+        pos = name_end + 4 + size + size % 2
+    return resources
+
+def _photoshop_segment(resources):
+    payload = PHOTOSHOP_HEADER
+    for resource_id, name, body in resources:
+        payload += b'8BIM' + struct.pack('>H', resource_id) + name + struct.pack('>I', len(body)) + body
+        payload += b'\x00' * (len(body) % 2)
+    return payload
+
+def _iptc_datasets(data):
+    """(record, dataset, value) of an IPTC-IIM block, in file order"""
+    datasets, pos = [], 0
+    while pos + 5 <= len(data) and data[pos] == 0x1C:
+        record, dataset = data[pos + 1], data[pos + 2]
+        length = struct.unpack('>H', data[pos + 3:pos + 5])[0]
+        pos += 5
+        if length & 0x8000:
+            size = length & 0x7FFF
+            length = int.from_bytes(data[pos:pos + size], 'big')
+            pos += size
+        datasets.append((record, dataset, data[pos:pos + length]))
+        pos += length
+    return datasets
+
+def _iptc_block(datasets):
+    block = b''
+    for record, dataset, value in datasets:
+        if len(value) > 0x7FFF:
+            raise UnsupportedMetadata("IPTC value too long")
+        block += struct.pack('>BBBH', 0x1C, record, dataset, len(value)) + value
+    return block
+
+
+# === XMP ===
+
+def _parse_xmp(packet):
+    if isinstance(packet, bytes):
+        packet = packet.decode('utf-8', 'replace')
+    return ET.fromstring(packet.strip().lstrip('\ufeff').strip())
+
+def _read_xmp(packet, raw):
+    root = _parse_xmp(packet)
+    for description in root.iter(f'{RDF}Description'):
+        values = [(attribute, value) for attribute, value in description.attrib.items()]
+        for child in description:
+            container = next((c for c in child if c.tag in (f'{RDF}Alt', f'{RDF}Seq', f'{RDF}Bag')), None)
+            if container is None:
+                values.append((child.tag, child.text or ''))
+                continue
+            items = container.findall(f'{RDF}li')
+            if container.tag == f'{RDF}Alt':
+                default = next((li for li in items if li.get(XML_LANG) == 'x-default'), items[0] if items else None)
+                values.append((child.tag, default.text or '' if default is not None else ''))
+            else:
+                texts = [li.text or '' for li in items]
+                values.append((child.tag, texts[0] if len(texts) == 1 else texts))
+
+        for tag, value in values:
+            uri, _, prop = tag[1:].partition('}')
+            prefix = XMP_PREFIXES.get(uri)
+            if prefix is None:
+                continue
+            if (prefix, prop) in XMP_NUMBERS:
+                try:
+                    value = _trim(float(value))
+                except (TypeError, ValueError):
+                    pass
+            raw[f"XMP-{prefix}:{prop[:1].upper()}{prop[1:]}"] = value
+
+def _write_xmp(packet, updates):
+    """XMP packet with ``updates`` ({(prefix, property): value}) applied"""
+    root = _parse_xmp(packet) if packet else ET.Element(f"{{{XMP_NAMESPACES['x']}}}xmpmeta")
+    if root.tag == f'{RDF}RDF':
+        meta = ET.Element(f"{{{XMP_NAMESPACES['x']}}}xmpmeta")
+        meta.append(root)
+        root = meta
+    rdf = root.find(f'.//{RDF}RDF')
+    if rdf is None:
+        rdf = ET.SubElement(root, f'{RDF}RDF')
+    descriptions = rdf.findall(f'{RDF}Description')
+    if not descriptions:
+        descriptions = [ET.SubElement(rdf, f'{RDF}Description', {f'{RDF}about': ''})]
+
+    for (prefix, prop), value in updates.items():
+        tag = f'{{{XMP_NAMESPACES[prefix]}}}{prop}'
+        for description in descriptions:
+            description.attrib.pop(tag, None)
+            for child in description.findall(tag):
+                description.remove(child)
+        if value == '':
+            # An empty value deletes the property, as with exiftool
+            continue
+
+        element = ET.SubElement(descriptions[0], tag)
+        items = value if isinstance(value, list) else [value]
+        items = [('True' if item else 'False') if isinstance(item, bool) else str(item) for item in items]
+        if (prefix, prop) == ('xmpRights', 'Marked') and items[0].lower() in ('true', 'false'):
+            items[0] = items[0].capitalize()
+        kind = XMP_ARRAYS.get((prefix, prop))
+        if kind is None:
+            element.text = items[0]
+            continue
+        container = ET.SubElement(element, f'{RDF}{kind}')
+        for item in items:
+            li = ET.SubElement(container, f'{RDF}li', {XML_LANG: 'x-default'} if kind == 'Alt' else {})
+            li.text = item
+
+    body = ET.tostring(root, encoding='unicode')
+    return (f'<?xpacket begin="\ufeff" id="W5M0MpCehiHzreSzNTczkc9d"?>\n{body}\n'
+            f'<?xpacket end="w"?>').encode('utf-8')
+
+
+class NativeMetadata:
+    """
+    Reads and writes the TARGET_SCHEMA fields of JPEG, PNG, TIFF and WebP
+    images in memory. Both methods raise UnsupportedMetadata when exiftool
+    is needed instead.
+    """
+
+    @staticmethod
+    def read(data):
+        """Raw metadata of an image, keyed like exiftool's -a -G JSON output"""
+        data = bytes(data)
+        try:
+            img = Image.open(BytesIO(data))
+        except Exception as e:
+            raise UnsupportedMetadata(str(e))
+        with img:
+            if img.format not in READ_FORMATS:
+                raise UnsupportedMetadata(f"{img.format} is read with exiftool")
+            width, height = img.size
+            megapixels = width * height / 1_000_000
+            raw = {
+                'FileType': img.format,
+                'MIMEType': Image.MIME.get(img.format),
+                'ImageWidth': width,
+                'ImageHeight': height,
+                'ImageSize': f"{width}x{height}",
+                'Megapixels': float(f"{megapixels:.1f}" if megapixels >= 1 else f"{megapixels:.3f}"),
+            }
+            exif_data = xmp = None
+            iptc = []
+            if img.format == 'JPEG':
+                segments, _ = _jpeg_segments(data)
+                for marker, payload in segments:
+                    if marker == 0xE1 and payload.startswith(EXIF_HEADER) and exif_data is None:
+                        exif_data = payload
+                    elif marker == 0xE1 and payload.startswith(XMP_JPEG_HEADER) and xmp is None:
+                        xmp = payload[len(XMP_JPEG_HEADER):]
+                    elif marker == 0xED and payload.startswith(PHOTOSHOP_HEADER):
+                        for resource_id, _, body in _photoshop_resources(payload):
+                            if resource_id == IPTC_RESOURCE:
+                                iptc = _iptc_datasets(body)
+            elif img.format == 'PNG':
+                # Chunks are read directly: PIL would decode the image to reach an eXIf after IDAT
+                for chunk_type, body in _png_chunks(data):
+                    if chunk_type == b'eXIf':
+                        exif_data = EXIF_HEADER + body
+                    elif chunk_type == b'iTXt' and xmp is None:
+                        try:
+                            xmp = _png_xmp(body)
+                        except LookupError:
+                            pass
+            else:
+                exif_data = img.getexif()
+                xmp = img.info.get('xmp') or getattr(img, 'tag_v2', {}).get(700)
+                for (record, dataset), value in (IptcImagePlugin.getiptcinfo(img) or {}).items():
+                    for item in value if isinstance(value, list) else [value]:
+                        iptc.append((record, dataset, item))
+
+        if exif_data:
+            if isinstance(exif_data, bytes):
+                exif = Image.Exif()
+                exif.load(exif_data)
+            else:
+                exif = exif_data
+            ifds = {None: exif, EXIF_IFD: exif.get_ifd(EXIF_IFD), GPS_IFD: exif.get_ifd(GPS_IFD)}
+            for name, (ifd, tag, kind) in EXIF_TAGS.items():
+                if tag in ifds[ifd]:
+                    try:
+                        raw[f"EXIF:{name}"] = _print_exif(kind, ifds[ifd][tag])
+                    except (ValueError, TypeError, ZeroDivisionError, IndexError):
+                        pass
+            if 'EXIF:GPSLatitude' in raw and 'EXIF:GPSLongitude' in raw:
+                raw['GPSPosition'] = (f"{raw['EXIF:GPSLatitude']} {ifds[GPS_IFD].get(1, 'N')}, "
+                                      f"{raw['EXIF:GPSLongitude']} {ifds[GPS_IFD].get(3, 'E')}")
+
+        if iptc:
+            utf8 = any(record == 1 and dataset == 90 and value == IPTC_UTF8 for record, dataset, value in iptc)
+            names = {dataset: (name, kind) for name, (dataset, kind) in IPTC_DATASETS.items()}
+            for record, dataset, value in iptc:
+                if record != 2 or dataset not in names:
+                    continue
+                name, kind = names[dataset]
+                try:
+                    text = value.decode('utf-8')
+                except UnicodeDecodeError:
+                    if utf8:
+                        continue
+                    text = value.decode('latin-1')
+                text = text.strip('\x00').strip()
+                if kind == 'int':
+                    text = int(text) if text.isdigit() else text
+                elif kind == 'date' and len(text) == 8 and text.isdigit():
+                    text = f"{text[:4]}:{text[4:6]}:{text[6:]}"
+                key = f"IPTC:{name}"
+                if key in raw:
+                    # Repeated datasets (keywords, creators) become lists
+                    raw[key] = (raw[key] if isinstance(raw[key], list) else [raw[key]]) + [text]
+                else:
+                    raw[key] = text
+
+        if xmp:
+            try:
+                _read_xmp(xmp, raw)
+            except ET.ParseError:
+                pass
+        return raw
+
+    @staticmethod
+    def write(data, assignments):
+        """
+        Apply (group, tag, value) assignments, as passed to exiftool
+        (``-group:tag=value``), to a JPEG or PNG in memory and return the new
+        bytes. An empty value deletes the tag.
+        """
+        data = bytes(data)
+        exif_updates, iptc_updates, xmp_updates = {}, {}, {}
+        for group, tag, value in assignments:
+            if group == 'EXIF':
+                if tag in EXIF_NOT_STORED:
+                    continue
+                if tag not in EXIF_TAGS:
+                    raise UnsupportedMetadata(f"EXIF:{tag}")
+                exif_updates[tag] = value
+            elif group == 'IPTC':
+                if tag not in IPTC_DATASETS:
+                    raise UnsupportedMetadata(f"IPTC:{tag}")
+                iptc_updates[tag] = value
+            elif group.startswith('XMP-') and group[4:] in XMP_NAMESPACES:
+                xmp_updates[(group[4:], tag)] = value
+            else:
+                raise UnsupportedMetadata(f"{group}:{tag}")
+
+        if data[:2] == b'\xff\xd8':
+            return NativeMetadata._write_jpeg(data, exif_updates, iptc_updates, xmp_updates)
+        if data[:8] == PNG_SIGNATURE:
+            if iptc_updates:
+                raise UnsupportedMetadata("IPTC in PNG is written with exiftool")
+            return NativeMetadata._write_png(data, exif_updates, xmp_updates)
+        raise UnsupportedMetadata("Only JPEG and PNG are written natively")
+
+    @staticmethod
+    def _exif_bytes(existing, updates):
+        exif = Image.Exif()
+        if existing:
+            # Maker notes hold absolute offsets and IFD1 a thumbnail; PIL
+            # would not carry either over intact. (Probed on a copy: get_ifd(-1)
+            # leaves an entry behind that tobytes() can't write.)
+            probe = Image.Exif()
+            probe.load(existing)
+            if MAKER_NOTE in probe.get_ifd(EXIF_IFD) or probe.get_ifd(-1):
+                raise UnsupportedMetadata("EXIF with maker notes or a thumbnail")
+            exif.load(existing)
+        ifds = {None: exif, EXIF_IFD: exif.get_ifd(EXIF_IFD), GPS_IFD: exif.get_ifd(GPS_IFD)}
+        for name, value in updates.items():
+            ifd, tag, kind = EXIF_TAGS[name]
+            if value == '':
+                ifds[ifd].pop(tag, None)
+                continue
+            try:
+                value = _parse_exif(kind, value)
+            except (ValueError, TypeError, ZeroDivisionError) as e:
+                raise UnsupportedMetadata(f"EXIF:{name}: {e}")
+            if kind == 'text' and not value.isascii():
+                # Stored as UTF-8 like exiftool does. PIL only writes bytes as
+                # ASCII for tags it knows the type of.
+                if TiffTags.lookup(tag).type != TiffTags.ASCII:
+                    raise UnsupportedMetadata(f"EXIF:{name}: non-ASCII text")
+                value = value.encode('utf-8')
+            ifds[ifd][tag] = value
+            if name == 'GPSAltitude':
+                ifds[ifd][GPS_ALTITUDE_REF] = 1 if re.search(r'below|^\s*-', str(value), re.I) else 0
+        return exif.tobytes()
+
+    @staticmethod
+    def _iptc_bytes(existing, updates):
+        datasets = _iptc_datasets(existing) if existing else []
+        utf8 = any(r == 1 and d == 90 and v == IPTC_UTF8 for r, d, v in datasets)
+        replaced = {IPTC_DATASETS[name][0] for name in updates}
+        record1 = [(r, d, v) for r, d, v in datasets if r == 1 and d != 90] + [(1, 90, IPTC_UTF8)]
+        record2 = [(2, 0, b'\x00\x04')]
+        for record, dataset, value in datasets:
+            if record != 2 or dataset == 0 or dataset in replaced:
+                continue
+            if not utf8:
+                # Everything is stored as UTF-8 from now on
+                try:
+                    value.decode('utf-8')
+                except UnicodeDecodeError:
+                    value = value.decode('latin-1').encode('utf-8')
+            record2.append((record, dataset, value))
+        for name, value in updates.items():
+            dataset, kind = IPTC_DATASETS[name]
+            for item in value if isinstance(value, list) else [value]:
+                if item == '':
+                    continue
+                if kind == 'date':
+                    item = re.sub(r'\D', '', str(item))[:8]
+                    if len(item) != 8:
+                        raise UnsupportedMetadata(f"IPTC:{name}")
+                record2.append((2, dataset, str(item).encode('utf-8')))
+        return _iptc_block(record1 + record2 + [(r, d, v) for r, d, v in datasets if r > 2])
+
+    @staticmethod
+    def _write_jpeg(data, exif_updates, iptc_updates, xmp_updates):
+        segments, rest = _jpeg_segments(data)
+        exif_index = xmp_index = photoshop_index = None
+        for index, (marker, payload) in enumerate(segments):
+            if marker == 0xE1 and payload.startswith(EXIF_HEADER) and exif_index is None:
+                exif_index = index
+            elif marker == 0xE1 and payload.startswith(XMP_JPEG_HEADER) and xmp_index is None:
+                xmp_index = index
+            elif marker == 0xE1 and payload.startswith(XMP_EXTENSION_HEADER) and xmp_updates:
+                raise UnsupportedMetadata("Extended XMP")
+            elif marker == 0xED and payload.startswith(PHOTOSHOP_HEADER):
+                if photoshop_index is not None:
+                    raise UnsupportedMetadata("Photoshop resources over several segments")
+                photoshop_index = index
+
+        # (index of the segment to replace or None, new segment)
+        changes = []
+        if exif_updates:
+            existing = segments[exif_index][1] if exif_index is not None else None
+            changes.append((exif_index, (0xE1, NativeMetadata._exif_bytes(existing, exif_updates))))
+        if xmp_updates:
+            existing = segments[xmp_index][1][len(XMP_JPEG_HEADER):] if xmp_index is not None else None
+            changes.append((xmp_index, (0xE1, XMP_JPEG_HEADER + _write_xmp(existing, xmp_updates))))
+        if iptc_updates:
+            resources = _photoshop_resources(segments[photoshop_index][1]) if photoshop_index is not None else []
+            existing = next((body for rid, _, body in resources if rid == IPTC_RESOURCE), None)
+            block = NativeMetadata._iptc_bytes(existing, iptc_updates)
+            resources = [r for r in resources if r[0] != IPTC_RESOURCE] + [(IPTC_RESOURCE, b'\x00\x00', block)]
+            changes.append((photoshop_index, (0xED, _photoshop_segment(resources))))
+
+        # New segments go after SOI and a JFIF APP0, existing ones stay in place
+        insert_at = 1 if segments and segments[0][0] == 0xE0 else 0
+        segments = list(segments)
+        new = []
+        for index, segment in changes:
+            if index is None:
+                new.append(segment)
+            else:
+                segments[index] = segment
+        segments[insert_at:insert_at] = new
+        return b'\xff\xd8' + b''.join(_jpeg_segment(m, p) for m, p in segments) + rest
+
+    @staticmethod
+    def _write_png(data, exif_updates, xmp_updates):
+        chunks = _png_chunks(data)
+        if exif_updates:
+            existing = next((EXIF_HEADER + body for chunk_type, body in chunks if chunk_type == b'eXIf'), None)
+            exif = NativeMetadata._exif_bytes(existing, exif_updates)[len(EXIF_HEADER):]
+            chunks = [c for c in chunks if c[0] != b'eXIf']
+        existing_xmp = None
+        if xmp_updates:
+            kept = []
+            for chunk_type, body in chunks:
+                if chunk_type == b'iTXt':
+                    try:
+                        existing_xmp = _png_xmp(body)
+                        continue
+                    except LookupError:
+                        pass
+                kept.append((chunk_type, body))
+            chunks = kept
+
+        # Metadata chunks go before the image data
+        new = []
+        if exif_updates:
+            new.append((b'eXIf', exif))
+        if xmp_updates:
+            new.append((b'iTXt', XMP_PNG_KEYWORD + b'\x00\x00\x00\x00\x00' + _write_xmp(existing_xmp, xmp_updates)))
+        insert_at = next((i for i, (chunk_type, _) in enumerate(chunks) if chunk_type == b'IDAT'), len(chunks))
+        chunks[insert_at:insert_at] = new
+        return PNG_SIGNATURE + b''.join(_png_chunk(t, b) for t, b in chunks)
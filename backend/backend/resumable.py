@@ -0,0 +1,335 @@
+import base64
+import glob
+import hashlib
+import io
+import logging
+import os
+import shutil
+import threading
+from datetime import timedelta
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .encryption import (
+    ContentHasher, HASH_BLOCK_SIZE, HEADER_SIZE, TAG_SIZE, FORMAT_VERSION_GCM_STREAM,
+    DecryptedReader, new_header, seal_segment,
+)
+from .metadata_utils import MetadataExtractor
+
+logger = logging.getLogger(__name__)
+
+TUS_VERSION = '1.0.0'
+TUS_EXTENSIONS = 'creation,termination,checksum,expiration'
+CHECKSUM_ALGORITHMS = ('sha1', 'sha256', 'md5')
+READ_SIZE = 64 * 1024
+
+# Defaults for settings.RESUMABLE_UPLOADS
+DEFAULT_RESUMABLE_SETTINGS = {
+    'STAGING_DIR': os.path.join(settings.BASE_DIR, 'upload_staging'),  # must be outside MEDIA_ROOT
+    'MAX_SIZE': 2 * 1024 * 1024 * 1024,
+    'EXPIRY': 24 * 60 * 60,  # seconds an unfinished upload is kept
+}
+
+
+class OffsetMismatch(ValueError):
+    pass
+
+
+class ChecksumMismatch(ValueError):
+    pass
+
+
+def resumable_settings():
+    return {**DEFAULT_RESUMABLE_SETTINGS, **getattr(settings, 'RESUMABLE_UPLOADS', {})}
+
+
+class ResumableUpload:
+    """
+    tus-style resumable upload of one image. Each PATCHed chunk is hashed
+    and encrypted straight into a staging AES-GCM container with the key
+    the image will keep, one segment at a time. Bytes of a not yet complete
+    segment are kept in an encrypted tail file until the next chunk fills
+    it, so memory stays at one segment and finalizing is just a move.
+
+    Segments are HASH_BLOCK_SIZE long so the content hash can be carried
+    across requests as block digests only, with no plaintext stored.
+    """
+    SEGMENT_SIZE = HASH_BLOCK_SIZE
+
+    _dir_lock = threading.Lock()
+
+    def __init__(self, session):
+        self.session = session
+        self.key = bytes.fromhex(session.encryption_key)
+        self.header = bytes.fromhex(session.header)
+
+    @staticmethod
+    def staging_dir():
+        directory = resumable_settings()['STAGING_DIR']
+        media_root = os.path.realpath(settings.MEDIA_ROOT)
+        if os.path.commonpath([media_root, os.path.realpath(directory)]) == media_root:
+            raise ValueError("The upload staging directory must be outside MEDIA_ROOT")
+        with ResumableUpload._dir_lock:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        return directory
+
+    @property
+    def container_path(self):
+        return os.path.join(self.staging_dir(), f"{self.session.id}.part")
+
+    def _tail_path(self, offset):
+        # Named after the offset it ends at, so a tail written by a request
+        # whose transaction never committed can't be mistaken for the current one
+        return os.path.join(self.staging_dir(), f"{self.session.id}.tail.{offset}")
+
+    # === Creation ===
+
+    @classmethod
+    def create(cls, user, filename, total_size):
+        """Start an upload of ``total_size`` bytes; returns the UploadSession"""
+        from .models import UploadSession
+
+        config = resumable_settings()
+        if total_size <= 0:
+            raise ValueError("Upload-Length must be a positive integer")
+        if total_size > config['MAX_SIZE']:
+            raise ValueError(f"Uploads are limited to {config['MAX_SIZE']} bytes")
+
+        session = UploadSession.objects.create(
+            user=user,
+            filename=os.path.basename(filename or '')[:255] or 'upload',
+            total_size=total_size,
+            encryption_key=os.urandom(32).hex(),
+            header=new_header(cls.SEGMENT_SIZE).hex(),
+            expires_at=timezone.now() + timedelta(seconds=config['EXPIRY']),
+        )
+        upload = cls(session)
+        with open(upload.container_path, 'wb') as f:
+            f.write(upload.header)
+        return session
+
+    # === Receiving chunks ===
+
+    def _sealed_size(self):
+        return HEADER_SIZE + self.session.segments_sealed * (self.SEGMENT_SIZE + TAG_SIZE)
+
+    def _read_tail(self):
+        tail_start = self.session.segments_sealed * self.SEGMENT_SIZE
+        if self.session.offset == tail_start or self.session.is_complete:
+            return bytearray()
+        with open(self._tail_path(self.session.offset), 'rb') as f:
+            blob = f.read()
+        tail = AESGCM(self.key).decrypt(blob[:12], blob[12:], self._tail_aad(self.session.offset))
+        if tail_start + len(tail) != self.session.offset:
+            raise ValueError("Staged upload tail does not match the upload offset")
+        return bytearray(tail)
+
+    def _write_tail(self, tail, offset):
+        if not tail:
+            return
+        nonce = os.urandom(12)
+        path = self._tail_path(offset)
+        with open(f"{path}.tmp", 'wb') as f:
+            f.write(nonce + AESGCM(self.key).encrypt(nonce, bytes(tail), self._tail_aad(offset)))
+        os.replace(f"{path}.tmp", path)
+
+    def _tail_aad(self, offset):
+        return f"{self.session.id}:{offset}".encode()
+
+    def append(self, stream, offset, length, checksum=None):
+        """
+        Receive ``length`` bytes from ``stream`` starting at plaintext
+        ``offset``. The caller holds the session row lock. ``checksum`` is an
+        (algorithm, digest) pair from Upload-Checksum; without one, the bytes
+        that did arrive before a dropped connection are kept. Returns the new offset.
+        """
+        session = self.session
+        if session.status != 'uploading':
+            raise ValueError("Upload is already finalized")
+        if offset != session.offset:
+            raise OffsetMismatch(f"Upload-Offset is {session.offset}, not {offset}")
+        if length > session.total_size - offset:
+            raise ValueError("Chunk extends past Upload-Length")
+        if not length:
+            return session.offset
+        checksum_hash = hashlib.new(checksum[0]) if checksum else None
+
+        tail = self._read_tail()
+        old_offset = session.offset
+        sealed_size = self._sealed_size()
+        hasher = ContentHasher(block_digests=[
+            bytes.fromhex(session.block_digests[i:i + 64])
+            for i in range(0, len(session.block_digests), 64)
+        ])
+        aesgcm = AESGCM(self.key)
+        segment_start = session.segments_sealed * self.SEGMENT_SIZE
+        received = 0
+
+        with open(self.container_path, 'r+b') as container:
+            # Drop segments appended by a request that did not commit
+            container.truncate(sealed_size)
+            container.seek(sealed_size)
+
+            while received < length:
+                data = stream.read(min(READ_SIZE, length - received))
+                if not data:
+                    break
+                received += len(data)
+                tail += data
+                if checksum_hash:
+                    checksum_hash.update(data)
+
+                # Seal every completed segment; the last one may be short
+                while tail and (len(tail) >= self.SEGMENT_SIZE or
+                                segment_start + len(tail) == session.total_size):
+                    segment = bytes(tail[:self.SEGMENT_SIZE])
+                    del tail[:self.SEGMENT_SIZE]
+                    last = segment_start + len(segment) == session.total_size
+                    if session.segments_sealed == 0:
+                        session.mime_type = MetadataExtractor.sniff_mime_type(segment[:16])
+                    container.write(seal_segment(aesgcm, self.header, session.segments_sealed, segment, last))
+                    hasher.update(segment)
+                    session.segments_sealed += 1
+                    segment_start += len(segment)
+
+            if checksum_hash and (received != length or checksum_hash.digest() != checksum[1]):
+                container.truncate(sealed_size)
+                raise ChecksumMismatch("Upload-Checksum does not match the received bytes")
+
+        session.offset = old_offset + received
+        session.block_digests = ''.join(d.hex() for d in hasher.block_digests)
+        if session.is_complete:
+            session.content_hash = hasher.hexdigest()
+        self._write_tail(tail, session.offset)
+        session.save(update_fields=['offset', 'segments_sealed', 'block_digests', 'mime_type',
+                                    'content_hash', 'updated_at'])
+
+        if session.offset != old_offset:
+            stale = self._tail_path(old_offset)
+            transaction.on_commit(lambda: self._remove(stale))
+        return session.offset
+
+    # === Finalize / abort ===
+
+    def finalize(self):
+        """
+        Turn a complete upload into a UserImage. The staging container
+        already is the encrypted file, so it is moved into storage as is,
+        unless the user already has these bytes (then that file is shared).
+        The caller holds the session row lock.
+        """
+        from .models import UserImage
+
+        session = self.session
+        if session.user_image_id:
+            return session.user_image
+        if session.status == 'finalized':
+            raise ValueError("Upload was finalized and its image has since been deleted")
+        if not session.is_complete:
+            raise ValueError(f"Upload is incomplete ({session.offset} of {session.total_size} bytes)")
+
+        stem = os.path.splitext(session.filename)[0] or 'upload'
+        # Only the segments holding the headers are decrypted
+        with io.BufferedReader(DecryptedReader(open(self.container_path, 'rb'), self.key)) as staged:
+            probe = MetadataExtractor.probe_image(staged)
+
+        existing = UserImage.find_duplicate(session.user, session.content_hash)
+        if existing is not None:
+            # Already stored for this user: share that file, drop the staged copy
+            user_image = existing.duplicate(image_name=stem)
+            transaction.on_commit(self.discard)
+        else:
+            user_image = self._store(stem, probe)
+
+        session.status = 'finalized'
+        session.user_image = user_image
+        session.save(update_fields=['status', 'user_image', 'updated_at'])
+        return user_image
+
+    def _store(self, stem, probe):
+        """
+        Create the UserImage for the staged container. The container is only
+        moved into storage once the caller's transaction commits, so a
+        rollback leaves it staged (and the upload can be finalized again)
+        rather than orphaned in uploads/. The session id in the name keeps it
+        from being handed out twice before the file exists.
+        """
+        from .models import UserImage
+
+        session = self.session
+        name = default_storage.get_available_name(f"uploads/{stem}_{session.id.hex[:12]}.enc")
+        staged, destination = self.container_path, default_storage.path(name)
+        # Registered before save() queues processing, so the file is in place first
+        transaction.on_commit(lambda: self._move(staged, destination))
+
+        user_image = UserImage(
+            user=session.user,
+            image=name,
+            image_name=stem,
+            file_size=os.path.getsize(staged),
+            mime_type=session.mime_type,
+            file_type=MetadataExtractor.file_type_for_mime(
+                session.mime_type, os.path.splitext(session.filename)[1].lstrip('.').lower()[:10] or 'unknown'),
+            content_hash=session.content_hash,
+            encryption_key=session.encryption_key,
+            **probe,
+            encryption_params={
+                'algorithm': 'AES-GCM-STREAM',
+                'version': FORMAT_VERSION_GCM_STREAM,
+                'segment_size': self.SEGMENT_SIZE,
+                'key_length': len(self.key) * 8,
+            },
+        )
+        user_image.save()
+        return user_image
+
+    @staticmethod
+    def _move(source, destination):
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        try:
+            os.replace(source, destination)
+        except OSError:
+            # Staging directory on another filesystem
+            shutil.move(source, destination)
+
+    def discard(self):
+        """Remove the staging files of this upload"""
+        pattern = os.path.join(self.staging_dir(), f"{self.session.id}.*")
+        for path in glob.glob(pattern):
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def parse_upload_metadata(value):
+    """Decode a tus Upload-Metadata header ("key base64value,key2 ...")"""
+    metadata = {}
+    for pair in filter(None, (p.strip() for p in (value or '').split(','))):
+        key, _, encoded = pair.partition(' ')
+        try:
+            metadata[key] = base64.b64decode(encoded).decode('utf-8') if encoded else ''
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError(f"Invalid Upload-Metadata value for '{key}'")
+    return metadata
+
+
+def parse_upload_checksum(value):
+    """Parse an Upload-Checksum header ("sha256 base64digest") into (algorithm, digest)"""
+    if not value:
+        return None
+    algorithm, _, encoded = value.strip().partition(' ')
+    if algorithm.lower() not in CHECKSUM_ALGORITHMS:
+        raise ValueError(f"Unsupported checksum algorithm '{algorithm}'")
+    try:
+        return algorithm.lower(), base64.b64decode(encoded, validate=True)
+    except ValueError:
+        raise ValueError("Invalid Upload-Checksum digest")
@@ -0,0 +1,149 @@
+"""
+Microbenchmark for organizing raw exiftool output by TARGET_SCHEMA: the
+original per-field candidate search against the compiled SchemaIndex.
+
+    python -m backend.scripts.schema_benchmark [photo.jpg | dump.json ...]
+
+Images are read with exiftool (all tags, ``-a -G``), so camera files give
+their full 300+ tags; ``.json`` files are ``exiftool -j -a -G`` dumps.
+Without arguments a synthetic 350-tag camera dump is used. Both versions
+must produce identical output.
+"""
+
+import json
+import sys
+import timeit
+
+from backend.metadata_utils import TARGET_SCHEMA, SCHEMA_INDEX, MetadataExtractor
+from backend.exiftool_pool import get_exiftool_pool
+
+
+def legacy_organize(raw_metadata, filename):
+    """organize_by_schema as it was before the schema was compiled"""
+    organized = {}
+    for category, sections in TARGET_SCHEMA.items():
+        organized[category] = {}
+        for section, fields in sections.items():
+            organized[category][section] = {}
+            for field in fields:
+                field_name = field["name"]
+                value = None
+                if category == "XMP":
+                    xmp_path = field.get("xmp_path", field_name)
+                    possible_keys = [
+                        xmp_path,
+                        f"XMP:{xmp_path}",
+                        f"XMP-{xmp_path.split(':')[0]}:{xmp_path.split(':')[1] if ':' in xmp_path else xmp_path}",
+                        f"XMP-dc:{field_name}" if "dc:" in xmp_path else None,
+                        f"XMP-xmp:{field_name}" if "xmp:" in xmp_path else None,
+                        f"XMP-xmpRights:{field_name}" if "xmpRights:" in xmp_path else None,
+                        f"XMP-photoshop:{field_name}" if "photoshop:" in xmp_path else None
+                    ]
+                    possible_keys = [k for k in possible_keys if k]
+                    for key in possible_keys:
+                        if key in raw_metadata:
+                            value = raw_metadata[key]
+                            break
+                    for key in raw_metadata:
+                        if "[XMP]" in key and field_name in key:
+                            value = raw_metadata[key]
+                            break
+                else:
+                    possible_keys = [field_name, f"{category}:{field_name}", f"{category.lower()}:{field_name}"]
+                    for key in possible_keys:
+                        if key in raw_metadata:
+                            value = raw_metadata[key]
+                            break
+                if field_name == "FileName":
+                    value = filename
+                metadata_obj = {"value": value, "type": field.get("type"), "label": field.get("label")}
+                for prop in ("readonly", "placeholder", "step", "min", "max"):
+                    if prop in field:
+                        metadata_obj[prop] = field[prop]
+                organized[category][section][field_name] = metadata_obj
+    return organized
+
+
+def legacy_assignments(metadata):
+    """metadata_assignments as it was: the XMP schema walked for every tag"""
+    assignments = []
+    for main_cat, subcats in metadata.items():
+        if main_cat in ['EXIF', 'IPTC', 'XMP']:
+            for subcat, tags in subcats.items():
+                for tag, value_obj in tags.items():
+                    value = value_obj.get("value") if isinstance(value_obj, dict) else value_obj
+                    if value is None or tag == "FileName":
+                        continue
+                    if main_cat == 'XMP':
+                        xmp_path = None
+                        for section in TARGET_SCHEMA['XMP'].values():
+                            for field in section:
+                                if field['name'] == tag:
+                                    xmp_path = field.get('xmp_path', tag)
+                                    break
+                            if xmp_path:
+                                break
+                        if xmp_path and ':' in xmp_path:
+                            namespace, prop = xmp_path.split(':', 1)
+                            assignments.append((f'XMP-{namespace}', prop, value))
+                        else:
+                            assignments.append(('XMP', tag, value))
+                    else:
+                        assignments.append((main_cat, tag, value))
+    return assignments
+
+
+def synthetic_dump(tags=350):
+    """A camera-like dump: the schema's own keys plus maker notes and composites"""
+    raw = {'SourceFile': 'IMG_0001.JPG', 'File:FileType': 'JPEG', 'File:MIMEType': 'image/jpeg'}
+    for category, sections in TARGET_SCHEMA.items():
+        for fields in sections.values():
+            for field in fields:
+                if category == 'XMP':
+                    prefix, _, prop = field['xmp_path'].partition(':')
+                    raw[f"XMP-{prefix}:{prop[:1].upper()}{prop[1:]}"] = f"{field['name']} value"
+                else:
+                    raw[f"{category}:{field['name']}"] = f"{field['name']} value"
+    groups = ['MakerNotes', 'Composite', 'EXIF', 'ICC_Profile', 'File']
+    i = 0
+    while len(raw) < tags:
+        raw[f"{groups[i % len(groups)]}:Tag{i:04d}"] = i
+        i += 1
+    return raw
+
+
+def load_inputs(paths):
+    dumps = []
+    for path in paths:
+        if path.endswith('.json'):
+            with open(path) as f:
+                data = json.load(f)
+            dumps.extend(data if isinstance(data, list) else [data])
+        else:
+            dumps.append(get_exiftool_pool().get_metadata(path, '-a', '-G'))
+    return dumps
+
+
+def compare(label, legacy, indexed, number=2000):
+    legacy_time = min(timeit.repeat(legacy, number=number, repeat=5)) / number
+    indexed_time = min(timeit.repeat(indexed, number=number, repeat=5)) / number
+    print(f"  {label:<9} legacy {legacy_time * 1e6:7.1f} us  indexed {indexed_time * 1e6:7.1f} us  "
+          f"speedup {legacy_time / indexed_time:.1f}x")
+
+
+def main(paths):
+    dumps = load_inputs(paths) if paths else [synthetic_dump()]
+    for raw in dumps:
+        name = raw.get('SourceFile', '?')
+        organized = SCHEMA_INDEX.organize(raw, name)
+        assert legacy_organize(raw, name) == organized, f"Organized output differs for {name}"
+        assert legacy_assignments(organized) == MetadataExtractor.metadata_assignments(organized), \
+            f"Assignments differ for {name}"
+        print(f"{name}: {len(raw)} tags")
+        compare('organize', lambda: legacy_organize(raw, name), lambda: SCHEMA_INDEX.organize(raw, name))
+        compare('embed', lambda: legacy_assignments(organized),
+                lambda: MetadataExtractor.metadata_assignments(organized))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
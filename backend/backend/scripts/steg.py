@@ -2,38 +2,56 @@ import numpy as np
 import cv2
 from pywt import dwt2, idwt2
 class TextSteganography:
+    # Set in the length header when the payload is UTF-8 rather than one
+    # byte per character (Latin-1), so older messages read back unchanged
+    UTF8_FLAG = 1 << 31
+
     def __init__(self):
         self.bits_per_char = 8
         self.length_bits = 32
         self.embedding_strength = 0.2  # Adjust as needed for stability
 
+    def encode_payload(self, text):
+        """
+        Message bytes and the 32-bit length header. Text that fits Latin-1
+        is one byte per character, as it always was; anything else is
+        UTF-8 with UTF8_FLAG set in the header.
+        """
+        try:
+            data = text.encode('latin-1')
+            header = len(data)
+        except UnicodeEncodeError:
+            data = text.encode('utf-8')
+            header = len(data) | self.UTF8_FLAG
+        return header.to_bytes(self.length_bits // 8, 'big') + data
+
+    def payload_bits(self, text):
+        """Message as a uint8 array of bits, the 32-bit length header first"""
+        return np.unpackbits(np.frombuffer(self.encode_payload(text), dtype=np.uint8))
+
+    def decode_payload(self, bits):
+        """Text of a bit array (header first), the inverse of payload_bits"""
+        header = int.from_bytes(np.packbits(bits[:self.length_bits]).tobytes(), 'big')
+        length = header & ~self.UTF8_FLAG
+        payload = bits[self.length_bits:self.length_bits + length * self.bits_per_char]
+        # A header read from an unmarked image can claim more than is there; whole bytes only
+        data = np.packbits(payload[:payload.size - payload.size % 8]).tobytes()
+        if header & self.UTF8_FLAG:
+            return data.decode('utf-8', errors='replace')
+        return data.decode('latin-1')
+
     def text_to_bits(self, text):
         """
         Convert text to a binary string with a 32-bit length header.
         """
-        length = len(text)
-        # Format length into a 32-bit binary string
-        length_bits = format(length, '032b')
-        # Convert each character to its 8-bit binary representation
-        text_bits = ''.join(format(ord(c), '08b') for c in text)
-        return length_bits + text_bits
+        return ''.join('1' if bit else '0' for bit in self.payload_bits(text))
 
     def bits_to_text(self, bits):
         """
         Convert a binary string back to text.
         Assumes the first 32 bits encode the message length.
         """
-        # Get message length from the first 32 bits
-        length_bits = bits[:32]
-        length = int(length_bits, 2)
-        # Extract the bits corresponding to the actual message
-        text_bits = bits[32:32 + length * self.bits_per_char]
-        text = ''
-        for i in range(0, len(text_bits), 8):
-            byte = text_bits[i:i+8]
-            if len(byte) == 8:
-                text += chr(int(byte, 2))
-        return text
+        return self.decode_payload(np.frombuffer(bits.encode('ascii'), dtype=np.uint8) - ord('0'))
 
     def modify_coefficient(self, coeff, bit):
         """
@@ -53,6 +71,23 @@ class TextSteganography:
         # If diff is positive, interpret it as a '1'; otherwise, a '0'
         return '1' if diff > 0 else '0'
 
+    def max_message_length(self, width, height):
+        """
+        Longest message (in bytes, so characters of Latin-1 text) an image
+        of this size can carry, from its dimensions alone. dwt2 with 'haar'
+        halves each axis, rounding up.
+        """
+        coefficients = ((height + 1) // 2) * ((width + 1) // 2)
+        return max(0, (coefficients - self.length_bits) // self.bits_per_char)
+
+    def check_capacity(self, width, height, message):
+        """Raise ValueError if the message can't fit, without reading the image"""
+        max_chars = self.max_message_length(width, height)
+        if len(self.encode_payload(message)) - self.length_bits // 8 > max_chars:
+            raise ValueError(
+                f"Image too small. Maximum message length for this image is {max_chars} characters."
+            )
+
     def embed_message(self, image_path, message):
         """
         Embed a secret message into the blue channel of the image using DWT.
@@ -63,9 +98,13 @@ class TextSteganography:
         if image is None:
             raise ValueError("Could not read image. Check the image path.")
 
-        # Convert the message into a binary string (including a 32-bit length header)
-        binary_data = self.text_to_bits(message)
-        total_bits = len(binary_data)
+        return self.embed_image(image, message)
+
+    def embed_image(self, image, message):
+        """embed_message for a BGR image array that is already decoded"""
+        # The message as an array of bits (including a 32-bit length header)
+        bits = self.payload_bits(message)
+        total_bits = bits.size
 
         # Work with the blue channel (index 0)
         blue_channel = image[:, :, 0].astype(float)
@@ -82,13 +121,14 @@ class TextSteganography:
                 f"Maximum message length for this image is {max_chars} characters."
             )
 
-        # Flatten the cD coefficients for sequential embedding
-        cD_flat = cD.flatten()
-        modified_coeffs = cD_flat.copy()
+        # Flatten the cD coefficients (a copy) for sequential embedding
+        modified_coeffs = cD.flatten()
 
-        # Embed each bit into the corresponding coefficient
-        for i, bit in enumerate(binary_data):
-            modified_coeffs[i] = self.modify_coefficient(cD_flat[i], bit)
+        # One bit per coefficient: quantize to steps of 0.5, then offset up for
+        # a 1 and down for a 0. np.round rounds halves to even like round().
+        head = modified_coeffs[:total_bits]
+        modified_coeffs[:total_bits] = (np.round(head * 2) / 2 +
+                                        np.where(bits == 1, self.embedding_strength, -self.embedding_strength))
 
         # Reshape the modified coefficients back to the original shape
         cD_modified = modified_coeffs.reshape(cD.shape)
@@ -112,16 +152,9 @@ class TextSteganography:
         cA, (cH, cV, cD) = coeffs
         cD_flat = cD.flatten()
 
-        # Extract the first 32 bits to determine the message length
-        length_bits = ''.join(self.extract_bit(coeff) for coeff in cD_flat[:32])
-        message_length = int(length_bits, 2)
-
-        # Calculate the total number of bits required (header + message)
-        total_bits_needed = self.length_bits + message_length * self.bits_per_char
-
-        # Extract exactly the required number of bits from the coefficients
-        bits = ''.join(self.extract_bit(coeff) for coeff in cD_flat[:total_bits_needed])
-        return self.bits_to_text(bits)
+        # A bit is 1 where the coefficient sits above its 0.5 quantization step
+        bits = (cD_flat - np.round(cD_flat * 2) / 2 > 0).astype(np.uint8)
+        return self.decode_payload(bits)
 
 def test_steganography(image_path, message):
     """
@@ -0,0 +1,118 @@
+"""
+Benchmark for TextSteganography: the original per-bit embedding and
+extraction against the vectorized ones, for messages from 16 bytes up to
+the image's capacity.
+
+    python -m backend.scripts.steg_benchmark [image.png]
+
+Without an image a 1024x768 noise image is used. Both versions must
+produce identical stego images, and read back the same message from the
+unquantized stego channel.
+"""
+
+import random
+import sys
+import timeit
+
+import cv2
+import numpy as np
+from pywt import dwt2, idwt2
+
+from backend.scripts.steg import TextSteganography
+
+
+def legacy_embed(stego, image, message, binary_data=None, quantize=True):
+    """
+    embed_message as it was: a '0'/'1' string and round() per coefficient.
+    With ``quantize=False`` the blue channel is left as floats, so the
+    message survives and extraction can be checked.
+    """
+    if binary_data is None:
+        length_bits = format(len(message), '032b')
+        binary_data = length_bits + ''.join(format(ord(c), '08b') for c in message)
+
+    cA, (cH, cV, cD) = dwt2(image[:, :, 0].astype(float), 'haar')
+    cD_flat = cD.flatten()
+    modified_coeffs = cD_flat.copy()
+    for i, bit in enumerate(binary_data):
+        base = round(cD_flat[i] * 2) / 2
+        offset = stego.embedding_strength if bit == '1' else -stego.embedding_strength
+        modified_coeffs[i] = base + offset
+
+    blue_channel_stego = idwt2((cA, (cH, cV, modified_coeffs.reshape(cD.shape))), 'haar')
+    if not quantize:
+        stego_image = image.astype(float)
+        stego_image[:, :, 0] = blue_channel_stego
+        return stego_image
+    stego_image = image.copy()
+    stego_image[:, :, 0] = np.clip(blue_channel_stego, 0, 255).astype(np.uint8)
+    return stego_image
+
+
+def legacy_extract(stego_image):
+    """extract_message as it was"""
+    cA, (cH, cV, cD) = dwt2(stego_image[:, :, 0].astype(float), 'haar')
+    cD_flat = cD.flatten()
+
+    def bit(coeff):
+        return '1' if coeff - round(coeff * 2) / 2 > 0 else '0'
+
+    length = int(''.join(bit(c) for c in cD_flat[:32]), 2)
+    bits = ''.join(bit(c) for c in cD_flat[:32 + length * 8])[32:]
+    return ''.join(chr(int(bits[i:i + 8], 2)) for i in range(0, len(bits) - len(bits) % 8, 8))
+
+
+def message_lengths(capacity):
+    lengths = [16]
+    while lengths[-1] * 4 < capacity:
+        lengths.append(lengths[-1] * 4)
+    return lengths + [capacity]
+
+
+def best_of(func, budget=1.0):
+    """Seconds per call, the best of a few runs sized to roughly ``budget`` seconds"""
+    once = timeit.timeit(func, number=1)
+    repeat = max(1, min(5, int(budget / max(once, 1e-6))))
+    return min([once] + timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main(paths):
+    if paths:
+        image = cv2.imread(paths[0])
+        if image is None:
+            raise SystemExit(f"Could not read {paths[0]}")
+    else:
+        image = np.random.default_rng(0).integers(0, 256, (768, 1024, 3), dtype=np.uint8)
+
+    stego = TextSteganography()
+    height, width = image.shape[:2]
+    capacity = stego.max_message_length(width, height)
+    print(f"{width}x{height}: capacity {capacity} bytes")
+
+    rng = random.Random(0)
+    # Latin-1, the range the original encoding handles
+    alphabet = [chr(c) for c in range(32, 127)] + [chr(c) for c in range(160, 256)]
+    for length in message_lengths(capacity):
+        message = ''.join(rng.choice(alphabet) for _ in range(length))
+        embedded = stego.embed_image(image, message)
+        assert np.array_equal(legacy_embed(stego, image, message), embedded), f"Stego image differs at {length} bytes"
+        unquantized = legacy_embed(stego, image, message, quantize=False)
+        assert stego.extract_message(unquantized) == legacy_extract(unquantized) == message, \
+            f"Extraction differs at {length} bytes"
+
+        legacy_time = best_of(lambda: legacy_embed(stego, image, message))
+        vector_time = best_of(lambda: stego.embed_image(image, message))
+        legacy_read = best_of(lambda: legacy_extract(embedded))
+        vector_read = best_of(lambda: stego.extract_message(embedded))
+        print(f"  {length:>7} B  embed legacy {legacy_time * 1e3:8.1f} ms  vectorized {vector_time * 1e3:6.1f} ms "
+              f"({legacy_time / vector_time:5.1f}x)   extract legacy {legacy_read * 1e3:8.1f} ms  "
+              f"vectorized {vector_read * 1e3:6.1f} ms ({legacy_read / vector_read:5.1f}x)")
+
+    message = 'Ünïcode ✓ 水印 ' * 4
+    unquantized = legacy_embed(stego, image, None, binary_data=stego.text_to_bits(message), quantize=False)
+    assert stego.extract_message(unquantized) == message
+    print(f"  UTF-8 round trip ok ({len(message.encode('utf-8'))} bytes)")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
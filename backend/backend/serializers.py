@@ -2,6 +2,7 @@ from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
 from .models import UserImage, UserProfile, WatermarkSettings, AIProtectionSettings
+from .metadata_utils import MetadataExtractor, InvalidImage
 from django.contrib.auth.hashers import make_password
 from django.urls import reverse
 import re
@@ -98,16 +99,62 @@ class UserImageSerializer(serializers.ModelSerializer):
         # Format: "January 3, 2025 5:44 PM"
         return obj.created_at.strftime("%B %d, %Y %I:%M %p")
 
+    def validate_image(self, value):
+        # Header-only check, before the upload is encrypted and stored
+        try:
+            MetadataExtractor.probe_image(value)
+        except InvalidImage as e:
+            raise serializers.ValidationError(str(e))
+        value.seek(0)
+        return value
+
 
 
 from django.urls import reverse
+from .signed_urls import RENDER_SCOPE, signed_path
+
+class DerivativeUrlsMixin:
+    """
+    thumbnail_url and srcset pointing at the encrypted WebP derivatives, and
+    render_url, the base of images/<id>/render/ URLs (append &w=&fmt=&q=).
+    These serializers only serve the owner, so the URLs are signed for them
+    and work in <img> tags without the Authorization header.
+    """
+    THUMBNAIL_WIDTH = 256
+
+    def _signed_url(self, obj, path, scope):
+        path = signed_path(path, obj.id, scope, obj.user_id)
+        request = self.context.get('request')
+        return request.build_absolute_uri(path) if request else path
 
-class UserImageListSerializer(serializers.ModelSerializer):
+    def _derivative_url(self, obj, width):
+        return self._signed_url(obj, reverse('serve_image_thumbnail', args=[obj.id, width]), width)
+
+    def get_render_url(self, obj):
+        return self._signed_url(obj, reverse('render_image', args=[obj.id]), RENDER_SCOPE)
+
+    def get_thumbnail_url(self, obj):
+        derivative = obj.get_derivative(self.THUMBNAIL_WIDTH)
+        if derivative is None:
+            return self.get_image_url(obj)
+        return self._derivative_url(obj, derivative.width)
+
+    def get_srcset(self, obj):
+        return ', '.join(
+            f"{self._derivative_url(obj, derivative.width)} {derivative.pixel_width}w"
+            for derivative in obj.derivatives.all()
+        )
+
+class UserImageListSerializer(DerivativeUrlsMixin, serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
+    render_url = serializers.SerializerMethodField()
 
     class Meta:
         model = UserImage
-        fields = ['id', 'image_url', 'image_name', 'file_size', 'file_type', 'created_at',
+        fields = ['id', 'image_url', 'thumbnail_url', 'srcset', 'render_url', 'image_name', 'file_size', 'file_type', 'created_at',
+                 'width', 'height', 'megapixels', 'format',
                  'watermark_enabled', 'hidden_watermark_enabled', 'metadata_enabled',
                  'ai_protection_enabled', 'access_control_enabled']
 
@@ -124,17 +171,21 @@ class UserImageListSerializer(serializers.ModelSerializer):
         return obj.image.url
 
 
-class SpecificImageSerializer(serializers.ModelSerializer):
+class SpecificImageSerializer(DerivativeUrlsMixin, serializers.ModelSerializer):
     created_at = serializers.SerializerMethodField()
     file_size = serializers.SerializerMethodField()
     file_type = serializers.CharField()     # Add this
     security = serializers.SerializerMethodField()
     image_url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
+    render_url = serializers.SerializerMethodField()
 
 
     class Meta:
         model = UserImage
-        fields = ['id', 'image_url', 'image_name', 'created_at', 'file_size', 'file_type', 'security']  # Include new fields
+        fields = ['id', 'image_url', 'thumbnail_url', 'srcset', 'render_url', 'image_name', 'created_at', 'file_size', 'file_type',
+                  'width', 'height', 'megapixels', 'format', 'color_mode', 'security']  # Include new fields
 
     def get_created_at(self, obj):
         return obj.created_at.strftime("%B %d, %Y %I:%M %p")
@@ -467,3 +518,12 @@ class AccountDeletionSerializer(serializers.Serializer):
             raise serializers.ValidationError({"confirmation": "Please type 'delete my account' to confirm."})
         
         return data
+
+from .models import Job
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = ['id', 'kind', 'lane', 'status', 'progress', 'attempts', 'max_attempts',
+                  'result', 'error', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
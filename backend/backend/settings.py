@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 from pathlib import Path
 import os
 from datetime import timedelta
+from corsheaders.defaults import default_headers
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -66,6 +67,11 @@ CORS_ALLOWED_ORIGINS = [
 # If you need to allow credentials (cookies, authorization headers)
 CORS_ALLOW_CREDENTIALS = True
 
+# Headers of the tus resumable upload protocol
+CORS_ALLOW_HEADERS = (*default_headers, 'tus-resumable', 'upload-length', 'upload-offset',
+                      'upload-metadata', 'upload-checksum')
+CORS_EXPOSE_HEADERS = ['Location', 'Tus-Resumable', 'Upload-Offset', 'Upload-Length', 'Upload-Expires']
+
 ROOT_URLCONF = 'backend.urls'
 
 TEMPLATES = [
@@ -166,6 +172,34 @@ CACHES = {
     }
 }
 
+# Resumable uploads (uploads/ endpoints, see backend/resumable.py); partial
+# uploads are staged encrypted here, which must not be inside MEDIA_ROOT
+RESUMABLE_UPLOADS = {
+    'STAGING_DIR': os.getenv('UPLOAD_STAGING_DIR', os.path.join(BASE_DIR, 'upload_staging')),
+    'MAX_SIZE': 2 * 1024 * 1024 * 1024,
+    'EXPIRY': 24 * 60 * 60,
+}
+
+# Largest accepted image in pixels; checked from the headers at upload
+IMAGE_MAX_PIXELS = 250_000_000
+
+# Batch uploads (upload/batch/, see backend/batch_upload.py)
+BATCH_UPLOAD = {
+    'WORKERS': int(os.getenv('BATCH_UPLOAD_WORKERS', min(4, os.cpu_count() or 1))),
+    'MAX_FILES': 500,
+    'MAX_TOTAL_SIZE': 4 * 1024 * 1024 * 1024,
+}
+# Django rejects requests with more file parts than this (default 100)
+DATA_UPLOAD_MAX_NUMBER_FILES = BATCH_UPLOAD['MAX_FILES']
+
+# Long-lived exiftool processes (see backend/exiftool_pool.py)
+EXIFTOOL = {
+    'PATH': os.getenv('EXIFTOOL_PATH', 'exiftool'),
+    'WORKERS': int(os.getenv('EXIFTOOL_WORKERS', 2)),
+    'TIMEOUT': 30,
+    'MAX_REQUESTS': 1000,
+}
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
@@ -196,6 +230,30 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.getenv('HOST_MAIL')
 EMAIL_HOST_PASSWORD = os.getenv('MAIL_PASSWORD')
 
+# Decrypted image bodies kept for the serve path (see backend/image_cache.py)
+DECRYPTED_IMAGE_CACHE = {
+    'MAX_BYTES': 256 * 1024 * 1024,
+    'MAX_ITEM_BYTES': 32 * 1024 * 1024,
+    'TTL': 300,
+    # Optional tier shared by all workers; must not be inside MEDIA_ROOT
+    'DISK_DIR': os.getenv('DECRYPTED_IMAGE_CACHE_DIR'),
+    'DISK_MAX_BYTES': 2 * 1024 * 1024 * 1024,
+}
+
+# Background jobs (backend/jobs.py) are run by `manage.py runjobs`; set
+# JOBS_RUN_INLINE=1 to run them inside the request instead (no worker needed)
+JOBS_RUN_INLINE = os.getenv('JOBS_RUN_INLINE', '') == '1'
+
+# Encrypted on-disk cache of images/<id>/render/ output (see backend/derivatives.py)
+RENDER_CACHE = {
+    'DIR': os.getenv('RENDER_CACHE_DIR', os.path.join(BASE_DIR, 'render_cache')),
+    'MAX_BYTES': 1024 * 1024 * 1024,
+}
+
+# Lifetime in seconds of the signed thumbnail/render URLs in API responses
+# (see backend/signed_urls.py)
+SIGNED_IMAGE_URL_MAX_AGE = 60 * 60
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
@@ -0,0 +1,39 @@
+"""
+Short-lived signed URLs for the image endpoints. ``<img src>`` and srcset
+requests can't send the JWT Authorization header, so URLs handed to the
+owner carry ``?sig=``: a TimestampSigner signature over the image id, the
+scope (a thumbnail width, or RENDER_SCOPE for any render of the image) and
+the user id, valid for settings.SIGNED_IMAGE_URL_MAX_AGE seconds.
+"""
+
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core import signing
+
+RENDER_SCOPE = 'render'
+DEFAULT_MAX_AGE = 60 * 60
+
+_signer = signing.TimestampSigner(salt='backend.signed-image-url')
+
+
+def sign(image_id, scope, user_id):
+    return _signer.sign(f"{image_id}:{scope}:{user_id}")
+
+
+def signed_path(path, image_id, scope, user_id):
+    """``path`` with a signature for ``user_id`` appended as ?sig="""
+    return f"{path}?{urlencode({'sig': sign(image_id, scope, user_id)})}"
+
+
+def signed_user_id(signature, image_id, scope):
+    """The user id a valid, unexpired signature for (image_id, scope) was made for, else None"""
+    max_age = getattr(settings, 'SIGNED_IMAGE_URL_MAX_AGE', DEFAULT_MAX_AGE)
+    try:
+        value = _signer.unsign(signature, max_age=max_age)
+    except signing.BadSignature:  # also SignatureExpired
+        return None
+    signed_image, signed_scope, user_id = value.split(':')
+    if signed_image != str(image_id) or signed_scope != str(scope):
+        return None
+    return int(user_id)
@@ -0,0 +1,81 @@
+import io
+import os
+import tempfile
+import tracemalloc
+
+from cryptography.exceptions import InvalidTag
+from django.test import SimpleTestCase
+
+from backend.encryption import (
+    DECRYPT_WORKERS, HEADER_SIZE, KEY_SIZE, SEGMENT_SIZE, TAG_SIZE,
+    decrypt_file_buffer, encrypt_aes_cbc, encrypt_stream,
+)
+
+SIZE = 32 * 1024 * 1024
+# Peak traced allocations while decrypting, relative to the plaintext size,
+# on top of the ciphertext segments the decrypt pool holds in flight
+MAX_RATIO = 1.25
+IN_FLIGHT = (DECRYPT_WORKERS + 1) * (SEGMENT_SIZE + TAG_SIZE)
+
+
+class DecryptMemoryTests(SimpleTestCase):
+    """decrypt_file_buffer decrypts into one buffer instead of holding copies"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.key = os.urandom(KEY_SIZE)
+        cls.plaintext = os.urandom(SIZE)
+
+    def encrypted_file(self, write):
+        with tempfile.NamedTemporaryFile(delete=False) as dst:
+            write(dst)
+        self.addCleanup(os.remove, dst.name)
+        return dst.name
+
+    def assert_peak_within_limit(self, write):
+        path = self.encrypted_file(write)
+        tracemalloc.start()
+        try:
+            decrypted = decrypt_file_buffer(path, self.key)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(decrypted, self.plaintext)
+        self.assertLessEqual(peak, SIZE * MAX_RATIO + IN_FLIGHT,
+                             f"peak {peak / 1024 / 1024:.1f} MB for {SIZE / 1024 / 1024:.0f} MB")
+
+    def test_aes_gcm_stream(self):
+        self.assert_peak_within_limit(lambda dst: encrypt_stream(io.BytesIO(self.plaintext), dst, self.key))
+
+    def test_legacy_aes_cbc(self):
+        self.assert_peak_within_limit(lambda dst: dst.write(encrypt_aes_cbc(self.plaintext, self.key)))
+
+
+class DecryptFileBufferTests(SimpleTestCase):
+
+    def encrypted_file(self, plaintext, key):
+        with tempfile.NamedTemporaryFile(delete=False) as dst:
+            encrypt_stream(io.BytesIO(plaintext), dst, key)
+        self.addCleanup(os.remove, dst.name)
+        return dst.name
+
+    def test_segments_decrypted_on_the_pool(self):
+        key = os.urandom(KEY_SIZE)
+        for size in (0, 100, SEGMENT_SIZE, 5 * SEGMENT_SIZE + 123):
+            plaintext = os.urandom(size)
+            path = self.encrypted_file(plaintext, key)
+            for workers in (1, 4):
+                with self.subTest(size=size, workers=workers):
+                    self.assertEqual(decrypt_file_buffer(path, key, workers=workers), plaintext)
+
+    def test_tampered_segment(self):
+        key = os.urandom(KEY_SIZE)
+        path = self.encrypted_file(os.urandom(3 * SEGMENT_SIZE), key)
+        with open(path, 'r+b') as f:
+            f.seek(HEADER_SIZE + SEGMENT_SIZE + TAG_SIZE + 10)
+            byte = f.read(1)
+            f.seek(-1, os.SEEK_CUR)
+            f.write(bytes([byte[0] ^ 1]))
+        with self.assertRaises(InvalidTag):
+            decrypt_file_buffer(path, key, workers=4)
@@ -0,0 +1,131 @@
+import io
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from backend import jobs
+from backend.models import ImageAccess, UserImage
+from backend.signed_urls import RENDER_SCOPE, sign
+
+
+def jpeg(size=(640, 480)):
+    pixels = np.random.default_rng(0).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+    output = io.BytesIO()
+    Image.fromarray(pixels).save(output, 'JPEG')
+    return output.getvalue()
+
+
+class SignedImageUrlTests(TestCase):
+    """Thumbnail and render endpoints, which <img> tags fetch without an Authorization header"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.render_dir = tempfile.mkdtemp()
+        cls.settings = override_settings(
+            MEDIA_ROOT=cls.media_root,
+            RENDER_CACHE={'DIR': cls.render_dir, 'MAX_BYTES': 1024 * 1024},
+            JOBS_RUN_INLINE=False,
+        )
+        cls.settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        shutil.rmtree(cls.render_dir, ignore_errors=True)
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', 'owner@example.com', 'pw')
+        self.other = User.objects.create_user('other', 'other@example.com', 'pw')
+        image = UserImage(user=self.owner, image=SimpleUploadedFile('photo.jpg', jpeg(), 'image/jpeg'))
+        image.save()
+        jobs.run_job(jobs.claim_next('test', ['interactive']))
+        self.image = UserImage.objects.get(pk=image.pk)
+        self.width = self.image.get_derivative(256).width
+
+        api = APIClient()
+        api.force_authenticate(self.owner)
+        self.listing = api.get('/images/').json()['results'][0]
+
+    def urls(self):
+        return {
+            'thumbnail': (f'/images/{self.image.id}/thumbnail/{self.width}/', self.width),
+            'render': (f'/images/{self.image.id}/render/?w=64&fmt=jpeg', RENDER_SCOPE),
+        }
+
+    def get(self, url, **params):
+        return self.client.get(url, params)
+
+    def test_listing_urls_work_without_headers(self):
+        self.assertEqual(self.listing['id'], self.image.id)
+        for url in [self.listing['thumbnail_url']] + [entry.split()[0] for entry in self.listing['srcset'].split(', ')]:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.get(self.listing['render_url'] + '&w=64&fmt=jpeg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+
+    def test_owner(self):
+        for name, (url, scope) in self.urls().items():
+            with self.subTest(name):
+                self.assertEqual(self.client.get(url).status_code, 404)
+                self.assertEqual(self.client.get(
+                    url, HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.owner)}').status_code, 200)
+                self.client.force_login(self.owner)
+                self.assertEqual(self.client.get(url).status_code, 200)
+                self.client.logout()
+
+    def test_signature_of_another_user(self):
+        for name, (url, scope) in self.urls().items():
+            with self.subTest(name):
+                self.assertEqual(self.get(url, sig=sign(self.image.id, scope, self.other.id)).status_code, 404)
+                self.assertEqual(self.client.get(
+                    url, HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.other)}').status_code, 404)
+
+    def test_signature_scope(self):
+        thumbnail, _ = self.urls()['thumbnail']
+        render, _ = self.urls()['render']
+        self.assertEqual(self.get(thumbnail, sig=sign(self.image.id, self.width, self.owner.id)).status_code, 200)
+        # Signed for another width, another image, or tampered with
+        self.assertEqual(self.get(thumbnail, sig=sign(self.image.id, self.width + 1, self.owner.id)).status_code, 404)
+        self.assertEqual(self.get(thumbnail, sig=sign(self.image.id, RENDER_SCOPE, self.owner.id)).status_code, 404)
+        self.assertEqual(self.get(render, sig=sign(self.image.id, self.width, self.owner.id)).status_code, 404)
+        self.assertEqual(self.get(thumbnail, sig=sign(self.image.id + 1, self.width, self.owner.id)).status_code, 404)
+        self.assertEqual(self.get(thumbnail, sig=sign(self.image.id, self.width, self.owner.id) + 'x').status_code, 404)
+
+    def test_expired_signature(self):
+        for name, (url, scope) in self.urls().items():
+            with self.subTest(name):
+                signature = sign(self.image.id, scope, self.owner.id)
+                with override_settings(SIGNED_IMAGE_URL_MAX_AGE=60), \
+                        mock.patch('time.time', return_value=time.time() + 120):
+                    self.assertEqual(self.get(url, sig=signature).status_code, 404)
+
+    def test_share_token(self):
+        access = ImageAccess.objects.create(user_image=self.image, access_name='share')
+        for name, (url, scope) in self.urls().items():
+            with self.subTest(name):
+                self.assertEqual(self.get(url, token=access.token).status_code, 200)
+        ImageAccess.objects.filter(pk=access.pk).update(max_views=1, current_views=1)
+        for name, (url, scope) in self.urls().items():
+            with self.subTest(name):
+                self.assertEqual(self.get(url, token=access.token).status_code, 404)
+
+    def test_share_token_of_another_image(self):
+        other_image = UserImage.objects.create(user=self.other, image_name='other')
+        access = ImageAccess.objects.create(user_image=other_image, access_name='share')
+        for name, (url, scope) in self.urls().items():
+            with self.subTest(name):
+                self.assertEqual(self.get(url, token=access.token).status_code, 404)
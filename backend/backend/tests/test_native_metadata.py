@@ -0,0 +1,160 @@
+import struct
+from io import BytesIO
+
+from django.test import SimpleTestCase
+from PIL import Image
+
+from backend.native_metadata import NativeMetadata, UnsupportedMetadata, EXIF_IFD, GPS_IFD, MAKER_NOTE
+
+# One field of every kind of value conversion
+ASSIGNMENTS = [
+    ('EXIF', 'Make', 'Canon'),
+    ('EXIF', 'Artist', 'Jöhn Doe'),
+    ('EXIF', 'ISO', 400),
+    ('EXIF', 'ExposureTime', '1/250'),
+    ('EXIF', 'FNumber', 2.8),
+    ('EXIF', 'FocalLength', '50.0 mm'),
+    ('EXIF', 'LensInfo', '24-70mm f/2.8'),
+    ('EXIF', 'ExposureCompensation', '-1/3'),
+    ('EXIF', 'Flash', 'Fired'),
+    ('EXIF', 'WhiteBalance', 'Manual'),
+    ('EXIF', 'GPSLatitude', '27 deg 42\' 0.00"'),
+    ('EXIF', 'GPSLatitudeRef', 'S'),
+    ('EXIF', 'GPSLongitude', '85 deg 19\' 12.50"'),
+    ('EXIF', 'GPSLongitudeRef', 'E'),
+    ('EXIF', 'GPSAltitude', '1400.0 m'),
+    ('XMP-dc', 'title', 'Title'),
+    ('XMP-dc', 'creator', 'Creator'),
+    ('XMP-xmp', 'Rating', 3),
+]
+IPTC_ASSIGNMENTS = [
+    ('IPTC', 'Keywords', ['sea', 'sky']),
+    ('IPTC', 'By-line', 'Jane'),
+]
+EXPECTED = {
+    'EXIF:Make': 'Canon',
+    'EXIF:Artist': 'Jöhn Doe',
+    'EXIF:ISO': 400,
+    'EXIF:ExposureTime': '1/250',
+    'EXIF:FNumber': 2.8,
+    'EXIF:FocalLength': '50.0 mm',
+    'EXIF:LensInfo': '24-70mm f/2.8',
+    'EXIF:ExposureCompensation': '-1/3',
+    'EXIF:Flash': 'Fired',
+    'EXIF:WhiteBalance': 'Manual',
+    'EXIF:GPSLatitude': '27 deg 42\' 0.00"',
+    'EXIF:GPSLatitudeRef': 'South',
+    'EXIF:GPSLongitude': '85 deg 19\' 12.50"',
+    'EXIF:GPSLongitudeRef': 'East',
+    'EXIF:GPSAltitude': '1400.0 m',
+    'GPSPosition': '27 deg 42\' 0.00" S, 85 deg 19\' 12.50" E',
+    'XMP-dc:Title': 'Title',
+    'XMP-dc:Creator': 'Creator',
+    'XMP-xmp:Rating': 3,
+}
+
+
+def encode(fmt, exif=None, size=(40, 30)):
+    output = BytesIO()
+    params = {'exif': exif} if exif is not None else {}
+    Image.new('RGB', size, 'red').save(output, fmt, **params)
+    return output.getvalue()
+
+
+class NativeMetadataRoundTripTests(SimpleTestCase):
+
+    def assert_round_trip(self, fmt, assignments, expected):
+        data = NativeMetadata.write(encode(fmt), assignments)
+        metadata = NativeMetadata.read(data)
+        for key, value in expected.items():
+            self.assertEqual(metadata.get(key), value, key)
+        with Image.open(BytesIO(data)) as image:
+            image.load()
+            self.assertEqual(image.format, fmt)
+        return data
+
+    def test_jpeg(self):
+        expected = dict(EXPECTED, **{'IPTC:Keywords': ['sea', 'sky'], 'IPTC:By-line': 'Jane'})
+        data = self.assert_round_trip('JPEG', ASSIGNMENTS + IPTC_ASSIGNMENTS, expected)
+        metadata = NativeMetadata.read(data)
+        self.assertEqual((metadata['FileType'], metadata['ImageWidth'], metadata['ImageHeight']), ('JPEG', 40, 30))
+
+    def test_png(self):
+        self.assert_round_trip('PNG', ASSIGNMENTS, EXPECTED)
+
+    def test_gps_parts_are_stored_as_written(self):
+        data = NativeMetadata.write(encode('JPEG'), [('EXIF', 'GPSLatitude', '27 deg 42\' 0.00"')])
+        with Image.open(BytesIO(data)) as image:
+            latitude = image.getexif().get_ifd(GPS_IFD)[2]
+        self.assertEqual([float(part) for part in latitude], [27, 42, 0])
+
+    def test_decimal_gps_is_rounded_and_carried(self):
+        data = NativeMetadata.write(encode('JPEG'), [('EXIF', 'GPSLatitude', '10.99999999')])
+        with Image.open(BytesIO(data)) as image:
+            latitude = image.getexif().get_ifd(GPS_IFD)[2]
+        self.assertEqual([float(part) for part in latitude], [11, 0, 0])
+        self.assertEqual(NativeMetadata.read(data)['EXIF:GPSLatitude'], '11 deg 0\' 0.00"')
+
+    def test_printed_gps_seconds_carry(self):
+        data = NativeMetadata.write(encode('JPEG'), [('EXIF', 'GPSLatitude', '10 deg 59\' 59.999"')])
+        self.assertEqual(NativeMetadata.read(data)['EXIF:GPSLatitude'], '11 deg 0\' 0.00"')
+
+    def test_rewrite_keeps_other_tags(self):
+        data = NativeMetadata.write(encode('JPEG'), ASSIGNMENTS)
+        data = NativeMetadata.write(data, [('EXIF', 'Model', 'R5'), ('EXIF', 'Artist', 'Someone Else')])
+        metadata = NativeMetadata.read(data)
+        self.assertEqual((metadata['EXIF:Make'], metadata['EXIF:Model'], metadata['EXIF:Artist']),
+                         ('Canon', 'R5', 'Someone Else'))
+        self.assertEqual(metadata['XMP-dc:Title'], 'Title')
+
+    def test_existing_exif_ifd_is_kept(self):
+        exif = Image.Exif()
+        exif.get_ifd(EXIF_IFD)[0x9003] = '2024:05:01 10:00:00'
+        data = NativeMetadata.write(encode('JPEG', exif=exif.tobytes()), [('EXIF', 'Make', 'Canon')])
+        metadata = NativeMetadata.read(data)
+        self.assertEqual(metadata['EXIF:DateTimeOriginal'], '2024:05:01 10:00:00')
+        self.assertEqual(metadata['EXIF:Make'], 'Canon')
+
+
+class NativeMetadataFallbackTests(SimpleTestCase):
+
+    def test_gif_is_read_with_exiftool(self):
+        with self.assertRaises(UnsupportedMetadata):
+            NativeMetadata.read(encode('GIF'))
+
+    def test_gif_is_written_with_exiftool(self):
+        with self.assertRaises(UnsupportedMetadata):
+            NativeMetadata.write(encode('GIF'), [('EXIF', 'Make', 'Canon')])
+
+    def test_iptc_in_png(self):
+        with self.assertRaises(UnsupportedMetadata):
+            NativeMetadata.write(encode('PNG'), IPTC_ASSIGNMENTS)
+
+    def test_unknown_tag(self):
+        with self.assertRaises(UnsupportedMetadata):
+            NativeMetadata.write(encode('JPEG'), [('EXIF', 'NotATag', 'x')])
+
+    def test_unparsable_value(self):
+        with self.assertRaises(UnsupportedMetadata):
+            NativeMetadata.write(encode('JPEG'), [('EXIF', 'Flash', 'Sometimes')])
+
+    def test_maker_notes(self):
+        exif = Image.Exif()
+        exif.get_ifd(EXIF_IFD)[MAKER_NOTE] = b'vendor data'
+        data = encode('JPEG', exif=exif.tobytes())
+        with self.assertRaises(UnsupportedMetadata):
+            NativeMetadata.write(data, [('EXIF', 'Artist', 'Jane')])
+
+    def test_thumbnail(self):
+        # PIL doesn't write IFD1, so a little-endian TIFF block by hand:
+        # IFD0 with Orientation, then IFD1 with Compression (JPEG)
+        ifd0 = struct.pack('<H', 1) + struct.pack('<HHIHH', 0x0112, 3, 1, 1, 0) + struct.pack('<I', 26)
+        ifd1 = struct.pack('<H', 1) + struct.pack('<HHIHH', 0x0103, 3, 1, 6, 0) + struct.pack('<I', 0)
+        exif = b'Exif\x00\x00II*\x00' + struct.pack('<I', 8) + ifd0 + ifd1
+        data = encode('JPEG', exif=exif)
+        with self.assertRaises(UnsupportedMetadata):
+            NativeMetadata.write(data, [('EXIF', 'Artist', 'Jane')])
+
+    def test_not_an_image(self):
+        with self.assertRaises(UnsupportedMetadata):
+            NativeMetadata.read(b'not an image')
@@ -0,0 +1,32 @@
+from django.core.files.uploadhandler import FileUploadHandler
+
+from .encryption import ContentHasher
+
+
+class ContentHashUploadHandler(FileUploadHandler):
+    """
+    Computes the ContentHasher digest of every uploaded file while the
+    request body is being received, and passes the data on unchanged to
+    the handlers after it. Digests are collected per form field, in order.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.hashes = {}
+        self.hasher = None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = ContentHasher()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        self.hashes.setdefault(self.field_name, []).append(self.hasher.hexdigest())
+        return None  # let the next handler build the file object
+
+    def hash_for(self, field_name):
+        hashes = self.hashes.get(field_name)
+        return hashes[0] if hashes else None
@@ -21,16 +21,25 @@ from .views import (
     AccessLogView,
     ImageAccessLogView,
     ImageMetadataView,
+    MetadataSchemaView,
+    BulkMetadataView,
     CustomMetadataView,
     RequestAccessView,
     ManageAccessRequestsView,
     AIProtectionView,
     ServeProtectedImageDownloadView,
     NotificationSettingsView,
-    DeleteAccountView
+    DeleteAccountView,
+    ImageCacheStatsView,
+    JobStatusView,
+    BatchImageUploadView,
+    InstantUploadView,
+    ResumableUploadView,
+    ResumableUploadDetailView,
+    ResumableUploadFinalizeView
 )
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from .views import serve_decrypted_image
+from .views import serve_decrypted_image, serve_image_thumbnail, render_image
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -41,6 +50,11 @@ urlpatterns = [
     path('api/password-reset/', PasswordResetRequestView.as_view(), name='password_reset'),
     path('api/password-reset-confirm/', PasswordResetConfirmView.as_view(), name='password_reset_confirm'),
     path('upload/', ImageUploadView.as_view(), name='image-upload'),
+    path('upload/instant/', InstantUploadView.as_view(), name='image-instant-upload'),
+    path('upload/batch/', BatchImageUploadView.as_view(), name='image-batch-upload'),
+    path('uploads/', ResumableUploadView.as_view(), name='resumable-upload'),
+    path('uploads/<uuid:upload_id>/', ResumableUploadDetailView.as_view(), name='resumable-upload-detail'),
+    path('uploads/<uuid:upload_id>/finalize/', ResumableUploadFinalizeView.as_view(), name='resumable-upload-finalize'),
     path('images/', ImageListView.as_view(), name='image-list'),
     path('image/<int:pk>/', UserImageView.as_view(), name='view-image'),
     path('api/profile/', UserProfileView.as_view(), name='user-profile'),
@@ -68,10 +82,16 @@ urlpatterns = [
     path('access-logs/', AccessLogView.as_view(), name='access-logs'),
     path('access-logs/<int:image_id>/', ImageAccessLogView.as_view(), name='image-logs'),
 
+    path('api/metadata/schema/', MetadataSchemaView.as_view(), name='metadata-schema'),
+    path('api/images/metadata/', BulkMetadataView.as_view(), name='bulk-metadata'),
     path('api/image/<int:image_id>/metadata/', ImageMetadataView.as_view(), name='image-metadata'),
     path('api/image/<int:image_id>/metadata/custom/', CustomMetadataView.as_view(), name='custom-metadata'),
 
     path('images/<int:image_id>/decrypted/', serve_decrypted_image, name='serve_decrypted_image'),
+    path('images/<int:image_id>/thumbnail/<int:width>/', serve_image_thumbnail, name='serve_image_thumbnail'),
+    path('images/<int:image_id>/render/', render_image, name='render_image'),
+    path('jobs/<int:pk>/', JobStatusView.as_view(), name='job-status'),
+    path('api/admin/image-cache/', ImageCacheStatsView.as_view(), name='image-cache-stats'),
     path('images/<int:image_id>/ai-protection/', AIProtectionView.as_view(), name='ai-protection'),
 
     # New endpoint for downloading protected image by access token
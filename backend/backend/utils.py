@@ -83,12 +83,11 @@ from django.core.files.base import ContentFile
 import numpy as np
 from .scripts.steg import TextSteganography
 from .metadata_utils import MetadataExtractor
+from .exiftool_pool import get_exiftool_pool
 import subprocess
 import json
 import os
 import cv2
-from django.conf import settings
-from datetime import datetime
 
 class ProtectionChain:
     @staticmethod
@@ -157,26 +156,13 @@ class ProtectionChain:
                     result = ProtectionChain._apply_metadata(protected_image, user_image.metadata)
 
                     if result:
-                        file_path = os.path.join(result['temp_dir'], result['filename'])
-                        logger.info(f"Attempting to open file at: {file_path}")
-
-                        # Save the processed file to the model
-                        with open(file_path, 'rb') as f:
-                            # Ensure .png extension for the saved protected image name
-                            protected_filename = f'protected_{user_image.image_name}.png'
-                            access_rule.protected_image.save(
-                                protected_filename,
-                                ContentFile(f.read()),
-                                save=True
-                            )
-
-                        # Clean up the processing file
-                        try:
-                            os.remove(file_path)
-                            logger.info(f"Cleaned up processing file: {file_path}")
-                        except Exception as e:
-                            logger.warning(f"Could not remove processing file: {str(e)}")
-
+                        # Ensure .png extension for the saved protected image name
+                        protected_filename = f'protected_{user_image.image_name}.png'
+                        access_rule.protected_image.save(
+                            protected_filename,
+                            ContentFile(result),
+                            save=True
+                        )
                         return True
                     else:
                         logger.error("Metadata protection failed")
@@ -370,43 +356,19 @@ class ProtectionChain:
 
     @staticmethod
     def _apply_metadata(image, metadata):
-        """Apply metadata to the image"""
+        """Apply metadata to the image; returns the PNG bytes"""
         logger.info("Starting metadata application")
 
         try:
-            # Convert BASE_DIR to string and create temp directory path
-            base_dir = str(settings.BASE_DIR)
-            temp_dir = os.path.join(base_dir, 'backend', 'temp')
-
-            # Ensure the temp directory exists
-            os.makedirs(temp_dir, exist_ok=True)
-            logger.info(f"Temp directory created/verified at: {temp_dir}")
-
-            # Generate a unique filename
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            unique_filename = f'processing_{timestamp}.png'
-            processing_path = os.path.join(temp_dir, unique_filename)
-
-            logger.info(f"Attempting to save image to: {processing_path}")
-
-            # Save the PIL Image
-            image.save(processing_path, 'PNG')
-            logger.info("Image saved successfully")
-
-            # Apply metadata
-            result = MetadataExtractor.embed_metadata(processing_path, metadata)
-
-            if result and result.get('success'):
-                logger.info("Metadata embedding successful")
-                # Return both the filename and the full path
-                return {
-                    'filename': unique_filename,
-                    'full_path': processing_path,
-                    'temp_dir': temp_dir
-                }
-            else:
-                logger.error(f"Metadata embedding failed: {result.get('error', 'Unknown error')}")
-                return None
+            output = BytesIO()
+            image.save(output, 'PNG')
+            logger.info("Image encoded successfully")
+
+            # Written in memory; exiftool (through a temporary file) only
+            # for tags the native writer doesn't handle
+            data = MetadataExtractor.embed_metadata_bytes(output.getvalue(), metadata, suffix='.png')
+            logger.info("Metadata embedding successful")
+            return data
 
         except Exception as e:
             logger.error(f"Error in metadata embedding: {str(e)}", exc_info=True)
@@ -417,11 +379,7 @@ class ProtectionChain:
     def verify_metadata(image_path):
         """Verify metadata in the image"""
         try:
-            result = subprocess.run(
-                ['exiftool', '-json', image_path],
-                capture_output=True, text=True, check=True
-            )
-            metadata = json.loads(result.stdout)
+            metadata = get_exiftool_pool().execute_json(image_path)
             logger.info(f"Verified metadata: {metadata}")
             return metadata
         except Exception as e:
@@ -1,6 +1,33 @@
+import hashlib
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import cv2
 
+# --- Stored Parameters ---
+# Only these derivation parameters are persisted (e.g. in UserImage.encryption_params);
+# permutations and XOR streams are regenerated from the key when decrypting.
+CHAOTIC_PARAMS_VERSION = 1
+DEFAULT_MU = 3.99
+
+def chaotic_params(channels=3, mu=DEFAULT_MU, tile_size=None):
+    params = {
+        'algorithm': 'chaotic',
+        'version': CHAOTIC_PARAMS_VERSION,
+        'seed_derivation': 'key-char-sum',  # see seed_from_key
+        'mu': mu,
+        'channels': channels
+    }
+    if tile_size:
+        params.update({
+            'mode': 'tiled',
+            'seed_derivation': 'sha256-tile',  # see tile_seed
+            'tile_size': tile_size
+        })
+    return params
+
 # --- Multichaos Map Function ---
 def multichaos_map(x, mu=3.99):
     if x < 0.5:
@@ -11,19 +38,79 @@ def multichaos_map(x, mu=3.99):
         return mu * min(x, 1 - x)        # Tent map
 
 # --- Generate Chaotic Sequence ---
+# Below this many seeds the per-step cost of the NumPy calls outweighs the
+# lock-step batching, so small batches iterate each seed in plain Python.
+LOCKSTEP_MIN_SEEDS = 64
+
 def generate_chaotic_sequence(length, seed, mu=3.99):
+    # Same arithmetic as multichaos_map, inlined so the loop stays on Python floats
+    sin = np.sin
+    pi = np.pi
+    seq = [0.0] * length
     x = seed
-    seq = []
-    for _ in range(length):
-        x = multichaos_map(x, mu)
-        seq.append(x)
+    for i in range(length):
+        if x < 0.5:
+            x = mu * x * (1 - x)
+        elif x < 0.75:
+            x = float(sin(pi * x))
+        else:
+            y = 1 - x
+            x = mu * (y if y < x else x)
+        seq[i] = x
     return np.array(seq)
 
+def generate_chaotic_sequences(length, seeds, mu=3.99):
+    """
+    Advance many independent seeds in lock-step.
+    Returns an array of shape (len(seeds), length); row i is bit-identical
+    to generate_chaotic_sequence(length, seeds[i], mu).
+    """
+    seeds = np.asarray(seeds, dtype=np.float64).ravel()
+    if seeds.size < LOCKSTEP_MIN_SEEDS:
+        out = np.empty((seeds.size, length))
+        for i, seed in enumerate(seeds):
+            out[i] = generate_chaotic_sequence(length, float(seed), mu)
+        return out
+
+    count = seeds.size
+    x = seeds.copy()
+    out = np.empty((length, count))
+    logistic = np.empty(count)
+    sine = np.empty(count)
+    tent = np.empty(count)
+    below_half = np.empty(count, dtype=bool)
+    below_three_quarters = np.empty(count, dtype=bool)
+    for i in range(length):
+        np.less(x, 0.5, out=below_half)
+        np.less(x, 0.75, out=below_three_quarters)
+        np.subtract(1, x, out=tent)
+        np.multiply(mu, x, out=logistic)        # mu * x * (1 - x)
+        logistic *= tent
+        np.multiply(np.pi, x, out=sine)         # sin(pi * x)
+        np.sin(sine, out=sine)
+        np.minimum(x, tent, out=tent)           # mu * min(x, 1 - x)
+        tent *= mu
+        # Pick the branch per seed, narrowest condition last
+        np.copyto(x, tent)
+        np.copyto(x, sine, where=below_three_quarters)
+        np.copyto(x, logistic, where=below_half)
+        out[i] = x
+    return out.T
+
+def seed_from_key(key):
+    # Create a seed from the key; ensure it is in [0,1)
+    return (sum(ord(c) for c in key) % 1000) / 1000.0
+
+def invert_permutation(perm):
+    # O(n) scatter instead of np.argsort(perm)
+    inv_perm = np.empty_like(perm)
+    inv_perm[perm] = np.arange(perm.size, dtype=perm.dtype)
+    return inv_perm
+
 # --- Key Stream and Permutation for a single channel ---
 def generate_key_stream(shape, key):
     total = shape[0] * shape[1]
-    # Create a seed from the key; ensure it is in [0,1)
-    seed = (sum(ord(c) for c in key) % 1000) / 1000.0
+    seed = seed_from_key(key)
     chaos = generate_chaotic_sequence(total, seed)
 
     # Permutation order (store this to reverse later)
@@ -33,15 +120,25 @@ def generate_key_stream(shape, key):
 
     return perm, xor_stream
 
+def generate_key_streams(shape, keys, mu=DEFAULT_MU):
+    """Key streams for several keys at once; same output as generate_key_stream per key"""
+    total = shape[0] * shape[1]
+    chaos = generate_chaotic_sequences(total, [seed_from_key(key) for key in keys], mu)
+    streams = []
+    for row in chaos:
+        row = np.ascontiguousarray(row)
+        streams.append((np.argsort(row), np.floor(row * 256).astype(np.uint8)))
+    return streams
+
 # --- Encrypt a single channel ---
-def encrypt_channel(channel, key):
+def encrypt_channel(channel, key, key_stream=None):
     flat = channel.flatten()
-    perm, xor_stream = generate_key_stream(channel.shape, key)
+    perm, xor_stream = key_stream or generate_key_stream(channel.shape, key)
 
     # Permutation: rearrange pixels
     permuted = flat[perm]
     # Substitution: XOR with the key stream
-    substituted = np.bitwise_xor(permuted, xor_stream)
+    substituted = np.bitwise_xor(permuted, xor_stream, out=permuted)
 
     # Return encrypted channel and the values needed to decrypt
     return substituted.reshape(channel.shape), perm, xor_stream
@@ -50,45 +147,146 @@ def encrypt_channel(channel, key):
 def decrypt_channel(encrypted_channel, key, perm, xor_stream):
     flat = encrypted_channel.flatten()
     # Reverse the XOR operation
-    unxored = np.bitwise_xor(flat, xor_stream)
+    unxored = np.bitwise_xor(flat, xor_stream, out=flat)
     # Compute the inverse permutation from the stored permutation
-    inv_perm = np.argsort(perm)
+    inv_perm = invert_permutation(perm)
     # Reverse the permutation by placing each element in its original index
     unpermuted = unxored[inv_perm]
 
     return unpermuted.reshape(encrypted_channel.shape)
 
 # --- Encrypt Color Image ---
-def encrypt_color_image(image, key):
+def encrypt_color_image(image, key, mu=DEFAULT_MU):
+    """
+    Encrypt a BGR image. Returns the encrypted image and the compact
+    parameters needed to decrypt it alongside the key.
+    """
     # Split the image into its B, G, R channels (OpenCV uses BGR)
     channels = cv2.split(image)
+    # Modify key for each channel to further differentiate (optional)
+    channel_keys = [key + str(idx) for idx in range(len(channels))]
+    key_streams = generate_key_streams(channels[0].shape, channel_keys, mu)
     encrypted_channels = []
-    perms = []       # To store permutation for each channel
-    xor_streams = [] # To store XOR key stream for each channel
-    for idx, channel in enumerate(channels):
-        # Modify key for each channel to further differentiate (optional)
-        channel_key = key + str(idx)
-        enc_channel, perm, xor_stream = encrypt_channel(channel, channel_key)
+    for channel, channel_key, key_stream in zip(channels, channel_keys, key_streams):
+        enc_channel, _, _ = encrypt_channel(channel, channel_key, key_stream)
         encrypted_channels.append(enc_channel)
-        perms.append(perm)
-        xor_streams.append(xor_stream)
     # Merge the channels back
     encrypted_img = cv2.merge(encrypted_channels)
-    return encrypted_img, perms, xor_streams
+    return encrypted_img, chaotic_params(len(channels), mu)
 
 # --- Decrypt Color Image ---
-def decrypt_color_image(encrypted_image, key, perms, xor_streams):
+def decrypt_color_image(encrypted_image, key, perms=None, xor_streams=None, params=None):
+    """
+    Decrypt an image produced by encrypt_color_image. Key streams are
+    regenerated from the key and ``params``; ``perms``/``xor_streams`` are
+    only needed for rows stored before parameters were compacted.
+    """
+    if params and params.get('mode') == 'tiled':
+        return decrypt_color_image_tiled(encrypted_image, key, params)
     channels = cv2.split(encrypted_image)
+    channel_keys = [key + str(idx) for idx in range(len(channels))]
+    if perms is None or xor_streams is None:
+        mu = (params or {}).get('mu', DEFAULT_MU)
+        key_streams = generate_key_streams(channels[0].shape, channel_keys, mu)
+    else:
+        key_streams = [(np.asarray(perm), np.asarray(xor_stream, dtype=np.uint8))
+                       for perm, xor_stream in zip(perms, xor_streams)]
     decrypted_channels = []
-    for idx, channel in enumerate(channels):
-        channel_key = key + str(idx)
-        dec_channel = decrypt_channel(channel, channel_key, perms[idx], xor_streams[idx])
+    for channel, channel_key, (perm, xor_stream) in zip(channels, channel_keys, key_streams):
+        dec_channel = decrypt_channel(channel, channel_key, perm, xor_stream)
         decrypted_channels.append(dec_channel)
     decrypted_img = cv2.merge(decrypted_channels)
     return decrypted_img
 
+# --- Tiled Mode ---
+# Each tile gets its own permutation and XOR stream, so the key streams only
+# ever cover a band of tiles and bands can be processed on separate cores;
+# besides the image, the parent holds at most `workers` bands at a time.
+DEFAULT_TILE_SIZE = 256
+
+def tile_seed(key, channel, tile_row, tile_col):
+    # Independent seed per channel/tile, in (0, 1)
+    digest = hashlib.sha256(f"{key}:{channel}:{tile_row}:{tile_col}".encode()).digest()
+    return (int.from_bytes(digest[:8], 'big') + 1) / (2 ** 64 + 2)
+
+def _process_band(band, key, band_row, tile_size, mu, decrypt):
+    """Encrypt or decrypt one row of tiles in place and return it"""
+    height, width, channels = band.shape
+    # Tiles of equal area share one lock-step run (the last column may be narrower)
+    groups = {}
+    for tile_col, x in enumerate(range(0, width, tile_size)):
+        tile_width = min(tile_size, width - x)
+        for channel in range(channels):
+            groups.setdefault(tile_width, []).append((x, channel, tile_col))
+
+    for tile_width, tiles in groups.items():
+        seeds = [tile_seed(key, channel, band_row, tile_col) for _, channel, tile_col in tiles]
+        chaos = generate_chaotic_sequences(height * tile_width, seeds, mu)
+        perms = np.argsort(chaos, axis=1)
+        chaos *= 256
+        xor_streams = chaos.astype(np.uint8)
+        del chaos
+        for (x, channel, _), perm, xor_stream in zip(tiles, perms, xor_streams):
+            view = band[:, x:x + tile_width, channel]
+            flat = view.reshape(-1)  # copies, the view is strided
+            if decrypt:
+                flat ^= xor_stream
+                # Scatter back to the original positions (inverse permutation)
+                restored = np.empty_like(flat)
+                restored[perm] = flat
+                view[...] = restored.reshape(view.shape)
+            else:
+                permuted = flat[perm]
+                permuted ^= xor_stream
+                view[...] = permuted.reshape(view.shape)
+    return band
+
+def _process_tiled(image, key, tile_size, mu, workers, decrypt, in_place):
+    # With in_place the caller's array is transformed, saving a full copy
+    out = image if in_place else np.array(image, copy=True)
+    planes = out if out.ndim == 3 else out[:, :, np.newaxis]
+    bands = [(row, y) for row, y in enumerate(range(0, planes.shape[0], tile_size))]
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1 or len(bands) == 1:
+        for row, y in bands:
+            _process_band(planes[y:y + tile_size], key, row, tile_size, mu, decrypt)
+        return out
+
+    # Only about `workers` bands are in flight: each result is written back
+    # and dropped before the next band is submitted
+    in_flight = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for row, y in bands:
+            if len(in_flight) >= workers:
+                _store_band(planes, *in_flight.popleft())
+            in_flight.append((y, pool.submit(_process_band, planes[y:y + tile_size], key, row, tile_size, mu, decrypt)))
+        while in_flight:
+            _store_band(planes, *in_flight.popleft())
+    return out
+
+def _store_band(planes, y, future):
+    band = future.result()
+    planes[y:y + band.shape[0]] = band
+
+def encrypt_color_image_tiled(image, key, tile_size=DEFAULT_TILE_SIZE, mu=DEFAULT_MU, workers=None, in_place=False):
+    """
+    Tiled variant of encrypt_color_image for large images.
+    Returns the encrypted image and the parameters to store with it.
+    With ``in_place`` the image array itself is encrypted and returned.
+    """
+    encrypted_img = _process_tiled(image, key, tile_size, mu, workers, decrypt=False, in_place=in_place)
+    channels = image.shape[2] if image.ndim == 3 else 1
+    return encrypted_img, chaotic_params(channels, mu, tile_size)
+
+def decrypt_color_image_tiled(encrypted_image, key, params, workers=None, in_place=False):
+    return _process_tiled(encrypted_image, key, params['tile_size'],
+                          params.get('mu', DEFAULT_MU), workers, decrypt=True, in_place=in_place)
+
 # --- Demo Run ---
 if __name__ == "__main__":
+    import time
+
     key = "mysecurekey"
     input_image_path = "/content/watermarked-image (10).png"  # Provide a color image file
 
@@ -99,11 +297,21 @@ if __name__ == "__main__":
         exit()
 
     # Encrypt the image
-    encrypted_img, perms, xor_streams = encrypt_color_image(img, key)
+    encrypted_img, params = encrypt_color_image(img, key)
     cv2.imwrite("encrypted_color.png", encrypted_img)
 
-    # Decrypt the image using the stored permutation and XOR key streams
-    decrypted_img = decrypt_color_image(encrypted_img, key, perms, xor_streams)
+    # Decrypt the image, regenerating the key streams from the key and params
+    decrypted_img = decrypt_color_image(encrypted_img, key, params=params)
     cv2.imwrite("decrypted_color.png", decrypted_img)
 
+    # Tiled mode: bounded memory, bands spread over the available cores
+    start = time.time()
+    tiled_img, tiled_params = encrypt_color_image_tiled(img, key)
+    encrypt_time = time.time() - start
+    start = time.time()
+    restored = decrypt_color_image(tiled_img, key, params=tiled_params)
+    print(f"Tiled mode ({tiled_params['tile_size']}px tiles): "
+          f"encrypt {encrypt_time:.2f}s, decrypt {time.time() - start:.2f}s, "
+          f"round trip {'OK' if np.array_equal(restored, img) else 'FAILED'}")
+
     print("✔️ Color image encryption and decryption completed successfully.")
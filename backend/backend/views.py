@@ -1,54 +1,271 @@
 from django.contrib.auth.tokens import default_token_generator
 from django.db.models.manager import QuerySet
-from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode, http_date, parse_http_date_safe
+from django.utils.cache import get_conditional_response
 from django.utils.encoding import force_bytes, force_str
 from django.core.mail import send_mail
 from django.conf import settings
+from django.db import transaction
+from django.db.models import F
 from rest_framework import generics
 from django.contrib.auth.models import User
-from .serializers import RegisterUserSerializer, PasswordResetRequestSerializer, PasswordResetConfirmSerializer, SpecificImageSerializer, UserImageSerializer, UserImageListSerializer, PasswordChangeSerializer, OTPVerificationSerializer, AIProtectionSettingsSerializer, NotificationSettingsSerializer, AccountDeletionSerializer
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from .serializers import RegisterUserSerializer, PasswordResetRequestSerializer, PasswordResetConfirmSerializer, SpecificImageSerializer, UserImageSerializer, UserImageListSerializer, PasswordChangeSerializer, OTPVerificationSerializer, AIProtectionSettingsSerializer, NotificationSettingsSerializer, AccountDeletionSerializer, JobSerializer
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
 from django.core.exceptions import PermissionDenied
 from rest_framework.views import APIView
+from rest_framework.exceptions import ValidationError, AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.pagination import PageNumberPagination
-from .models import UserImage, WatermarkSettings, InvisibleWatermarkSettings, AIProtectionSettings, UserProfile
+from .models import UserImage, WatermarkSettings, InvisibleWatermarkSettings, AIProtectionSettings, UserProfile, Job, ImageAccess
 from rest_framework.parsers import MultiPartParser, FormParser  #
 
 
-from django.http import HttpResponse, Http404
+from django.http import HttpResponse, Http404, StreamingHttpResponse
+from django.urls import reverse
 import cv2
 import os
+import hashlib
+from pathlib import Path
 import traceback
 from PIL import Image
 import io
 import numpy as np
 import logging
 from datetime import datetime
+from .metadata_utils import MetadataExtractor, InvalidImage, SCHEMA_INDEX
+from .image_filters import filter_images, query_params
+from .image_cache import get_image_cache
+from .signed_urls import RENDER_SCOPE, signed_user_id
+from .derivatives import DERIVATIVE_CONTENT_TYPE, RENDER_FORMATS, ImageRenderer, get_render_cache
+from .batch_upload import BatchUpload
+from .jobs import enqueue
+from .upload_handlers import ContentHashUploadHandler
+from .resumable import (
+    TUS_VERSION, TUS_EXTENSIONS, CHECKSUM_ALGORITHMS, ResumableUpload, OffsetMismatch, ChecksumMismatch,
+    parse_upload_checksum, parse_upload_metadata, resumable_settings,
+)
 
 logger = logging.getLogger(__name__)
 
+class RangeNotSatisfiable(Exception):
+    pass
+
+def _parse_range_header(range_header, size):
+    """
+    Parse a single-range ``Range: bytes=...`` header against a body of ``size`` bytes.
+    Returns an inclusive (start, end) tuple, or None when the whole body should be
+    served (no header, malformed, or multiple ranges). Raises RangeNotSatisfiable
+    when the range lies outside the body.
+    """
+    if not range_header or not range_header.startswith('bytes='):
+        return None
+    spec = range_header[len('bytes='):].strip()
+    if ',' in spec or '-' not in spec:
+        return None
+
+    first, last = (part.strip() for part in spec.split('-', 1))
+    try:
+        if not first:
+            # Suffix range: the final N bytes
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable()
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else size - 1
+            if start >= size:
+                raise RangeNotSatisfiable()
+            if end < start:
+                return None
+            end = min(end, size - 1)
+    except ValueError:
+        return None
+
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, end
+
+# Browsers may keep decrypted images but must revalidate them (ETag/Last-Modified)
+PRIVATE_CACHE_CONTROL = 'private, no-cache'
+# Bump when the bytes served for the same stored file change (e.g. encoder settings)
+SERVE_ETAG_VERSION = 1
+
+def _image_validators(user_image, variant='original'):
+    """
+    (etag, last_modified) for serving ``variant`` of an image, computed from
+    the row and a stat of the stored file, so they are known before decrypting.
+    """
+    stat = os.stat(user_image.image.path)
+    if user_image.content_hash:
+        tag = user_image.content_hash[:40]
+    else:
+        tag = f"{user_image.pk}-{stat.st_mtime_ns:x}-{stat.st_size:x}"
+    return f'"{tag}-{variant}-v{SERVE_ETAG_VERSION}"', int(stat.st_mtime)
+
+def _set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = PRIVATE_CACHE_CONTROL
+    return response
+
+def _if_range_matches(request, etag, last_modified):
+    """False when an If-Range precondition fails, meaning the full body must be sent"""
+    if_range = request.headers.get('If-Range')
+    if not if_range or etag is None:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag  # strong comparison only
+    since = parse_http_date_safe(if_range)
+    return since is not None and last_modified is not None and last_modified <= since
+
+def _range_response(request, size, content_type, data=None, iter_range=None, etag=None, last_modified=None):
+    """
+    Build a 200/206/416 response for a body of ``size`` bytes, either sliced
+    from ``data`` or streamed from ``iter_range(start, end)``.
+    """
+    try:
+        byte_range = None
+        if _if_range_matches(request, etag, last_modified):
+            byte_range = _parse_range_header(request.headers.get('Range'), size)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    if byte_range is None:
+        start, end = 0, size - 1
+        response_status = 200
+    else:
+        start, end = byte_range
+        response_status = 206
+
+    if data is not None:
+        response = HttpResponse(data[start:end + 1], status=response_status, content_type=content_type)
+    else:
+        body = iter_range(start, end) if size else iter(())
+        response = StreamingHttpResponse(body, status=response_status, content_type=content_type)
+        response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    if response_status == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    if etag is not None:
+        _set_validators(response, etag, last_modified)
+    else:
+        response['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
+    return response
+
+# Re-encodings offered by serve_decrypted_image via ?format=
+TRANSFORM_FORMATS = {
+    'png': ('.png', 'image/png'),
+    'jpg': ('.jpg', 'image/jpeg'),
+    'jpeg': ('.jpg', 'image/jpeg'),
+    'webp': ('.webp', 'image/webp'),
+}
+
+def _original_mime_type(user_image, first_bytes):
+    """MIME type recorded at upload; sniffed and stored for older rows"""
+    if not user_image.mime_type:
+        user_image.mime_type = MetadataExtractor.sniff_mime_type(first_bytes)
+        UserImage.objects.filter(pk=user_image.pk).update(mime_type=user_image.mime_type)
+    return user_image.mime_type
+
+def _get_original_bytes(user_image, cache):
+    """Return (content_type, data, cache_status) for the decrypted original"""
+    cache_key = cache.key_for(user_image, 'original')
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached[0], cached[1], 'HIT'
+    data = user_image.get_decrypted_bytes()
+    content_type = _original_mime_type(user_image, data[:16])
+    if not user_image.content_hash:
+        # Rows from before content hashing get theirs the first time they are decrypted
+        from .encryption import ContentHasher
+        user_image.content_hash = ContentHasher.hash_bytes(data)
+        UserImage.objects.filter(pk=user_image.pk).update(content_hash=user_image.content_hash)
+    cache.set(cache_key, content_type, data)
+    return content_type, data, 'MISS'
+
+def _serve_segmented_stream(request, user_image, index, etag, last_modified):
+    """
+    Stream an original too large for the cache out of its AES-GCM container,
+    decrypting only the segments needed for the requested byte range.
+    """
+    size = index.plaintext_size
+    first_bytes = b''.join(user_image.iter_decrypted_range(0, min(size, 16) - 1, index)) if size else b''
+    content_type = _original_mime_type(user_image, first_bytes)
+    response = _range_response(
+        request, size, content_type,
+        iter_range=lambda start, end: user_image.iter_decrypted_range(start, end, index),
+        etag=etag, last_modified=last_modified)
+    response['X-Cache'] = 'BYPASS'
+    return response
+
+def _serve_transformed_image(user_image, fmt, cache, etag, last_modified):
+    """Decode the original and re-encode it; only done when ?format= asks for it"""
+    extension, content_type = TRANSFORM_FORMATS[fmt]
+    cache_key = cache.key_for(user_image, fmt)
+    cached = cache.get(cache_key)
+    if cached is None:
+        original_type, data, _ = _get_original_bytes(user_image, cache)
+        if original_type == content_type:
+            # Already in the requested format, no need to decode
+            body = data
+        else:
+            decrypted_img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if decrypted_img is None:
+                return HttpResponse("Failed to decode image", status=500)
+            success, buffer = cv2.imencode(extension, decrypted_img)
+            if not success:
+                return HttpResponse("Failed to encode image", status=500)
+            body = buffer.tobytes()
+        cache.set(cache_key, content_type, body)
+    else:
+        body = cached[1]
+
+    response = HttpResponse(body, content_type=content_type)
+    _set_validators(response, etag, last_modified)
+    response['X-Cache'] = 'MISS' if cached is None else 'HIT'
+    return response
+
 def serve_decrypted_image(request, image_id):
     """
-    View that decrypts and serves an image in real-time
+    View that decrypts and serves an image in real-time.
+    The original upload is served byte-for-byte with its recorded MIME type
+    and honours single ``Range`` requests with 206 responses. The image is
+    only decoded when ``?format=png|jpeg|webp`` asks for a re-encoding.
+    Decrypted bodies are kept in the process-wide DecryptedImageCache, and
+    If-None-Match/If-Modified-Since are answered with 304 before decrypting.
     """
     try:
         # Get the image without filtering by user first
         user_image = UserImage.objects.get(id=image_id)
+        cache = get_image_cache()
 
-        # Decrypt the image
-        decrypted_img = user_image.get_decrypted_image()
+        fmt = request.GET.get('format', '').lower()
+        if fmt and fmt not in TRANSFORM_FORMATS:
+            return HttpResponse(f"Unsupported format: {fmt}", status=400)
 
-        # Convert to bytes for HTTP response
-        success, buffer = cv2.imencode('.png', decrypted_img)
-        if not success:
-            return HttpResponse("Failed to encode image", status=500)
+        etag, last_modified = _image_validators(user_image, fmt or 'original')
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return _set_validators(not_modified, etag, last_modified)
 
-        # Create response
-        response = HttpResponse(buffer.tobytes(), content_type="image/png")
-        response['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
+        if fmt:
+            return _serve_transformed_image(user_image, fmt, cache, etag, last_modified)
 
+        index = user_image.get_segment_index()
+        if index is not None and index.plaintext_size > cache.max_item_bytes:
+            return _serve_segmented_stream(request, user_image, index, etag, last_modified)
+
+        # Cacheable containers and legacy AES-CBC files: decrypt whole, pass through unchanged
+        content_type, data, cache_status = _get_original_bytes(user_image, cache)
+        response = _range_response(request, len(data), content_type, data=data,
+                                   etag=etag, last_modified=last_modified)
+        response['X-Cache'] = cache_status
         return response
 
     except UserImage.DoesNotExist:
@@ -59,6 +276,144 @@ def serve_decrypted_image(request, image_id):
         return HttpResponse(f"Error: {str(e)}", status=500)
 
 
+def _viewable_image(request, image_id, scope):
+    """
+    The image ``image_id`` if the request may see it: its owner (``?sig=``
+    signed for ``scope``, see signed_urls.py, a session or a JWT bearer
+    token), or ``?token=`` of a valid ImageAccess rule for it. Anything
+    else is a 404, so ids of other users' images aren't confirmed.
+    """
+    signature = request.GET.get('sig')
+    if signature:
+        user_id = signed_user_id(signature, image_id, scope)
+        if user_id is not None:
+            user_image = UserImage.objects.filter(id=image_id, user_id=user_id).first()
+            if user_image is not None:
+                return user_image
+
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        try:
+            authenticated = JWTAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            authenticated = None
+        user = authenticated[0] if authenticated else None
+    if user is not None:
+        user_image = UserImage.objects.filter(id=image_id, user=user).first()
+        if user_image is not None:
+            return user_image
+
+    token = request.GET.get('token')
+    if token:
+        access = (ImageAccess.objects.select_related('user_image')
+                  .filter(token=token, user_image_id=image_id).first())
+        if access is not None and access.is_valid():
+            return access.user_image
+    raise Http404("Image not found - does not exist")
+
+
+def serve_image_thumbnail(request, image_id, width):
+    """
+    Serve the encrypted WebP derivative closest to ``width`` (rounding up).
+    Falls back to the original when no derivatives exist yet. Only the
+    owner or a valid share token may fetch it (see _viewable_image).
+    """
+    user_image = _viewable_image(request, image_id, width)
+
+    derivative = user_image.get_derivative(width)
+    if derivative is None:
+        return serve_decrypted_image(request, image_id)
+
+    try:
+        etag = f'"{derivative.content_hash[:40]}-w{derivative.width}-v{SERVE_ETAG_VERSION}"'
+        last_modified = int(derivative.created_at.timestamp())
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return _set_validators(not_modified, etag, last_modified)
+
+        cache = get_image_cache()
+        cache_key = f"derivative:{derivative.pk}:{derivative.content_hash}"
+        cached = cache.get(cache_key)
+        if cached is None:
+            data = derivative.get_decrypted_bytes()
+            cache.set(cache_key, DERIVATIVE_CONTENT_TYPE, data)
+        else:
+            data = cached[1]
+
+        response = HttpResponse(data, content_type=DERIVATIVE_CONTENT_TYPE)
+        _set_validators(response, etag, last_modified)
+        response['X-Cache'] = 'MISS' if cached is None else 'HIT'
+        return response
+    except Exception as e:
+        print(f"Unexpected error: {str(e)}")
+        return HttpResponse(f"Error: {str(e)}", status=500)
+
+
+def render_image(request, image_id):
+    """
+    Resized render of an image: ``?w=<width>&fmt=webp|avif|jpeg|png&q=<1-100>``.
+    Renders are decoded at reduced resolution, kept in the in-process cache
+    and in the encrypted on-disk RenderCache, and revalidated with ETags.
+    Scoped like serve_image_thumbnail.
+    """
+    user_image = _viewable_image(request, image_id, RENDER_SCOPE)
+
+    try:
+        width, fmt, quality = ImageRenderer.parse_params(request.GET)
+    except ValueError as e:
+        return HttpResponse(str(e), status=400)
+
+    try:
+        variant = f"r{width}-{fmt}-q{quality}"
+        etag, last_modified = _image_validators(user_image, variant)
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return _set_validators(not_modified, etag, last_modified)
+
+        content_type = RENDER_FORMATS[fmt]
+        cache = get_image_cache()
+        cache_key = cache.key_for(user_image, variant)
+        cached = cache.get(cache_key)
+        cache_status = 'HIT'
+        if cached is not None:
+            data = cached[1]
+        else:
+            render_cache = get_render_cache()
+            data = render_cache.get(user_image, width, fmt, quality) if user_image.encryption_key else None
+            cache_status = 'DISK'
+            if data is None:
+                data = ImageRenderer.render(user_image, width, fmt, quality)
+                cache_status = 'MISS'
+                if user_image.encryption_key:
+                    render_cache.put(user_image, data, width, fmt, quality)
+            cache.set(cache_key, content_type, data)
+
+        response = HttpResponse(data, content_type=content_type)
+        _set_validators(response, etag, last_modified)
+        response['X-Cache'] = cache_status
+        return response
+    except Exception as e:
+        print(f"Unexpected error: {str(e)}")
+        return HttpResponse(f"Error: {str(e)}", status=500)
+
+
+class JobStatusView(generics.RetrieveAPIView):
+    """Status and progress of one of the user's background jobs"""
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return Job.objects.filter(user=self.request.user)
+
+
+class ImageCacheStatsView(APIView):
+    """Hit/miss counters of this process's decrypted image cache (admins only)"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(get_image_cache().stats())
+
+
 class RegisterView(generics.CreateAPIView):
     """
     View for user registration.
@@ -161,21 +516,273 @@ class PasswordResetConfirmView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+def _job_data(request, job):
+    """Status of a queued job as the endpoints that enqueue one report it"""
+    return {
+        'id': job.id,
+        'status': job.status,
+        'url': request.build_absolute_uri(reverse('job-status', args=[job.id])),
+    }
+
+
 class ImageUploadView(APIView):
     permission_classes = [IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser]  # Add these parser classes
 
     def post(self, request):
+        # Hash the file while it is received, before anything else reads it
+        hash_handler = ContentHashUploadHandler(request)
+        request.upload_handlers.insert(0, hash_handler)
+
         # Don't copy the request data - use it directly
         serializer = UserImageSerializer(data=request.data)
 
         if serializer.is_valid():
-            # Save the image and associate it with the user
-            serializer.save(user=request.user)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            # Same bytes as one of the user's images: share its encrypted file
+            with transaction.atomic():
+                existing = UserImage.find_duplicate(request.user, hash_handler.hash_for('image'))
+                if existing is not None:
+                    upload_name = Path(serializer.validated_data['image'].name).stem
+                    user_image = existing.duplicate(image_name=upload_name)
+            if existing is not None:
+                data = UserImageSerializer(user_image).data
+                data['deduplicated'] = True
+                job = getattr(user_image, 'upload_job', None)
+                if job is not None:
+                    data['job'] = _job_data(request, job)
+                return Response(data, status=status.HTTP_201_CREATED)
+
+            # Save the image and associate it with the user; it is encrypted
+            # before this returns, metadata and thumbnails follow in a job
+            user_image = serializer.save(user=request.user)
+            data = serializer.data
+            job = getattr(user_image, 'upload_job', None)
+            if job is not None:
+                data['job'] = _job_data(request, job)
+            return Response(data, status=status.HTTP_202_ACCEPTED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class InstantUploadView(APIView):
+    """
+    Upload without sending the file when the user already has an image
+    with the same content. The client sends the ContentHasher digest (see
+    encryption.py) and the file name; a 404 means the file must be uploaded.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        content_hash = str(request.data.get('content_hash', '')).lower()
+        if len(content_hash) != 64 or any(ch not in '0123456789abcdef' for ch in content_hash):
+            return Response({'error': 'content_hash must be a hex SHA-256 digest'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            existing = UserImage.find_duplicate(request.user, content_hash)
+            if existing is None:
+                return Response({'error': 'No image with this content; upload the file'},
+                                status=status.HTTP_404_NOT_FOUND)
+            filename = request.data.get('filename')
+            user_image = existing.duplicate(image_name=Path(filename).stem if filename else None)
+
+        data = UserImageSerializer(user_image).data
+        data['deduplicated'] = True
+        job = getattr(user_image, 'upload_job', None)
+        if job is not None:
+            data['job'] = _job_data(request, job)
+        return Response(data, status=status.HTTP_201_CREATED)
+
+
+class BatchImageUploadView(APIView):
+    """
+    Uploads many images at once: any number of ``files`` parts and/or a ZIP
+    in ``archive``. Every file gets its own result entry; thumbnails follow
+    in background jobs.
+    """
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser, FormParser]
+
+    def post(self, request):
+        files = request.FILES.getlist('files')
+        archive = request.FILES.get('archive')
+        if not files and not archive:
+            return Response({'error': 'Send images as "files" or a ZIP as "archive"'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        with BatchUpload(request.user) as batch:
+            try:
+                for uploaded_file in files:
+                    batch.add_file(uploaded_file)
+                if archive:
+                    batch.add_archive(archive)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            results = batch.process()
+
+        data = []
+        for result in results:
+            entry = {'filename': result['filename'], 'status': result['status']}
+            if result['status'] == 'created':
+                entry['image'] = UserImageSerializer(result['image']).data
+                job = result.get('job')
+                if job is not None:
+                    entry['job'] = _job_data(request, job)
+                if result.get('deduplicated'):
+                    entry['deduplicated'] = True
+            else:
+                entry['error'] = result['error']
+            data.append(entry)
+
+        created = sum(1 for entry in data if entry['status'] == 'created')
+        return Response({
+            'created': created,
+            'failed': len(data) - created,
+            'results': data,
+        }, status=status.HTTP_202_ACCEPTED if created else status.HTTP_400_BAD_REQUEST)
+
+
+def _tus_response(session=None, status_code=status.HTTP_204_NO_CONTENT, data=None):
+    response = Response(data, status=status_code)
+    response['Tus-Resumable'] = TUS_VERSION
+    response['Cache-Control'] = 'no-store'
+    if session is not None:
+        response['Upload-Offset'] = str(session.offset)
+        response['Upload-Length'] = str(session.total_size)
+        if session.status == 'uploading':
+            response['Upload-Expires'] = http_date(session.expires_at.timestamp())
+    return response
+
+
+def _get_upload_session(request, upload_id, lock=False):
+    from .models import UploadSession
+    sessions = UploadSession.objects.filter(user=request.user)
+    if lock:
+        sessions = sessions.select_for_update()
+    try:
+        session = sessions.get(pk=upload_id)
+    except UploadSession.DoesNotExist:
+        raise Http404("Upload not found")
+    if session.is_expired():
+        session.delete()
+        raise Http404("Upload has expired")
+    return session
+
+
+class ResumableUploadView(APIView):
+    """
+    Creates a resumable upload (tus 1.0 creation extension). The size comes
+    from Upload-Length and the file name from Upload-Metadata "filename";
+    both may also be sent as a JSON body ({"filename", "size"}).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def options(self, request, *args, **kwargs):
+        response = _tus_response()
+        response['Tus-Version'] = TUS_VERSION
+        response['Tus-Extension'] = TUS_EXTENSIONS
+        response['Tus-Max-Size'] = str(resumable_settings()['MAX_SIZE'])
+        response['Tus-Checksum-Algorithm'] = ','.join(CHECKSUM_ALGORITHMS)
+        return response
+
+    def post(self, request):
+        try:
+            metadata = parse_upload_metadata(request.headers.get('Upload-Metadata'))
+            size = request.headers.get('Upload-Length') or request.data.get('size')
+            filename = metadata.get('filename') or request.data.get('filename', '')
+            session = ResumableUpload.create(request.user, filename, int(size or 0))
+        except (TypeError, ValueError) as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = _tus_response(session, status.HTTP_201_CREATED, {'id': str(session.id)})
+        response['Location'] = request.build_absolute_uri(
+            reverse('resumable-upload-detail', args=[session.id]))
+        return response
+
+
+class ResumableUploadDetailView(APIView):
+    """
+    HEAD reports the current offset, PATCH appends a chunk at Upload-Offset
+    (application/offset+octet-stream body), DELETE abandons the upload.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def head(self, request, upload_id):
+        return _tus_response(_get_upload_session(request, upload_id), status.HTTP_200_OK)
+
+    def get(self, request, upload_id):
+        session = _get_upload_session(request, upload_id)
+        return _tus_response(session, status.HTTP_200_OK, {
+            'id': str(session.id),
+            'filename': session.filename,
+            'offset': session.offset,
+            'size': session.total_size,
+            'status': session.status,
+            'image_id': session.user_image_id,
+            'expires_at': session.expires_at,
+        })
+
+    def patch(self, request, upload_id):
+        if request.content_type != 'application/offset+octet-stream':
+            return _tus_response(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                                 data={'error': 'Content-Type must be application/offset+octet-stream'})
+        if not request.headers.get('Content-Length'):
+            # Django reads a body without Content-Length (chunked) as empty
+            return _tus_response(status_code=status.HTTP_400_BAD_REQUEST,
+                                 data={'error': 'Content-Length header is required'})
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+            checksum = parse_upload_checksum(request.headers.get('Upload-Checksum'))
+        except KeyError:
+            return _tus_response(status_code=status.HTTP_400_BAD_REQUEST,
+                                 data={'error': 'Upload-Offset header is required'})
+        except ValueError as e:
+            return _tus_response(status_code=status.HTTP_400_BAD_REQUEST, data={'error': str(e)})
+
+        with transaction.atomic():
+            session = _get_upload_session(request, upload_id, lock=True)
+            try:
+                ResumableUpload(session).append(request.stream or io.BytesIO(), offset, length, checksum)
+            except OffsetMismatch as e:
+                return _tus_response(session, status.HTTP_409_CONFLICT, {'error': str(e)})
+            except ChecksumMismatch as e:
+                # 460 Checksum Mismatch, from the tus checksum extension
+                return _tus_response(session, 460, {'error': str(e)})
+            except ValueError as e:
+                return _tus_response(session, status.HTTP_400_BAD_REQUEST, {'error': str(e)})
+        return _tus_response(session)
+
+    def delete(self, request, upload_id):
+        with transaction.atomic():
+            session = _get_upload_session(request, upload_id, lock=True)
+            if session.status == 'uploading':
+                session.delete()  # staging files go with it
+        return _tus_response()
+
+
+class ResumableUploadFinalizeView(APIView):
+    """Turns a completely received upload into an image; safe to retry"""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, upload_id):
+        with transaction.atomic():
+            session = _get_upload_session(request, upload_id, lock=True)
+            try:
+                user_image = ResumableUpload(session).finalize()
+            except InvalidImage as e:
+                # Not an image, or a decompression bomb: nothing worth resuming
+                session.delete()
+                return _tus_response(status_code=status.HTTP_400_BAD_REQUEST, data={'error': str(e)})
+            except ValueError as e:
+                return _tus_response(session, status.HTTP_409_CONFLICT, {'error': str(e)})
+
+        data = UserImageSerializer(user_image).data
+        job = getattr(user_image, 'upload_job', None)
+        if job is not None:
+            data['job'] = _job_data(request, job)
+        return _tus_response(session, status.HTTP_202_ACCEPTED, data)
+
+
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
@@ -230,36 +837,25 @@ class ImageListView(generics.ListAPIView):
         return context
 
     def get_queryset(self):
-        queryset = UserImage.objects.filter(user=self.request.user)
+        queryset = UserImage.objects.filter(user=self.request.user).prefetch_related('derivatives')
         params = self.request.query_params
-
-        # Search filter
-        search_query = params.get('search', '')
-        if search_query:
-            queryset = queryset.filter(image_name__icontains=search_query)
-
-        # File type filter
-        file_types = params.getlist('file_type')
-        if file_types:
-            queryset = queryset.filter(file_type__in=file_types)
-
-        # Size filter (in MB)
-        size_min = params.get('size_min')
-        size_max = params.get('size_max')
-        if size_min:
-            queryset = queryset.filter(file_size__gte=float(size_min)*1024*1024)  # Convert MB to bytes
-        if size_max:
-            queryset = queryset.filter(file_size__lte=float(size_max)*1024*1024)  # Convert MB to bytes
+        queryset = filter_images(queryset, params, self.request.user)
 
         # Sorting
         sort_by = params.get('sort', '-created_at')
         valid_sort_fields = [
             'created_at', '-created_at',
             'image_name', '-image_name',
-            'file_size', '-file_size'
+            'file_size', '-file_size',
+            'megapixels', '-megapixels'
         ]
         if sort_by in valid_sort_fields:
             queryset = queryset.order_by(sort_by)
+        elif sort_by in ('date_taken', '-date_taken'):
+            # Images without a capture date go last either way
+            taken = F('metadata_index__date_taken')
+            queryset = queryset.order_by(taken.desc(nulls_last=True) if sort_by[0] == '-' else taken.asc(nulls_last=True),
+                                         '-created_at')
 
         print(queryset)
 
@@ -292,11 +888,7 @@ class UserImageView(generics.RetrieveDestroyAPIView):  # Changed to RetrieveDest
         try:
             image = self.get_object()
 
-            # Delete the actual image file from storage
-            if image.image:
-                image.image.delete(save=False)
-
-            # Delete the database record
+            # Delete the database record; the file goes with the last image sharing it
             image.delete()
 
             return Response({
@@ -488,6 +1080,11 @@ class InvisibleWatermarkView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
+            stego = TextSteganography()
+            if user_image.width and user_image.height:
+                # Refuse an oversized message before decrypting anything
+                stego.check_capacity(user_image.width, user_image.height, message)
+
             # Get decrypted image
             decrypted_img = user_image.get_decrypted_image()
 
@@ -497,8 +1094,6 @@ class InvisibleWatermarkView(APIView):
                 # Save the numpy array as an image
                 cv2.imwrite(temp_path, decrypted_img)
 
-            stego = TextSteganography()
-
             try:
                 stego_image = stego.embed_message(temp_path, message)
 
@@ -550,6 +1145,11 @@ class InvisibleWatermarkView(APIView):
                     status=status.HTTP_404_NOT_FOUND
                 )
 
+            stego = TextSteganography()
+            if user_image.width and user_image.height:
+                # Refuse an oversized message before decrypting anything
+                stego.check_capacity(user_image.width, user_image.height, message)
+
             # Get the decrypted image
             decrypted_img = user_image.get_decrypted_image()
 
@@ -559,8 +1159,6 @@ class InvisibleWatermarkView(APIView):
                 # Save the numpy array as an image
                 cv2.imwrite(temp_path, decrypted_img)
 
-            stego = TextSteganography()
-
             try:
                 stego_image = stego.embed_message(temp_path, message)
 
@@ -586,6 +1184,8 @@ class InvisibleWatermarkView(APIView):
 
         except UserImage.DoesNotExist:
             return Response({'error': 'Image not found'}, status=status.HTTP_404_NOT_FOUND)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -1437,14 +2037,58 @@ from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from .models import UserImage
 
+class MetadataSchemaView(APIView):
+    """
+    The metadata schema (field types, labels, limits) that images' stored
+    values are merged with. It only changes with a deploy, so clients
+    revalidate it with If-None-Match against its version.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        etag = f'"{SCHEMA_INDEX.version}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = Response({'version': SCHEMA_INDEX.version, 'schema': SCHEMA_INDEX.document})
+        response['ETag'] = etag
+        response['Cache-Control'] = PRIVATE_CACHE_CONTROL
+        return response
+
+
 class ImageMetadataView(APIView):
+    """
+    Metadata of an image. Only values are stored; responses merge them with
+    the schema unless ``?compact=1`` asks for the stored values, which the
+    client merges with MetadataSchemaView itself.
+    """
     permission_classes = [IsAuthenticated]
 
+    @staticmethod
+    def metadata_response(request, metadata):
+        if request.query_params.get('compact') in ('1', 'true'):
+            return SCHEMA_INDEX.compact_metadata(metadata)
+        return SCHEMA_INDEX.expand(metadata)
+
+    @staticmethod
+    def parse_updates(updates):
+        """(category, field, value) assignments of an ``updates`` list of {type, field_name, value}"""
+        assignments = []
+        for update in updates:
+            type_ = update.get('type')
+            field_name = update.get('field_name')
+
+            if not all([type_, field_name]):
+                continue
+
+            category = 'custom' if type_ == 'custom' else type_.upper()
+            assignments.append((category, field_name, update.get('value')))
+        return assignments
+
     def get(self, request, image_id):
         try:
             user_image = UserImage.objects.get(id=image_id, user=request.user)
             return Response({
-                'metadata': user_image.metadata or {}
+                'metadata': self.metadata_response(request, user_image.metadata)
             }, status=status.HTTP_200_OK)
         except UserImage.DoesNotExist:
             return Response(
@@ -1459,7 +2103,6 @@ class ImageMetadataView(APIView):
 
     def put(self, request, image_id):
         try:
-            user_image = UserImage.objects.get(id=image_id, user=request.user)
             updates = request.data.get('updates', [])
 
             if not updates:
@@ -1468,61 +2111,14 @@ class ImageMetadataView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            # Get current metadata or initialize if None
-            current_metadata = user_image.metadata if user_image.metadata else {
-                'XMP': {
-                    'Basic Information': {},
-                    'Protection & Copyright': {}
-                },
-                'EXIF': {
-                    'Location Data': {},
-                    'Protection & Copyright': {},
-                    'Basic Image Information': {},
-                    'Camera & Device Information': {}
-                },
-                'IPTC': {
-                    'Location Data': {},
-                    'Creator and Copyright Information': {}
-                },
-                'custom': {}
-            }
-
-            # Apply updates
-            for update in updates:
-                type_ = update.get('type')
-                field_name = update.get('field_name')
-                value = update.get('value')
-
-                if not all([type_, field_name]):
-                    continue
-
-                # Handle custom metadata
-                if type_ == 'custom':
-                    if 'custom' not in current_metadata:
-                        current_metadata['custom'] = {}
-                    if field_name not in current_metadata['custom']:
-                        current_metadata['custom'][field_name] = {}
-                    current_metadata['custom'][field_name]['value'] = value
-                    current_metadata['custom'][field_name]['type'] = 'string'
-                    current_metadata['custom'][field_name]['label'] = field_name
-                else:
-                    # Handle regular metadata
-                    type_upper = type_.upper()
-                    if type_upper in current_metadata:
-                        # Find the section containing the field
-                        for section_name, section in current_metadata[type_upper].items():
-                            for field, field_data in section.items():
-                                if field == field_name:
-                                    section[field_name]['value'] = value
-                                    break
-
-            # Save the updated metadata
-            user_image.metadata = current_metadata
-            user_image.save(update_fields=['metadata'])
+            # All edits in one UPDATE, so concurrent edits of other fields survive
+            current_metadata = UserImage.update_metadata(image_id, request.user, self.parse_updates(updates))
+            if current_metadata is None:
+                raise UserImage.DoesNotExist
 
             return Response({
                 'message': 'Metadata updated successfully',
-                'metadata': current_metadata
+                'metadata': self.metadata_response(request, current_metadata)
             })
 
         except UserImage.DoesNotExist:
@@ -1536,14 +2132,42 @@ class ImageMetadataView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class BulkMetadataView(APIView):
+    """
+    Apply the same metadata updates to many images in a background job.
+    The selection is ``ids`` or ``filter``, an object of ImageListView query
+    parameters; ``reembed`` also rewrites the metadata of protected copies
+    that embed it. Progress is reported through the job status.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        assignments = ImageMetadataView.parse_updates(request.data.get('updates') or [])
+        if not assignments:
+            return Response({'message': 'No updates provided'}, status=status.HTTP_400_BAD_REQUEST)
+
+        ids, filters = request.data.get('ids'), request.data.get('filter')
+        if ids is not None:
+            if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+                raise ValidationError({'ids': 'Expected a list of image ids.'})
+            payload = {'ids': ids}
+        elif isinstance(filters, dict):
+            # Raises for invalid filters now rather than in the job
+            filter_images(UserImage.objects.none(), query_params(filters), request.user)
+            payload = {'filter': filters}
+        else:
+            raise ValidationError({'ids': 'Select images with ids or filter.'})
+
+        payload.update(assignments=assignments, reembed=bool(request.data.get('reembed')))
+        job = enqueue('bulk_update_metadata', payload, user=request.user)
+        return Response({'job': _job_data(request, job)}, status=status.HTTP_202_ACCEPTED)
+
+
 class CustomMetadataView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, image_id):
         try:
-            # Get the image
-            image = UserImage.objects.get(id=image_id, user=request.user)
-
             # Get the data from request
             tag_name = request.data.get('tag_name')
             value = request.data.get('value')
@@ -1553,23 +2177,9 @@ class CustomMetadataView(APIView):
                     'error': 'Both tag_name and value are required'
                 }, status=status.HTTP_400_BAD_REQUEST)
 
-            # Get current metadata
-            metadata = image.metadata or {}
-
-            # Ensure custom section exists
-            if 'custom' not in metadata:
-                metadata['custom'] = {}
-
-            # Add new custom field
-            metadata['custom'][tag_name] = {
-                'value': value,
-                'type': 'string',
-                'label': tag_name
-            }
-
-            # Save updated metadata
-            image.metadata = metadata
-            image.save(update_fields=['metadata'])
+            # Add new custom field, in place in the stored metadata
+            if UserImage.update_metadata(image_id, request.user, [('custom', tag_name, value)]) is None:
+                raise UserImage.DoesNotExist
 
             return Response({
                 'tag_name': tag_name,
@@ -1965,8 +2575,22 @@ class ServeProtectedImageDownloadView(APIView):
                     status=status.HTTP_404_NOT_FOUND
                 )
 
-            response = FileResponse(image_access.protected_image.open('rb'), as_attachment=True)
-            
+            # The protected file is regenerated whenever the rule's settings change
+            protected_stat = os.stat(image_access.protected_image.path)
+            etag = '"{}"'.format(hashlib.sha256(
+                f"{image_access.protected_image.name}:{protected_stat.st_mtime_ns}:"
+                f"{protected_stat.st_size}:{image_access.updated_at.isoformat()}".encode()
+            ).hexdigest()[:40])
+            last_modified = int(max(protected_stat.st_mtime, image_access.updated_at.timestamp()))
+
+            # A 304 still counts as a download below, but skips reading the file
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = FileResponse(image_access.protected_image.open('rb'), as_attachment=True)
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            response['Cache-Control'] = PRIVATE_CACHE_CONTROL
+
             try:
                 # Get email from headers first
                 log_email = request.headers.get('X-Access-Email')